@@ -0,0 +1,92 @@
+"""
+Benchmark of the entity extraction engine over a corpus of MARADMIN bodies.
+
+The bundled corpus holds a few bodies in the format found inside <div class="body-text">. Point --corpus at a
+directory of saved bodies (one .html or .txt file per MARADMIN) to benchmark against a larger set.
+
+    python benchmarks/bench_entities.py
+    python benchmarks/bench_entities.py --corpus /path/to/bodies --repeat 50
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'maradmin'))
+
+from entities import REFERENCE_FILE, EntityExtractor, normalize_text, _fold, _is_word  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def load_corpus(path):
+    bodies = []
+    for filename in sorted(glob.glob(os.path.join(path, '*.html')) + glob.glob(os.path.join(path, '*.txt'))):
+        with open(filename, encoding='utf-8') as f:
+            bodies.append(f.read())
+    return bodies
+
+
+def naive_extract(patterns, body):
+    """
+    One str.find scan per known pattern, i.e. what the extraction costs without the compiled index.
+    """
+    text = normalize_text(body)
+    found = set()
+    for pattern, value in patterns:
+        start = text.find(pattern)
+        while start != -1:
+            if _is_word(text, start, start + len(pattern)):
+                found.add(value)
+                break
+            start = text.find(pattern, start + 1)
+    return found
+
+
+def timed(func, bodies, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            func(body)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MARADMIN entity extraction.')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='Directory of MARADMIN bodies.')
+    parser.add_argument('--repeat', type=int, default=200, help='Passes over the corpus.')
+    args = parser.parse_args()
+
+    bodies = load_corpus(args.corpus)
+    if not bodies:
+        sys.exit(f'No .html or .txt files found in {args.corpus}')
+    total_chars = sum(len(body) for body in bodies) * args.repeat
+
+    start = time.perf_counter()
+    extractor = EntityExtractor.from_file()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    with open(REFERENCE_FILE, encoding='utf-8') as f:
+        reference = json.load(f)
+    patterns = []
+    for canonical, aliases in reference['units'].items():
+        patterns.extend((_fold(alias), canonical) for alias in [canonical] + aliases)
+    patterns.extend((code, code) for code in reference['mos'])
+
+    indexed = timed(extractor.extract, bodies, args.repeat)
+    naive = timed(lambda body: naive_extract(patterns, body), bodies, args.repeat)
+
+    print(f'corpus: {len(bodies)} bodies, {total_chars // args.repeat} characters, {len(patterns)} known patterns')
+    print(f'index build: {build_ms:.1f} ms (once per container)')
+    print(f'compiled index: {indexed * 1000 / (len(bodies) * args.repeat):.3f} ms/body, '
+          f'{total_chars / indexed / 1e6:.2f} M chars/s')
+    print(f'per-pattern scan: {naive * 1000 / (len(bodies) * args.repeat):.3f} ms/body, '
+          f'{total_chars / naive / 1e6:.2f} M chars/s')
+    for body in bodies[:3]:
+        print(extractor.extract(body))
+
+
+if __name__ == '__main__':
+    main()
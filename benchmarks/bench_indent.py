@@ -0,0 +1,91 @@
+"""
+Throughput and peak memory of yattag's indent() against the streaming iter_indent() on multi-megabyte documents.
+
+Documents are archive style pages: the bundled MARADMIN bodies repeated inside card markup until the requested
+size is reached. The streaming indenter is fed 64 KiB chunks.
+
+    python benchmarks/bench_indent.py
+    python benchmarks/bench_indent.py --sizes 1 4 16 64
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'maradmin'))
+
+from yattag import Doc, indent, iter_indent  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+CHUNK_SIZE = 65536
+
+
+def archive_page(bodies, size):
+    doc, tag, text, line = Doc().ttl()
+    doc.asis('<!DOCTYPE html>')
+    with tag('html', lang='en'):
+        with tag('body'):
+            with tag('main', klass='container'):
+                count = 0
+                length = 0
+                while length < size:
+                    for body in bodies:
+                        with tag('div', klass='card'):
+                            with tag('div', klass='card-body'):
+                                line('h3', f'MARADMIN {count}/25', klass='card-title')
+                                with tag('p', klass='card-text'):
+                                    doc.asis(body)
+                        count += 1
+                        length += len(body) + 128  # approximate, markup included
+    return doc.getvalue()
+
+
+def chunks(document):
+    for start in range(0, len(document), CHUNK_SIZE):
+        yield document[start:start + CHUNK_SIZE]
+
+
+def run_indent(document):
+    return indent(document)
+
+
+def run_iter_indent(document):
+    # write to nowhere, the way a handler streaming to a file or socket would
+    total = 0
+    for chunk in iter_indent(chunks(document)):
+        total += len(chunk)
+    return total
+
+
+def measure(func, document):
+    start = time.perf_counter()
+    func(document)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(document)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark indent() against iter_indent().")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1, 4, 16], help="Document sizes in MiB.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of MARADMIN bodies.")
+    args = parser.parse_args()
+
+    bodies = []
+    for filename in sorted(glob.glob(os.path.join(args.corpus, '*.html'))):
+        with open(filename, encoding='utf-8') as f:
+            bodies.append(f.read())
+
+    for size in args.sizes:
+        document = archive_page(bodies, size << 20)
+        assert ''.join(iter_indent(chunks(document))) == indent(document)
+        mib = len(document) / (1 << 20)
+        print(f'{mib:.1f} MiB document')
+        for name, func in (('indent', run_indent), ('iter_indent', run_iter_indent)):
+            elapsed, peak = measure(func, document)
+            print(f'  {name:12} {mib / elapsed:6.1f} MiB/s  peak {peak / (1 << 20):7.1f} MiB')
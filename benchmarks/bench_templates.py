@@ -0,0 +1,55 @@
+"""
+Benchmark of the compiled webpage template against building the page with Doc().ttl() on every request.
+
+    python benchmarks/bench_templates.py
+    python benchmarks/bench_templates.py --repeat 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'maradmin'))
+
+from yattag import Doc  # noqa: E402
+
+from maradmin_globals import _webpage, build_webpage  # noqa: E402
+
+PAGE = {
+    'page_title': 'MARADMIN',
+    'card_title': 'Verification Pending',
+    'card_subtitle': 'Check your inbox',
+    'message': 'An email has been sent to marine@usmc.mil & must be verified before MARADMINs are delivered.',
+}
+
+
+def build_uncompiled(page_title, card_title, card_subtitle, message):
+    """
+    The page built through tag() context managers on every call, i.e. build_webpage before compilation.
+    """
+    values = {'page_title': page_title, 'card_title': card_title, 'card_subtitle': card_subtitle,
+              'message': message}
+    doc = Doc()
+    _webpage(doc, lambda name: doc.text(values[name]))
+    return doc.getvalue()
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(**PAGE)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark compiled yattag templates.")
+    parser.add_argument("--repeat", type=int, default=10000, help="Pages rendered per method.")
+    args = parser.parse_args()
+
+    assert build_uncompiled(**PAGE) == build_webpage(**PAGE)
+
+    uncompiled = timed(build_uncompiled, args.repeat)
+    compiled = timed(build_webpage, args.repeat)
+    print(f'{args.repeat} pages')
+    print(f'Doc().ttl():       {uncompiled * 1e6 / args.repeat:8.1f} us/page')
+    print(f'compiled template: {compiled * 1e6 / args.repeat:8.1f} us/page ({uncompiled / compiled:.1f}x)')
@@ -0,0 +1,75 @@
+"""
+Micro-benchmarks of the vendored yattag rendering core: tag, text, stag, line and asis, plus a full page.
+
+    python benchmarks/bench_yattag.py
+    python benchmarks/bench_yattag.py --repeat 200000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'maradmin'))
+
+from yattag import SimpleDoc  # noqa: E402
+
+from register import build_register_page  # noqa: E402
+
+TEXT = 'This site/service is not hosted nor endorsed by the U.S. Government or the U.S. Marine Corps.'
+UNSAFE_TEXT = 'Marines in PMOS 0311 & 0331 <see para 3>'
+
+
+def bench_tag(doc):
+    with doc.tag('div', klass='col-lg-8 col-md-10 col-sm-12'):
+        pass
+
+
+def bench_tag_no_attrs(doc):
+    with doc.tag('main'):
+        pass
+
+
+def bench_text(doc):
+    doc.text(TEXT)
+
+
+def bench_text_escaped(doc):
+    doc.text(UNSAFE_TEXT)
+
+
+def bench_stag(doc):
+    doc.stag('input', ('id', 'email'), ('aria-describedby', 'email_help'), type='email', klass='form-control',
+             name='email', required='True', autocomplete='username')
+
+
+def bench_line(doc):
+    doc.line('h3', 'Verification Pending', klass='card-title')
+
+
+def bench_asis(doc):
+    doc.asis('<!DOCTYPE html>')
+
+
+def run(func, repeat):
+    # a fresh document every 1000 operations keeps the result list from growing without bound
+    state = {'doc': SimpleDoc(), 'count': 0}
+
+    def step():
+        state['count'] += 1
+        if state['count'] % 1000 == 0:
+            state['doc'] = SimpleDoc()
+        func(state['doc'])
+
+    return min(timeit.repeat(step, number=repeat, repeat=3)) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmark the vendored yattag.")
+    parser.add_argument("--repeat", type=int, default=100000, help="Operations timed per benchmark.")
+    args = parser.parse_args()
+
+    for bench in (bench_tag, bench_tag_no_attrs, bench_text, bench_text_escaped, bench_stag, bench_line,
+                  bench_asis):
+        print(f'{bench.__name__[6:]:16} {run(bench, args.repeat) * 1e9:8.0f} ns/op')
+    page = min(timeit.repeat(build_register_page, number=args.repeat // 100, repeat=3)) / (args.repeat // 100)
+    print(f'{"register page":16} {page * 1e9:8.0f} ns/op')
@@ -0,0 +1,66 @@
+"""
+Import-time profile of every Lambda entry point in template.yaml, the cold-start cost paid before lambda_handler
+runs. Each handler module is imported in a fresh interpreter with -X importtime, the report lists its total and
+the direct imports that cost the most.
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --top 10 --max-ms 400
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HANDLER_RGX = re.compile(r'^\s+Handler:\s*(\w+)\.lambda_handler\s*$', re.MULTILINE)
+IMPORTTIME_RGX = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def handler_modules():
+    with open(os.path.join(ROOT, 'template.yaml'), encoding='utf-8') as f:
+        return sorted(set(HANDLER_RGX.findall(f.read())))
+
+
+def profile(module):
+    """
+    Returns:
+        Total import time of the module in ms and its direct imports as (cumulative ms, name), slowest first
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, 'maradmin'))
+    # handlers that build clients at import need a region, Lambda always provides one
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], env=env,
+                            capture_output=True, text=True, check=True)
+    total = 0.0
+    children = []
+    for line in result.stderr.splitlines():
+        mobj = IMPORTTIME_RGX.match(line)
+        if not mobj:
+            continue
+        cumulative_ms = int(mobj.group(2)) / 1000
+        depth = len(mobj.group(3)) // 2
+        if depth == 0 and mobj.group(4) == module:
+            total = cumulative_ms
+        elif depth == 1:
+            # children are printed before their parent, every depth 1 entry belongs to a top-level import
+            children.append((cumulative_ms, mobj.group(4)))
+    return total, sorted(children, reverse=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile the import time of every Lambda handler.")
+    parser.add_argument("--top", type=int, default=5, help="Direct imports listed per handler.")
+    parser.add_argument("--max-ms", type=float, help="Exit with an error when a handler takes longer to import.")
+    args = parser.parse_args()
+
+    slow = []
+    for module in handler_modules():
+        total, children = profile(module)
+        print(f'{module:22} {total:8.1f} ms')
+        for cumulative_ms, name in children[:args.top]:
+            print(f'    {name:30} {cumulative_ms:8.1f} ms')
+        if args.max_ms is not None and total > args.max_ms:
+            slow.append(module)
+    if slow:
+        sys.exit(f'Import time over {args.max_ms} ms: {", ".join(slow)}')
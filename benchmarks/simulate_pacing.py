@@ -0,0 +1,120 @@
+"""
+Simulates a broadcast's delivery to show what domain interleaving and per-domain pacing (maradmin/pacing.py) do to
+its makespan, the time from the first send until the last message is accepted by its receiving MTA.
+
+SES hands messages over in queue order, once their SQS delay has passed, at no more than --ses-rate per second.
+Each receiving domain accepts messages at --accept-rate per second with a burst of --burst. A message arriving
+while a domain is saturated is deferred, and SES retries it after --retry seconds, doubling on every further
+deferral. The acceptance model is an assumption, tune it to what the bounce and delivery statistics show.
+
+The domain distribution is read from the verified subscribers (--table, needs AWS credentials), given as
+--domains usmc.mil=6000,gmail.com=2500, or defaults to an example shaped like the subscriber base.
+
+    python benchmarks/simulate_pacing.py
+    python benchmarks/simulate_pacing.py --table <SubscriberTable name> --concurrency 4 8 12
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'maradmin'))
+
+from maradmin_globals import email_domain  # noqa: E402
+import pacing  # noqa: E402
+
+EXAMPLE_DOMAINS = {'usmc.mil': 6000, 'gmail.com': 2500, 'yahoo.com': 500, 'outlook.com': 400, 'hotmail.com': 300,
+                   'icloud.com': 200, **{f'domain{n}.com': 5 for n in range(100)}}
+
+
+def synthetic_emails(domains, seed=0):
+    # sorted like resolve_recipients returns them, domains mixed by the local parts
+    rng = random.Random(seed)
+    return sorted(f'{rng.getrandbits(48):012x}@{domain}' for domain, count in domains.items() for _ in range(count))
+
+
+def parse_domains(value):
+    return {domain: int(count) for domain, count in (entry.split('=') for entry in value.split(','))}
+
+
+def simulate(scheduled, ses_rate, accept_rate, burst, retry_seconds):
+    """
+    Args:
+        scheduled: list of (email, delay seconds) in queueing order, as pacing.schedule returns
+
+    Returns:
+        Tuple of the times each message was accepted (seconds from the first send) and the number of deferrals
+    """
+    # SQS releases delayed messages when their delay passes, queue order is kept among those released together
+    released = sorted(range(len(scheduled)), key=lambda index: scheduled[index][1])
+    pending = []
+    sent = 0.0
+    for position, index in enumerate(released):
+        email, delay = scheduled[index]
+        sent = max(sent + 1 / ses_rate, delay) if position else delay
+        heapq.heappush(pending, (sent, index, email_domain(email), 0))
+
+    buckets = {}
+    accepted = []
+    deferrals = 0
+    while pending:
+        at, index, domain, attempt = heapq.heappop(pending)
+        tokens, last = buckets.get(domain, (burst, at))
+        tokens = min(burst, tokens + (at - last) * accept_rate)
+        if tokens >= 1:
+            buckets[domain] = (tokens - 1, at)
+            accepted.append(at)
+        else:
+            buckets[domain] = (tokens, at)
+            deferrals += 1
+            heapq.heappush(pending, (at + retry_seconds * 2 ** attempt, index, domain, attempt + 1))
+    return sorted(accepted), deferrals
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a broadcast with and without domain pacing.')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--table', help='SubscriberTable name, simulate the verified subscribers.')
+    source.add_argument('--domains', type=parse_domains, help='domain=count,... to simulate.')
+    parser.add_argument('--ses-rate', type=float, default=14, help='SES maximum send rate per second.')
+    parser.add_argument('--accept-rate', type=float, default=5, help='Messages per second a domain accepts.')
+    parser.add_argument('--burst', type=float, default=20, help='Messages a domain accepts at once.')
+    parser.add_argument('--retry', type=float, default=300, help='Seconds before SES retries a deferral.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[2, 4, 8],
+                        help='DOMAIN_CONCURRENCY values to simulate.')
+    parser.add_argument('--wave-seconds', type=int, default=1, help='DOMAIN_WAVE_SECONDS.')
+    args = parser.parse_args()
+
+    if args.table:
+        from maradmin_globals import query_verified_emails
+        emails = sorted(query_verified_emails(args.table))
+    else:
+        emails = synthetic_emails(args.domains or EXAMPLE_DOMAINS)
+    counts = {}
+    for email in emails:
+        counts[email_domain(email)] = counts.get(email_domain(email), 0) + 1
+    top = sorted(counts.items(), key=lambda item: -item[1])[:5]
+    print(f'{len(emails)} recipients on {len(counts)} domains, largest: '
+          + ', '.join(f'{domain} {count / len(emails):.0%}' for domain, count in top))
+    print(f'SES {args.ses_rate:g}/s, domains accept {args.accept_rate:g}/s (burst {args.burst:g}), '
+          f'deferrals retried after {args.retry:g}s')
+
+    strategies = [('as resolved', [(email, 0) for email in emails]),
+                  ('interleaved', pacing.schedule(emails))]
+    strategies += [(f'paced {concurrency}/{args.wave_seconds}s',
+                    pacing.schedule(emails, concurrency, args.wave_seconds, args.ses_rate))
+                   for concurrency in args.concurrency]
+    print(f'{"strategy":<16} {"makespan":>9} {"p50":>8} {"p95":>8} {"deferred":>9}')
+    for name, scheduled in strategies:
+        accepted, deferrals = simulate(scheduled, args.ses_rate, args.accept_rate, args.burst, args.retry)
+        print(f'{name:<16} {accepted[-1]:>8.0f}s {percentile(accepted, 0.5):>7.0f}s '
+              f'{percentile(accepted, 0.95):>7.0f}s {deferrals:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# boto3 clients, resources and DynamoDB Table handles shared by every invocation a container serves. Building a
+# client costs tens of milliseconds and each one owns its connection pool, so handlers ask this module for them
+# instead of calling boto3 directly. Everything is created on first use with CONFIG and kept for the container's life.
+import functools
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+import log
+
+CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=15,
+    # query_verified_emails runs one thread per shard against a single client
+    max_pool_connections=16,
+    # standard mode backs off on throttling as well as on transient errors
+    retries={'mode': 'standard', 'max_attempts': 5},
+    tcp_keepalive=True,
+)
+# synchronous invocations of a slow function (browser_fetch) wait for it and are not repeated
+SYNCHRONOUS_INVOKE_CONFIG = CONFIG.merge(Config(read_timeout=180, retries={'mode': 'standard', 'max_attempts': 1}))
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+_tables = {}
+
+# construction during the current invocation, reset by reports_construction_time
+_built = 0
+_build_seconds = 0.0
+
+
+def _cached(cache, key, build):
+    global _built, _build_seconds
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+    with _lock:
+        if key not in cache:
+            start = time.perf_counter()
+            cache[key] = build()
+            _build_seconds += time.perf_counter() - start
+            _built += 1
+    return cache[key]
+
+
+def client(service_name, config=CONFIG):
+    return _cached(_clients, (service_name, id(config)), lambda: boto3.client(service_name, config=config))
+
+
+def resource(service_name):
+    # resources are not thread safe, threads should share a client instead
+    return _cached(_resources, service_name, lambda: boto3.resource(service_name, config=CONFIG))
+
+
+def table(table_name):
+    # the resource is resolved before _cached takes the lock, the lock is not reentrant
+    dynamodb = resource('dynamodb')
+    return _cached(_tables, table_name, lambda: dynamodb.Table(table_name))
+
+
+def reset():
+    """
+    Forgets every cached handle, for tests that patch boto3.
+    """
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+        _tables.clear()
+
+
+def reports_construction_time(handler):
+    """
+    Decorates a lambda_handler to log the time spent building AWS handles during the invocation, zero once the
+    container is warm.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _built, _build_seconds
+        _built = 0
+        _build_seconds = 0.0
+        try:
+            return handler(event, context)
+        finally:
+            log.debug('AWS client construction', built=_built, build_ms=round(_build_seconds * 1000, 1),
+                      cached=len(_clients) + len(_resources) + len(_tables))
+    return wrapper
@@ -0,0 +1,136 @@
+import os
+import time
+
+import log
+import profiling
+
+BODY_START = '<div class="body-text">'
+
+
+def extract_body(page):
+    """
+    The MARADMIN itself, the body-text fragment of its page with '(slash)' replaced by '/'.
+    """
+    page = page.replace('(slash)', '/')
+    start = page.find(BODY_START)
+    end = page.find('</div>', start)
+    return page[start + len(BODY_START):end]
+
+
+def fetch_with_browser(link):
+    """
+    Fetch a page with Selenium and headless Chrome, for pages the site's CDN refuses to serve to requests.
+
+    Returns:
+        Page source
+
+    Raises:
+        TimeoutException: If the browser times out
+        WebDriverException: For browser-related errors
+    """
+    log.debug('Fetching with Selenium', link=link)
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
+    driver = None
+    try:
+        # Set up Chrome options for headless browsing
+        chrome_options = Options()
+        chrome_options.add_argument('--headless=new')
+        chrome_options.add_argument('--no-sandbox')
+        chrome_options.add_argument('--disable-dev-shm-usage')
+        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+
+        # In Lambda, use the Chrome binary from the layer
+        if os.environ.get('AWS_EXECUTION_ENV'):
+            # Chrome for Testing layer paths for x86_64
+            # LD_LIBRARY_PATH is set in template.yaml to include /opt/lib for NSS/X11 libraries
+            chrome_options.binary_location = '/opt/chrome/chrome'
+            chrome_options.add_argument('--single-process')
+            chrome_options.add_argument('--disable-gpu')
+            chrome_options.add_argument('--window-size=1920,1080')
+            chrome_options.add_argument('--disable-software-rasterizer')
+            chrome_options.add_argument('--disable-setuid-sandbox')
+            chrome_options.add_argument('--disable-dev-tools')
+            chrome_options.add_argument('--no-zygote')
+            chrome_options.add_argument('--disable-extensions')
+
+            # Debug: Check if files exist in layer
+            log.debug('Layer contents', **{path: os.listdir(path) if os.path.exists(path) else 'NOT FOUND'
+                                           for path in ('/opt', '/opt/chrome', '/opt/chromedriver')})
+
+            # Check chromedriver dependencies
+            import subprocess
+            try:
+                result = subprocess.run(['ldd', '/opt/chromedriver/chromedriver'],
+                                    capture_output=True, text=True, timeout=5)
+                log.debug('chromedriver dependencies', ldd=result.stdout)
+            except Exception as e:
+                log.debug('Could not check chromedriver dependencies', **log.exception_fields(e))
+
+            # Use chromedriver from the layer
+            service = Service(executable_path='/opt/chromedriver/chromedriver')
+            driver = webdriver.Chrome(service=service, options=chrome_options)
+        else:
+            # Running locally, let Selenium find chromedriver automatically
+            # Make sure chromedriver is installed and in PATH
+            driver = webdriver.Chrome(options=chrome_options)
+
+        # Mask automation detection
+        driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+            "userAgent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
+        })
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+
+        # Navigate to page
+        driver.get(link)
+
+        # Wait for page to load (Akamai JS challenges need time)
+        time.sleep(5)
+
+        # Get page source
+        page_source = driver.page_source
+
+        log.debug('Fetched with Selenium', characters=len(page_source))
+        return page_source
+
+    except TimeoutException as e:
+        log.error('Browser timeout', link=link)
+        raise
+
+    except WebDriverException as e:
+        log.error('WebDriver error', link=link, **log.exception_fields(e))
+        raise
+
+    except Exception as e:
+        log.error('Unexpected error fetching URL', link=link, **log.exception_fields(e))
+        raise
+
+    finally:
+        # Always close the browser
+        if driver:
+            try:
+                driver.quit()
+            except:
+                pass
+
+
+@log.correlated
+@profiling.profiled
+def lambda_handler(event, context):
+    """
+    Invoked synchronously by the scraper when requests was blocked, this function carries the Chrome layer and
+    its memory so the scraper does not have to.
+
+    Returns:
+        statusCode 200 with the body-text fragment as body, or statusCode 403 when the browser was refused too
+    """
+    page_source = fetch_with_browser(event['link'])
+    if 'Access Denied' in page_source:
+        log.error('Access Denied page received from Selenium', link=event['link'])
+        return {'statusCode': 403}
+    return {'statusCode': 200, 'body': extract_body(page_source)}
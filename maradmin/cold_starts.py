@@ -0,0 +1,77 @@
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+# every invocation ends with a REPORT line, only cold starts carry an Init Duration
+QUERY = 'filter @type = "REPORT" ' \
+        '| stats count(*) as invocations, count(@initDuration) as cold_starts, ' \
+        'avg(@initDuration) as avg_init, max(@initDuration) as max_init'
+
+
+def run_query(logs, log_group, start, end, query):
+    """
+    Runs a Logs Insights query over one log group and waits for it.
+
+    Returns:
+        The result rows, each a list of {'field', 'value'}
+    """
+    query_id = logs.start_query(logGroupName=log_group, startTime=int(start.timestamp()),
+                                endTime=int(end.timestamp()), queryString=query)['queryId']
+    while True:
+        response = logs.get_query_results(queryId=query_id)
+        if response['status'] not in ('Scheduled', 'Running'):
+            break
+        time.sleep(1)
+    if response['status'] != 'Complete':
+        raise RuntimeError(f'Query on {log_group} ended {response["status"]}')
+    return response['results']
+
+
+def cold_start_stats(logs, log_group, start, end):
+    """
+    Runs the REPORT line query over one log group.
+
+    Returns:
+        Dict of invocations, cold_starts, avg_init and max_init, init durations in milliseconds
+    """
+    stats = {'invocations': 0, 'cold_starts': 0, 'avg_init': 0.0, 'max_init': 0.0}
+    for row in run_query(logs, log_group, start, end, QUERY):
+        for field in row:
+            if field['field'] in stats and field['value']:
+                stats[field['field']] = type(stats[field['field']])(float(field['value']))
+    return stats
+
+
+def report(log_groups, start, end):
+    """
+    Prints cold starts per log group and for the groups combined, e.g. the four web functions before the router
+    against the router's WebFunction after it.
+    """
+    logs = boto3.client('logs')
+    total_invocations = 0
+    total_cold_starts = 0
+    print(f'{start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} UTC')
+    for log_group in log_groups:
+        stats = cold_start_stats(logs, log_group, start, end)
+        total_invocations += stats['invocations']
+        total_cold_starts += stats['cold_starts']
+        rate = stats['cold_starts'] / stats['invocations'] if stats['invocations'] else 0
+        print(f'  {log_group}: {stats["cold_starts"]}/{stats["invocations"]} cold ({rate:.0%}), '
+              f'init avg {stats["avg_init"]:.0f} ms max {stats["max_init"]:.0f} ms')
+    rate = total_cold_starts / total_invocations if total_invocations else 0
+    print(f'  total: {total_cold_starts}/{total_invocations} cold ({rate:.0%})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report Lambda cold starts from CloudWatch REPORT lines.")
+    parser.add_argument("log_groups", nargs='+', help="Log groups, e.g. /aws/lambda/maradmin-WebFunction-XXXX")
+    parser.add_argument("--days", type=int, default=14, help="Days to report on, ending at --end.")
+    parser.add_argument("--end", help="End of the window, YYYY-MM-DD (default now), e.g. the router deploy date "
+                                      "when reporting on the four functions it replaced.")
+    args = parser.parse_args()
+
+    end = datetime.strptime(args.end, '%Y-%m-%d').replace(tzinfo=timezone.utc) if args.end \
+        else datetime.now(timezone.utc)
+    report(args.log_groups, end - timedelta(days=args.days), end)
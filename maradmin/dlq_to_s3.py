@@ -1,15 +1,95 @@
-import boto3
-import os
+import gzip
 import json
+import os
+import re
 import uuid
+from datetime import datetime, timezone
 
+import aws_clients
+import log
+import profiling
 
-def lambda_handler(event, context):
-    s3 = boto3.client('s3')
-    response = s3.put_object(
-        Bucket=os.environ['DlqBucket'],
-        Body=json.dumps(event),
-        Key=f'DLQ {uuid.uuid4()}.json'
+# Dead letters are archived one gzip JSON Lines object per (date, subject) in each batch, under
+# dlq/date=YYYY-MM-DD/subject=<slug>/, with a manifest of the message ids next to it. Each line is the SQS record
+# as the dead letter queue delivered it, so redrive.py can queue it again unchanged.
+PREFIX = 'dlq'
+NO_SUBJECT = 'none'
+
+
+def subject_of(record):
+    # transactional emails carry no subject attribute
+    attribute = (record.get('messageAttributes') or {}).get('subject')
+    return attribute['stringValue'] if attribute else NO_SUBJECT
+
+
+def sent_date(record):
+    sent_ms = int(record['attributes']['SentTimestamp'])
+    return datetime.fromtimestamp(sent_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def subject_slug(subject):
+    return re.sub(r'[^A-Za-z0-9._-]+', '-', subject).strip('-')[:100] or NO_SUBJECT
+
+
+def partitions(records):
+    """
+    Records grouped by (sent date, subject), in the order they arrived.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault((sent_date(record), subject_of(record)), []).append(record)
+    return groups
+
+
+def archive(s3, bucket, date, subject, records):
+    """
+    Writes the records as one object and then its manifest.
+
+    Returns:
+        Key of the object
+    """
+    base = f'{PREFIX}/date={date}/subject={subject_slug(subject)}/' \
+           f'{datetime.now(timezone.utc):%H%M%S}-{uuid.uuid4().hex[:12]}'
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+    s3.put_object(
+        Bucket=bucket,
+        Key=f'{base}.jsonl.gz',
+        Body=gzip.compress(lines.encode('utf-8')),
+        ContentType='application/x-ndjson',
+        ContentEncoding='gzip'
     )
-    print(response)
-    return {"statusCode": 200}
+    s3.put_object(
+        Bucket=bucket,
+        Key=f'{base}.manifest.json',
+        Body=json.dumps({
+            'object': f'{base}.jsonl.gz',
+            'date': date,
+            'subject': subject,
+            'count': len(records),
+            'message_ids': [record['messageId'] for record in records],
+        }),
+        ContentType='application/json'
+    )
+    return f'{base}.jsonl.gz'
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    """
+    Archives a batch from the dead letter queue. A partition that could not be written is reported back, SQS
+    delivers its messages again and the rest of the batch is not archived twice.
+    """
+    s3 = aws_clients.client('s3')
+    failures = []
+    for (date, subject), records in partitions(event['Records']).items():
+        try:
+            key = archive(s3, os.environ['DlqBucket'], date, subject, records)
+        except Exception as err:
+            log.error('Failed to archive dead letters', date=date, subject=subject, count=len(records),
+                      **log.exception_fields(err))
+            failures.extend({'itemIdentifier': record['messageId']} for record in records)
+        else:
+            log.info('Archived dead letters', key=key, count=len(records))
+    return {'batchItemFailures': failures}
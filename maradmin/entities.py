@@ -0,0 +1,191 @@
+import html
+import json
+import os
+import re
+from collections import deque
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'military_reference.json')
+
+ENTITY_TYPES = ('mcc', 'mos', 'uic', 'units')
+
+# keywords that introduce one or more codes, e.g. "MCC 013", "PMOS: 0311/0331", "UIC M12345"
+_TRIGGERS = {
+    'MCC': 'mcc',
+    'MOS': 'mos',
+    'PMOS': 'mos',
+    'BMOS': 'mos',
+    'AMOS': 'mos',
+    'FMOS': 'mos',
+    'UIC': 'uic',
+    'RUC': 'uic',
+}
+
+# MCCs are three characters and always contain a digit (keeps "MCC AND ..." from matching),
+# four digits is an MOS, UIC/RUCs are five digits with an optional leading letter.
+_CODE_RGX = {
+    'mcc': r'(?=[A-Z]*\d)[A-Z0-9]{3}',
+    'mos': r'\d{4}',
+    'uic': r'[A-Z]?\d{5}',
+}
+
+_CODE_LIST_RGX = {
+    kind: re.compile(
+        r'\s*(?:\(S\))?\s*[:#-]?\s*'
+        r'(?P<codes>{code}(?:\s*(?:,|/|&|AND|OR)\s*{code})*)(?![A-Z0-9])'.format(code=code)
+    )
+    for kind, code in _CODE_RGX.items()
+}
+_CODE_SPLIT_RGX = re.compile(r'\s*(?:,|/|&|AND|OR)\s*')
+_TAG_RGX = re.compile(r'<[^>]*>')
+_WHITESPACE_RGX = re.compile(r'\s+')
+
+
+class AhoCorasick(object):
+    """
+    Multi-pattern matcher. All patterns are found in a single pass over the text, so the cost of a scan
+    depends on the length of the text rather than on the number of unit names and codes being searched for.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, pattern, value):
+        if self._built:
+            raise ValueError('Cannot add patterns after the automaton has been built')
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def iter(self, text):
+        """
+        Yields (start, end, value) for every occurrence of every pattern, end being exclusive.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                end = index + 1
+                for length, value in out[state]:
+                    yield end - length, end, value
+
+
+class EntityExtractor(object):
+    """
+    Deterministic replacement for asking the LLM to list units, MCCs, UICs and MOSs.
+    Known unit names (and their abbreviations) and MOS codes come from the reference file, while the
+    codes following MCC/MOS/UIC keywords are captured with precompiled patterns anchored at the keyword.
+    """
+
+    def __init__(self, reference):
+        self.mos_titles = dict(reference.get('mos', {}))
+        self._automaton = AhoCorasick()
+        for canonical, aliases in reference.get('units', {}).items():
+            for alias in set([canonical] + list(aliases)):
+                self._automaton.add(_fold(alias), ('units', canonical))
+        for code in self.mos_titles:
+            self._automaton.add(code, ('mos', code))
+        for keyword, kind in _TRIGGERS.items():
+            self._automaton.add(keyword, ('trigger', kind))
+        self._automaton.build()
+
+    @classmethod
+    def from_file(cls, path=REFERENCE_FILE):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def extract(self, body):
+        """
+        Find the military identifiers referenced in a MARADMIN.
+
+        Args:
+            body: MARADMIN text, either plain or the HTML body-text fragment
+
+        Returns:
+            Dict with a sorted, de-duplicated list for each of ENTITY_TYPES
+        """
+        text = normalize_text(body)
+        found = dict((kind, set()) for kind in ENTITY_TYPES)
+        for start, end, (kind, value) in self._automaton.iter(text):
+            if not _is_word(text, start, end):
+                continue
+            if kind == 'trigger':
+                mobj = _CODE_LIST_RGX[value].match(text, end)
+                if mobj:
+                    found[value].update(_CODE_SPLIT_RGX.split(mobj.group('codes')))
+            else:
+                found[kind].add(value)
+        return dict((kind, sorted(values)) for kind, values in found.items())
+
+
+def normalize_text(body):
+    """
+    Strip markup and collapse whitespace so names split across lines or tags still match.
+    """
+    text = _WHITESPACE_RGX.sub(' ', html.unescape(_TAG_RGX.sub(' ', body)))
+    return _fold(text)
+
+
+def format_entities(entities):
+    """
+    Renders the single summary line previously requested from the LLM, or an empty string if nothing was found.
+    """
+    labels = (('units', 'Units'), ('mcc', 'MCC'), ('uic', 'UIC'), ('mos', 'MOS'))
+    parts = [f'{label}: {", ".join(entities[kind])}' for kind, label in labels if entities.get(kind)]
+    if not parts:
+        return ''
+    return '<p>' + html.escape('; '.join(parts), quote=False) + '</p>'
+
+
+def _fold(text):
+    folded = text.upper()
+    if len(folded) != len(text):
+        # a handful of characters (e.g. the German sharp s) change length when upper cased, which would
+        # shift the offsets reported by the automaton
+        folded = ''.join(c.upper() if len(c.upper()) == 1 else c for c in text)
+    return folded
+
+
+def _is_word(text, start, end):
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+_extractor = None
+
+
+def extract_entities(body):
+    """
+    Module level convenience wrapper, the reference file is loaded and compiled once per container.
+    """
+    global _extractor
+    if _extractor is None:
+        _extractor = EntityExtractor.from_file()
+    return _extractor.extract(body)
@@ -1,19 +1,27 @@
-import json
-import boto3
 import os
 
-from maradmin_globals import get_token
+from maradmin_globals import verified_shard, queue_transactional_email
+import aws_clients
+import log
+import profiling
+import routing
 
 
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
 def lambda_handler(event, context):
     action = 'DEFAULT'
     if event['subject'].upper() == 'UNSUBSCRIBE':
-        db = boto3.resource('dynamodb')
-        subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
+        subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
         email = event['envelope']['mailFrom']['address']
-        db_response = subscriber_table.delete_item(Key={'email': email})
+        db_response = subscriber_table.delete_item(Key={'email': email}, ReturnValues='ALL_OLD')
         action = 'DROP'
-        print(f'EMAIL-UNSUBSCRIBE: {email} - {db_response}')
+        log.info('Email unsubscribe', email=email, existed='Attributes' in db_response)
+
+        routing_table = routing.routing_table()
+        if routing_table and db_response.get('Attributes', {}).get('verified') == 'True':
+            routing.unindex_subscriber(routing_table, email, db_response['Attributes'].get('filters', [routing.ALL]))
 
         # send email
         html_msg = '<samp><p>Greetings,</p>' \
@@ -24,34 +32,25 @@ def lambda_handler(event, context):
                         'receive MARADMIN Notifications. I hope it provided some value. Feel free to re-subscribe anytime.'
 
 
-        ses = boto3.client('ses')
-        ses_response = ses.send_templated_email(
-            Source='"MARADMIN" <maradmin@christopherbreen.com>',
-            ReplyToAddresses=['maradmin@christopherbreen.com'],
-            Destination={'ToAddresses': [email], 'BccAddresses': ['me@christopherbreen.com']},
-            Template='NewSubscriberTemplate',
-            TemplateData=json.dumps({
-                'title': 'You have been unsubscribed from MARADMIN Notifications',
-                'html_msg': html_msg,
-                'text_msg': text_msg
-            }),
-            ConfigurationSetName='maradmin',
-        )
-        # Log to CloudWatch
-        print(ses_response)
+        queue_transactional_email(email, 'You have been unsubscribed from MARADMIN Notifications', html_msg, text_msg)
 
     elif event['subject'].upper() == 'SUBSCRIBE':
-        db = boto3.resource('dynamodb')
-        subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
+        subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
         email = event['envelope']['mailFrom']['address']
-        user_data = {
-            'email': email,
-            'verified': 'True',
-            'email_token': get_token()
-        }
-        db_response = subscriber_table.put_item(Item=user_data)
+        # update rather than put so topic filters chosen on the registration page survive the reply, a reply also
+        # shows the mailbox receives mail again after ses_feedback marked it undeliverable
+        db_response = subscriber_table.update_item(
+            Key={'email': email},
+            UpdateExpression='SET verified = :verified, verified_shard = :shard REMOVE undeliverable, undeliverable_at',
+            ExpressionAttributeValues={':verified': 'True', ':shard': verified_shard(email)},
+            ReturnValues='ALL_NEW'
+        )
         action = 'DROP'
-        print(f'EMAIL-SUBSCRIBE: {email} - {db_response}')
+        log.info('Email subscribe', email=email)
+
+        routing_table = routing.routing_table()
+        if routing_table:
+            routing.index_subscriber(routing_table, email, db_response['Attributes'].get('filters', [routing.ALL]))
 
         # send confirmation email
         html_msg = '<samp><p>Greetings,</p>' \
@@ -70,20 +69,6 @@ def lambda_handler(event, context):
                    'Visit www.christopherbreen.com to explore more solutions\n' \
                    'Sent autonomously on behalf of, Christopher Breen'
 
-        ses = boto3.client('ses')
-        ses_response = ses.send_templated_email(
-            Source='"MARADMIN" <maradmin@christopherbreen.com>',
-            ReplyToAddresses=['maradmin@christopherbreen.com'],
-            Destination={'ToAddresses': [email], 'BccAddresses': ['me@christopherbreen.com']},
-            Template='NewSubscriberTemplate',
-            TemplateData=json.dumps({
-                'title': 'You are now subscribed to MARADMIN Notifications',
-                'html_msg': html_msg,
-                'text_msg': text_msg
-            }),
-            ConfigurationSetName='maradmin',
-        )
-        # Log to CloudWatch
-        print(ses_response)
+        queue_transactional_email(email, 'You are now subscribed to MARADMIN Notifications', html_msg, text_msg)
 
     return {'actions': [{'action': {'type': action}, 'allRecipients': True}]}
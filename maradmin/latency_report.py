@@ -0,0 +1,61 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+from cold_starts import run_query
+from tracing import STAGES, slowest_stage
+
+# the records sqs_to_ses puts for traced broadcasts, one per recipient
+QUERY = 'filter ispresent(TimeToInbox) ' \
+        '| stats count(*) as recipients, min(@timestamp) as first_sent, ' \
+        'pct(TimeToInbox, 50) as p50, pct(TimeToInbox, 95) as p95, pct(TimeToInbox, 99) as p99, ' + \
+        ', '.join(f'pct({stage}, 95) as {stage}' for stage in STAGES) + \
+        ' by maradmin_id, subject | sort first_sent desc'
+
+
+def broadcast_latencies(logs, log_group, start, end):
+    """
+    Time to inbox of each broadcast sent between start and end, newest first.
+
+    Returns:
+        List of dicts of maradmin_id, subject, recipients, p50, p95 and p99 of TimeToInbox and the p95 of each
+        stage, in milliseconds
+    """
+    broadcasts = []
+    for row in run_query(logs, log_group, start, end, QUERY):
+        broadcast = {field['field']: field['value'] for field in row}
+        for name in ('recipients', 'p50', 'p95', 'p99') + STAGES:
+            broadcast[name] = float(broadcast[name]) if broadcast.get(name) else None
+        broadcasts.append(broadcast)
+    return broadcasts
+
+
+def format_duration(ms):
+    if ms is None:
+        return '-'
+    if ms < 60000:
+        return f'{ms / 1000:.1f}s'
+    return f'{ms / 60000:.1f}m'
+
+
+def report(log_group, start, end):
+    print(f'{start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} UTC')
+    for broadcast in broadcast_latencies(boto3.client('logs'), log_group, start, end):
+        stages = {stage: broadcast[stage] for stage in STAGES if broadcast[stage] is not None}
+        slowest = slowest_stage(stages)
+        print(f'{broadcast["subject"]} ({broadcast["maradmin_id"]})')
+        print(f'    {broadcast["recipients"]:.0f} recipients, time to inbox p50 {format_duration(broadcast["p50"])} '
+              f'p95 {format_duration(broadcast["p95"])} p99 {format_duration(broadcast["p99"])}')
+        print('    p95 by stage: ' + ', '.join(f'{stage} {format_duration(ms)}' for stage, ms in stages.items()) +
+              (f', slowest {slowest}' if slowest else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report publication to inbox latency of recent broadcasts.")
+    parser.add_argument("log_group", help="SqsToSesFunction log group, e.g. /aws/lambda/maradmin-SqsToSesFunction-XXXX")
+    parser.add_argument("--days", type=int, default=7, help="Days to report on, ending now.")
+    args = parser.parse_args()
+
+    end = datetime.now(timezone.utc)
+    report(args.log_group, end - timedelta(days=args.days), end)
@@ -0,0 +1,104 @@
+# Structured logging shared by every Lambda handler. Each line is one JSON object with a level, a message that
+# does not vary between occurrences, the invocation's correlation id and any extra fields, so monitor_logs and Logs
+# Insights can filter on $.level or $.correlation_id instead of matching free text. Lines below LOG_LEVEL are
+# dropped before they are formatted, and the per-recipient lines of a broadcast are sampled at LOG_SAMPLE_RATE.
+import functools
+import json
+import os
+import random
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+_LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+LEVEL = {name: level for level, name in _LEVEL_NAMES.items()}.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), INFO)
+# fraction of the sampled lines that are written, every one of them at DEBUG
+SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+
+_correlation_id = None
+
+
+def _write(level, message, fields):
+    record = {'level': _LEVEL_NAMES[level], 'message': message}
+    if _correlation_id:
+        record['correlation_id'] = _correlation_id
+    record.update(fields)
+    # boto3 responses carry datetimes
+    print(json.dumps(record, default=str))
+
+
+def debug(message, **fields):
+    if LEVEL <= DEBUG:
+        _write(DEBUG, message, fields)
+
+
+def info(message, **fields):
+    if LEVEL <= INFO:
+        _write(INFO, message, fields)
+
+
+def warning(message, **fields):
+    if LEVEL <= WARNING:
+        _write(WARNING, message, fields)
+
+
+def error(message, **fields):
+    if LEVEL <= ERROR:
+        _write(ERROR, message, fields)
+
+
+def sampled(message, **fields):
+    """
+    An INFO line logged once per recipient or per item, written for a SAMPLE_RATE fraction of the calls. The line
+    carries the rate so counts taken from the logs can be scaled back up.
+    """
+    if LEVEL <= DEBUG:
+        _write(DEBUG, message, fields)
+    elif LEVEL <= INFO and random.random() < SAMPLE_RATE:
+        _write(INFO, message, dict(fields, sample_rate=SAMPLE_RATE))
+
+
+def exception_fields(err):
+    return {'error_type': type(err).__name__, 'error': str(err)}
+
+
+def correlation_id():
+    return _correlation_id
+
+
+def event_correlation_id(event, context):
+    """
+    The id shared by every invocation working on the same request: the SNS message id of a broadcast, the
+    correlation_id attribute sns_to_sqs puts on each recipient's SQS message, a correlation_id passed in a direct
+    invocation, otherwise the Lambda request id.
+    """
+    if isinstance(event, dict):
+        records = event.get('Records') or [{}]
+        record = records[0]
+        if 'Sns' in record:
+            return record['Sns'].get('MessageId')
+        attribute = (record.get('messageAttributes') or {}).get('correlation_id')
+        if attribute and len(records) == 1:
+            return attribute['stringValue']
+        if event.get('correlation_id'):
+            return event['correlation_id']
+    return getattr(context, 'aws_request_id', None)
+
+
+def correlated(handler):
+    """
+    Decorates a lambda_handler so every line it logs carries the event's correlation id.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _correlation_id
+        # restored afterwards, a handler may be called in process by another (the router, a local browser_fetch)
+        previous = _correlation_id
+        _correlation_id = event_correlation_id(event, context)
+        try:
+            return handler(event, context)
+        finally:
+            _correlation_id = previous
+    return wrapper
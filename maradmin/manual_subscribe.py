@@ -1,20 +1,25 @@
 import json
-import boto3
 import argparse
-from maradmin_globals import get_token
+from maradmin_globals import verified_shard
+import aws_clients
+import routing
 
 
 def main(email):
-    db = boto3.resource('dynamodb')
-    subscriber_table = db.Table('maradmin-SubscriberTable-1P9FR9NSFPOOP')
+    subscriber_table = aws_clients.table('maradmin-SubscriberTable-1P9FR9NSFPOOP')
     user_data = {
         'email': email,
         'verified': 'True',
-        'email_token': get_token()
+        'verified_shard': verified_shard(email)
     }
     db_response = subscriber_table.put_item(Item=user_data)
     print(f'DB Response: {db_response}')
 
+    # set ROUTING_TABLE_NAME when topic filters are enabled so the subscriber receives every MARADMIN
+    routing_table = routing.routing_table()
+    if routing_table:
+        routing.index_subscriber(routing_table, email, [routing.ALL])
+
     html_msg = '<samp><p>Greetings,</p>' \
                '<p>Thank you for subscribing to the MARADMIN Notifications service.</p>' \
                f'<p>You will now begin to receive emails of MARADMINS soon after they are posted. ' \
@@ -32,7 +37,7 @@ def main(email):
                 'Sent autonomously on behalf of, Christopher Breen'
 
     # send confirmation email
-    ses = boto3.client('ses')
+    ses = aws_clients.client('ses')
     ses_response = ses.send_templated_email(
         Source='"MARADMIN" <maradmin@christopherbreen.com>',
         ReplyToAddresses=['maradmin@christopherbreen.com'],
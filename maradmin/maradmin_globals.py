@@ -1,16 +1,26 @@
+import base64
+import functools
+import hashlib
+import hmac
 import json
-import random
-import string
 import re
-import boto3
 import os
+import zlib
+
+from botocore.exceptions import ClientError
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 from yattag import Doc
 
+import aws_clients
+import log
+
 
 def publish_error_sns(title, body):
     sns_topic = os.environ['ERRORS_TOPIC']
-    sns = boto3.client('sns')
+    sns = aws_clients.client('sns')
     message = json.dumps({
         'default': title,
         'email': body,
@@ -24,13 +34,99 @@ def publish_error_sns(title, body):
             Subject=title,
             MessageStructure='json'
         )
-        print(f'Published {title} to Error SNS, Response:{response}')
+        log.info('Published to error SNS', title=title, message_id=response['MessageId'])
     except:
-        print('Error processing ' + title)
+        log.error('Error publishing to error SNS', title=title)
         raise
     return response
 
 
+def queue_transactional_email(email, title, html_msg, text_msg):
+    """
+    Places a NewSubscriberTemplate email on the transactional email queue for transactional_email.py to send, so
+    SES latency and throttling never hold up a web response or a receipt rule.
+    """
+    sqs = aws_clients.client('sqs')
+    response = sqs.send_message(
+        QueueUrl=os.environ['TRANSACTIONAL_EMAIL_QUEUE'],
+        MessageBody=json.dumps({
+            'email': email,
+            'title': title,
+            'html_msg': html_msg,
+            'text_msg': text_msg
+        })
+    )
+    log.info('Queued transactional email', title=title, email=email, message_id=response['MessageId'])
+    return response
+
+
+def conditional_check_failed(err):
+    """
+    True when a DynamoDB write was rejected by its ConditionExpression rather than failing outright.
+    """
+    return isinstance(err, ClientError) and err.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+
+# Verified subscribers carry a verified_shard attribute that unverified rows never have, so VerifiedShardIndex
+# only holds verified rows and spreads them over VERIFIED_SHARDS partition keys that can be read in parallel.
+# Changing the shard count requires re-running migrate_verified_shards.py.
+VERIFIED_SHARD_INDEX = 'VerifiedShardIndex'
+VERIFIED_SHARDS = 8
+# subscribers verified before VerifiedShardIndex existed have no verified_shard until migrate_verified_shards.py
+# rewrites them, it writes this row (with the shard count it used) once every one of them has been, until then
+# VerifiedIndex is read as well
+LEGACY_VERIFIED_INDEX = 'VerifiedIndex'
+SHARD_MIGRATION_KEY = {'email': '#VERIFIED_SHARDS'}
+
+
+def verified_shard(email):
+    return f'{zlib.crc32(email.encode("utf-8")) % VERIFIED_SHARDS:02d}'
+
+
+def verified_shards_migrated(table_name):
+    """
+    True once migrate_verified_shards.py has completed for the current VERIFIED_SHARDS.
+    """
+    item = aws_clients.client('dynamodb').get_item(
+        TableName=table_name,
+        Key={'email': {'S': SHARD_MIGRATION_KEY['email']}},
+        ConsistentRead=True
+    ).get('Item') or {}
+    return item.get('shards', {}).get('N') == str(VERIFIED_SHARDS)
+
+
+def query_verified_emails(table_name):
+    """
+    Emails of every verified subscriber, one paginated VerifiedShardIndex query per shard run concurrently, plus a
+    VerifiedIndex query until the shard migration has completed.
+    """
+    # boto3 clients are thread safe, resources are not
+    dynamodb = aws_clients.client('dynamodb')
+
+    def query_index(index_name, attribute, value):
+        emails = []
+        paginator = dynamodb.get_paginator('query')
+        for page in paginator.paginate(
+                TableName=table_name,
+                IndexName=index_name,
+                KeyConditionExpression='#key = :value',
+                ExpressionAttributeNames={'#key': attribute},
+                ExpressionAttributeValues={':value': {'S': value}}
+        ):
+            emails.extend(item['email']['S'] for item in page['Items'])
+        return emails
+
+    queries = [(VERIFIED_SHARD_INDEX, 'verified_shard', f'{shard:02d}') for shard in range(VERIFIED_SHARDS)]
+    if not verified_shards_migrated(table_name):
+        log.warning('Verified shards have not been migrated, reading VerifiedIndex as well. '
+                    'Run migrate_verified_shards.py.')
+        queries.append((LEGACY_VERIFIED_INDEX, 'verified', 'True'))
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        # a migrated subscriber is in both indexes
+        return list(dict.fromkeys(email for emails in executor.map(lambda query: query_index(*query), queries)
+                                  for email in emails))
+
+
 def sanitized_email(user_input):
     regex = r"^([\w-]+(?:\.[\w-]+)*)@((?:[\w-]+\.)*\w[\w-]{0,66})\.([a-z]{2,6}(?:\.[a-z]{2})?)$"
     match = re.match(regex, user_input)
@@ -40,8 +136,18 @@ def sanitized_email(user_input):
         return None, None
 
 
+def email_domain(email):
+    # sanitized_email only returns the top level domain, gmail.com and yahoo.com are different receiving MTAs
+    return email.rpartition('@')[2].lower()
+
+
+# the key ids sanitized_token accepts in a signed token, get_token_keys refuses any other
+TOKEN_KEY_ID_PATTERN = r"[a-zA-Z0-9]{1,16}"
+
+
 def sanitized_token(user_input):
-    regex = r"^[a-zA-Z]{16}$"
+    # accepts the legacy 16 letter tokens stored in SubscriberTable as well as signed tokens
+    regex = rf"^(?:[a-zA-Z]{{16}}|v1\.{TOKEN_KEY_ID_PATTERN}\.[a-zA-Z0-9_-]{{43}})$"
     match = re.fullmatch(regex, user_input)
     if match:
         return match.string
@@ -49,14 +155,90 @@ def sanitized_token(user_input):
         return None
 
 
-def get_token():
-    pool = string.ascii_letters
-    email_token = ''.join(random.choice(pool) for i in range(16))
-    return email_token
+# Signed tokens are 'v1.<key id>.<HMAC-SHA256 over version, key id, purpose and email>', so a verify or
+# unsubscribe link can be checked without reading SubscriberTable and never has to be stored.
+TOKEN_VERSION = 'v1'
+VERIFY_PURPOSE = 'verify'
+UNSUBSCRIBE_PURPOSE = 'unsubscribe'
 
+# Cache the signing keys at module level to avoid repeated SSM calls
+_token_keys = None
+
+
+def get_token_keys():
+    """
+    Fetch the token signing keys from SSM Parameter Store with caching.
+    The parameter is JSON: {"current": "<key id>", "keys": {"<key id>": "<secret>", ...}}. To rotate, add a new key,
+    point current at it and remove the old key once the links signed with it no longer matter.
+    Key ids are 1 to 16 letters and digits (TOKEN_KEY_ID_PATTERN), sanitized_token rejects a token signed with any
+    other id before its signature is checked, so keys with other ids raise ValueError here.
+    """
+    global _token_keys
+
+    if _token_keys is None:
+        if os.environ.get('AWS_EXECUTION_ENV') is None:
+            # Running locally, try to get from environment variable
+            value = os.environ.get('TOKEN_KEYS')
+            if not value:
+                raise ValueError("TOKEN_KEYS environment variable not set for local testing")
+        else:
+            ssm = aws_clients.client('ssm')
+            param_name = os.environ.get('TOKEN_KEYS_PARAM', '/maradmin/token-keys')
+            try:
+                response = ssm.get_parameter(Name=param_name, WithDecryption=True)
+                value = response['Parameter']['Value']
+            except Exception as e:
+                log.error('Error fetching token keys from SSM', **log.exception_fields(e))
+                raise
+        keys = json.loads(value)
+        invalid = [key_id for key_id in keys['keys'] if not re.fullmatch(TOKEN_KEY_ID_PATTERN, key_id)]
+        if invalid:
+            raise ValueError(f"Token key ids must match {TOKEN_KEY_ID_PATTERN}: {', '.join(invalid)}")
+        if keys['current'] not in keys['keys']:
+            raise ValueError(f"Current token key {keys['current']} is not one of the keys")
+        _token_keys = keys
+
+    return _token_keys
+
+
+def sign_token(email, purpose, key_id=None):
+    keys = get_token_keys()
+    key_id = key_id or keys['current']
+    msg = '|'.join((TOKEN_VERSION, key_id, purpose, email)).encode('utf-8')
+    digest = hmac.new(keys['keys'][key_id].encode('utf-8'), msg, hashlib.sha256).digest()
+    signature = base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+    return f'{TOKEN_VERSION}.{key_id}.{signature}'
 
-def build_webpage(page_title, card_title, card_subtitle, message):
-    doc, tag, text, line = Doc().ttl()
+
+def is_signed_token(token):
+    return token.startswith(TOKEN_VERSION + '.')
+
+
+def valid_signed_token(email, purpose, token):
+    try:
+        version, key_id, signature = token.split('.')
+    except ValueError:
+        return False
+    if version != TOKEN_VERSION or key_id not in get_token_keys()['keys']:
+        return False
+    return hmac.compare_digest(sign_token(email, purpose, key_id), token)
+
+
+def verification_link(email):
+    return f'https://maradmin.christopherbreen.com/verify?email={quote(email)}' \
+           f'&email_token={sign_token(email, VERIFY_PURPOSE)}'
+
+
+def unsubscribe_link(email):
+    return f'https://maradmin.christopherbreen.com/unsubscribe?email={quote(email)}' \
+           f'&email_token={sign_token(email, UNSUBSCRIBE_PURPOSE)}'
+
+
+def _webpage(doc, content):
+    """
+    Lays out the page on doc, content(name) adds the text of page_title, card_title, card_subtitle and message.
+    """
+    tag, text, line = doc.tag, doc.text, doc.line
 
     doc.asis('<!DOCTYPE html>')
     with tag('html', lang='en'):
@@ -71,7 +253,7 @@ def build_webpage(page_title, card_title, card_subtitle, message):
             doc.stag('meta', ('initial-scale', 1), ('shrink-to-fit', 'no'), name='viewport',
                      content='width=device-width')
             with tag('title'):
-                text(page_title)
+                content('page_title')
             doc.stag('link', rel='stylesheet',
                      href="https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css",
                      integrity="sha384-JcKb8q3iqJ61gNV9KGb8thSsNjpSL0n8PARn9HuZOnIxN0hoP+VmmDGMN5t9UJ0Z",
@@ -87,9 +269,12 @@ def build_webpage(page_title, card_title, card_subtitle, message):
                         with tag('div', klass='col-lg-8 col-md-10 col-sm-12'):
                             with tag('div', klass='card'):
                                 with tag('div', klass='card-body'):
-                                    line('h3', card_title, klass='card-title')
-                                    line('h5', card_subtitle, klass='card-subtitle mb-2 text-muted')
-                                    line('p', message, klass='card-text')
+                                    with tag('h3', klass='card-title'):
+                                        content('card_title')
+                                    with tag('h5', klass='card-subtitle mb-2 text-muted'):
+                                        content('card_subtitle')
+                                    with tag('p', klass='card-text'):
+                                        content('message')
                                 with tag('div', klass='card-footer text-muted text-center'):
                                     text('This site/service is not hosted nor endorsed by the U.S. Government or the U.S. Marine Corps.')
             line('script', '', src="https://code.jquery.com/jquery-3.5.1.slim.min.js",
@@ -99,4 +284,72 @@ def build_webpage(page_title, card_title, card_subtitle, message):
                  integrity="sha384-B4gt1jrGC7Jh4AgTPSdUtOBvfO8shuf57BaghqFfPlYxofvL8/KUEfYiJOMMV+rV",
                  crossorigin="anonymous")
 
-    return doc.getvalue()
+
+
+def _compile_webpage():
+    doc = Doc()
+    _webpage(doc, doc.slot)
+    return doc.compile()
+
+
+# the page only differs by its text, so it is laid out once per container and rendered with a single join
+_webpage_template = _compile_webpage()
+
+
+def build_webpage(page_title, card_title, card_subtitle, message):
+    return _webpage_template.render(page_title=page_title, card_title=card_title, card_subtitle=card_subtitle,
+                                    message=message)
+
+
+# A rendered page and its strong ETag, a hash of the body, so every container of a deployment agrees on it
+Page = namedtuple('Page', ['body', 'etag'])
+
+# the registration form is identical for everyone and can be kept by a CDN or object-store cache, the other pages
+# answer a request that has side effects, so they must reach the handler every time
+PUBLIC_CACHE_CONTROL = 'public, max-age=3600'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def make_page(body):
+    return Page(body, '"%s"' % hashlib.sha256(body.encode('utf-8')).hexdigest())
+
+
+@functools.lru_cache(maxsize=32)
+def webpage(card_title, card_subtitle, message, page_title='MARADMIN'):
+    """
+    The build_webpage page, rendered once per container for each distinct set of texts.
+    """
+    return make_page(build_webpage(page_title, card_title, card_subtitle, message))
+
+
+def etag_matches(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = next((value for name, value in headers.items() if name.lower() == 'if-none-match'), None)
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison
+    return etag in (candidate.strip().removeprefix('W/') for candidate in if_none_match.split(','))
+
+
+def html_response(event, page, cache_control=REVALIDATE_CACHE_CONTROL):
+    """
+    API Gateway response for a pre-rendered page, 304 without a body when the client already has it.
+    """
+    headers = {
+        'Content-Type': 'text/html',
+        'ETag': page.etag,
+        'Cache-Control': cache_control,
+    }
+    if etag_matches(event, page.etag):
+        return {
+            'statusCode': "304",
+            'body': '',
+            'headers': headers
+        }
+    return {
+        'statusCode': "200",
+        'body': page.body,
+        'headers': headers
+    }
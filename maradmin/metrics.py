@@ -0,0 +1,79 @@
+# Pipeline metrics in CloudWatch embedded metric format. Each metric is written as one JSON log line that
+# CloudWatch turns into a metric in the MARADMIN namespace, so no PutMetricData call is made from the hot path. Tests
+# and local runs swap emitter for a LocalEmitter to collect the same records.
+import contextlib
+import json
+import time
+
+import log
+
+NAMESPACE = 'MARADMIN'
+MILLISECONDS = 'Milliseconds'
+COUNT = 'Count'
+COUNT_PER_SECOND = 'Count/Second'
+
+
+def print_emitter(record):
+    print(json.dumps(record))
+
+
+class LocalEmitter:
+    """
+    Keeps the records instead of writing them.
+    """
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def values(self, name, **dimensions):
+        """
+        Values recorded for the metric, only those with the given dimensions when any are given.
+        """
+        return [record[name] for record in self.records
+                if name in record and all(record.get(key) == value for key, value in dimensions.items())]
+
+
+emitter = print_emitter
+
+
+def put(name, value, unit=MILLISECONDS, **dimensions):
+    put_values({name: value}, unit, **dimensions)
+
+
+def put_values(values, unit=MILLISECONDS, properties=None, **dimensions):
+    """
+    Puts several metrics sharing a unit and dimensions in one record. Properties are written alongside without
+    becoming dimensions, Logs Insights can group on them but CloudWatch does not make a metric per value.
+    """
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name in values],
+            }],
+        },
+        **(properties or {}),
+        **values,
+        **dimensions,
+    }
+    # not a dimension, links the metric to the invocation's log lines
+    if log.correlation_id():
+        record['correlation_id'] = log.correlation_id()
+    emitter(record)
+
+
+@contextlib.contextmanager
+def timer(name, **dimensions):
+    """
+    Puts the time spent in the block in milliseconds, whether or not it raised. The block may change the
+    dimensions it is given, e.g. to record which way a page was fetched.
+    """
+    start = time.perf_counter()
+    try:
+        yield dimensions
+    finally:
+        put(name, round((time.perf_counter() - start) * 1000, 1), MILLISECONDS, **dimensions)
@@ -0,0 +1,70 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+from maradmin_globals import verified_shard, SHARD_MIGRATION_KEY, VERIFIED_SHARDS
+
+
+def migrate_segment(table_name, segment, total_segments):
+    """
+    Adds verified_shard to the verified subscribers in one parallel scan segment.
+
+    Items are rewritten whole through a batch writer, so run the migration while nobody is registering or
+    unsubscribing, a change made between the scan and the write would be overwritten.
+
+    Returns:
+        Number of subscribers rewritten
+    """
+    # boto3 resources are not thread safe, every segment gets its own session
+    table = boto3.session.Session().resource('dynamodb').Table(table_name)
+    scan_kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': Attr('verified').eq('True')
+    }
+    count = 0
+    done = False
+    start_key = None
+    with table.batch_writer() as batch:
+        while not done:
+            if start_key:
+                scan_kwargs['ExclusiveStartKey'] = start_key
+            db_response = table.scan(**scan_kwargs)
+            start_key = db_response.get('LastEvaluatedKey', None)
+            done = start_key is None
+            for item in db_response['Items']:
+                shard = verified_shard(item['email'])
+                if item.get('verified_shard') == shard:
+                    continue
+                item['verified_shard'] = shard
+                batch.put_item(Item=item)
+                count += 1
+    print(f'Segment {segment}: rewrote {count} subscribers')
+    return count
+
+
+def main(table_name, total_segments):
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        counts = executor.map(lambda segment: migrate_segment(table_name, segment, total_segments),
+                              range(total_segments))
+        print(f'Migrated {sum(counts)} verified subscribers to VerifiedShardIndex')
+
+    # only reached when every segment completed, query_verified_emails stops reading VerifiedIndex from here on
+    boto3.resource('dynamodb').Table(table_name).put_item(Item={
+        **SHARD_MIGRATION_KEY,
+        'shards': VERIFIED_SHARDS,
+        'migrated_at': datetime.now(timezone.utc).isoformat(timespec='seconds')
+    })
+    print('Recorded the completed migration, VerifiedIndex is no longer read and can be removed')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Add verified_shard to existing verified subscribers.")
+    parser.add_argument("subscriber_table", help="SubscriberTable name.")
+    parser.add_argument("--segments", type=int, default=4, help="Parallel scan segments.")
+    args = parser.parse_args()
+
+    main(args.subscriber_table, args.segments)
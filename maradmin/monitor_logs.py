@@ -1,77 +1,221 @@
-import boto3
+import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
-# Initialize AWS clients
-logs_client = boto3.client('logs')
-ses_client = boto3.client('ses')
+from botocore.exceptions import ClientError
+
+import aws_clients
+import log
+import profiling
+from maradmin_globals import conditional_check_failed
 
 # Get log group names from environment variables with fallbacks
 POLL_LOG_GROUP = os.environ.get('POLL_LOG_GROUP', '/aws/lambda/maradmin-PollFunction-HPDHW6O635NP')
 SCRAPER_LOG_GROUP = os.environ.get('SCRAPER_LOG_GROUP', '/aws/lambda/maradmin-ScraperFunction-XXXXXXXX')
+BROWSER_FETCH_LOG_GROUP = os.environ.get('BROWSER_FETCH_LOG_GROUP',
+                                         '/aws/lambda/maradmin-BrowserFetchFunction-XXXXXXXX')
 EMAIL_SENDER = 'MARADMIN <maradmin@christopherbreen.com>'
 EMAIL_RECIPIENT = 'maradmin@christopherbreen.com'
 
-def lambda_handler(event, context):
-    # Calculate time range for the past 6 hours (timezone-aware)
-    end_time = datetime.now(timezone.utc)
-    start_time = end_time - timedelta(hours=6)
+# matched by CloudWatch Logs, only the matching events are returned whatever the number of streams. The handlers
+# log JSON lines (log.py), the runtime still writes plain text for uncaught exceptions and timeouts.
+JSON_FILTER_PATTERN = '{ $.level = "WARNING" || $.level = "ERROR" }'
+RUNTIME_FILTER_PATTERN = '?"[ERROR]" ?"Task timed out" ?"Runtime exited"'
+FILTER_PATTERNS = (JSON_FILTER_PATTERN, RUNTIME_FILTER_PATTERN)
+
+# Each log group is scanned from just after its checkpoint (the end of the previous scan) to INGESTION_LAG before
+# now, the lag gives late events time to arrive so windows never overlap and nothing falls between them. A log
+# group without a checkpoint starts FIRST_WINDOW back.
+INGESTION_LAG = timedelta(minutes=5)
+FIRST_WINDOW = timedelta(hours=6)
+MAX_SIGNATURES = 50
+
+_SIGNATURE_RGXS = [
+    (re.compile(r'\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?Z?'), '<TIME>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE), '<ID>'),
+    (re.compile(r'https?://\S+'), '<URL>'),
+    (re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), '<EMAIL>'),
+    (re.compile(r'\b[0-9a-f]{8,}\b', re.IGNORECASE), '<HEX>'),
+    (re.compile(r'\d+'), '<N>'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def parse_json_line(message):
+    try:
+        record = json.loads(message)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and 'level' in record else None
+
+
+def signature(message):
+    """
+    The level and message of a JSON line, whose variable parts are separate fields. For runtime text, the message
+    with its variable parts (times, ids, links, addresses, numbers) replaced, so recurrences of the same error
+    group together.
+    """
+    record = parse_json_line(message)
+    if record:
+        return f'{record["level"]} {record.get("message", "")}'[:200]
+    for rgx, replacement in _SIGNATURE_RGXS:
+        message = rgx.sub(replacement, message)
+    return message.strip()[:200]
+
+
+def checkpoint_key(log_group_name):
+    # the log groups are scanned on threads, which share the dynamodb client rather than a Table resource
+    return {'TableName': os.environ['MONITOR_CHECKPOINT_TABLE'], 'Key': {'log_group': {'S': log_group_name}}}
+
+
+def read_checkpoint(log_group_name):
+    item = aws_clients.client('dynamodb').get_item(**checkpoint_key(log_group_name)).get('Item')
+    return int(item['end_ms']['N']) if item else None
+
+
+def write_checkpoint(log_group_name, end_ms, **condition):
+    key = checkpoint_key(log_group_name)
+    aws_clients.client('dynamodb').put_item(TableName=key['TableName'],
+                                            Item={**key['Key'], 'end_ms': {'N': str(end_ms)}}, **condition)
+
+
+def claim_window(log_group_name, previous_end_ms, end_ms):
+    """
+    Moves the log group's checkpoint to end_ms unless another run moved it first.
+
+    Returns:
+        True when this run owns the window
+    """
+    if previous_end_ms is None:
+        condition = {'ConditionExpression': 'attribute_not_exists(log_group)'}
+    else:
+        condition = {'ConditionExpression': 'end_ms = :previous',
+                     'ExpressionAttributeValues': {':previous': {'N': str(previous_end_ms)}}}
+    try:
+        write_checkpoint(log_group_name, end_ms, **condition)
+    except ClientError as err:
+        if not conditional_check_failed(err):
+            raise
+        log.warning('Log group was scanned by another run, skipping', log_group=log_group_name)
+        return False
+    return True
+
+
+def release_window(log_group_name, previous_end_ms, end_ms):
+    # puts the checkpoint back so the next run reports the window again
+    if previous_end_ms is None:
+        aws_clients.client('dynamodb').delete_item(**checkpoint_key(log_group_name))
+    else:
+        write_checkpoint(log_group_name, previous_end_ms, ConditionExpression='end_ms = :claimed',
+                         ExpressionAttributeValues={':claimed': {'N': str(end_ms)}})
+
+
+def scan_log_group(function_name, log_group_name, now):
+    """
+    Groups the warnings and errors logged since the checkpoint by signature.
+
+    Returns:
+        Dict of the scan: groups ({signature: {count, first, last, example}}), events, window start and end in ms
+        and previous_end_ms to release the window with, None when another run owns the window
+    """
+    previous_end_ms = read_checkpoint(log_group_name)
+    end_ms = int((now - INGESTION_LAG).timestamp() * 1000)
+    start_ms = previous_end_ms + 1 if previous_end_ms is not None else int((now - INGESTION_LAG - FIRST_WINDOW).timestamp() * 1000)
+    if start_ms > end_ms or not claim_window(log_group_name, previous_end_ms, end_ms):
+        return None
+
+    # pages are folded into the groups as they arrive, memory follows the number of signatures, not of events
+    groups = {}
+    scan = {'function_name': function_name, 'log_group_name': log_group_name, 'groups': groups, 'events': 0,
+            'start_ms': start_ms, 'end_ms': end_ms, 'previous_end_ms': previous_end_ms, 'released': False}
+    calls = 0
+    try:
+        paginator = aws_clients.client('logs').get_paginator('filter_log_events')
+        for filter_pattern in FILTER_PATTERNS:
+            for page in paginator.paginate(
+                    logGroupName=log_group_name,
+                    startTime=start_ms,
+                    endTime=end_ms,
+                    filterPattern=filter_pattern
+            ):
+                calls += 1
+                for event in page['events']:
+                    if filter_pattern == RUNTIME_FILTER_PATTERN and parse_json_line(event['message']):
+                        # a JSON line whose text happens to match, counted by the JSON pattern if at all
+                        continue
+                    scan['events'] += 1
+                    group = groups.setdefault(signature(event['message']), {
+                        'count': 0, 'first': event['timestamp'], 'last': event['timestamp'],
+                        'example': event['message']
+                    })
+                    group['count'] += 1
+                    group['first'] = min(group['first'], event['timestamp'])
+                    group['last'] = max(group['last'], event['timestamp'])
+    except Exception as e:
+        # reported in place of the events, the window is scanned again next run
+        log.error('Failed to fetch logs', log_group=log_group_name, **log.exception_fields(e))
+        release_window(log_group_name, previous_end_ms, end_ms)
+        groups.clear()
+        groups['fetch failed'] = {'count': 1, 'first': end_ms, 'last': end_ms,
+                                  'example': f'ERROR: Failed to fetch logs - {e}'}
+        scan.update(events=1, released=True)
+        return scan
+    log.info('Scanned log group', log_group=log_group_name, events=scan['events'], signatures=len(groups),
+             calls=calls)
+    return scan
 
-    # Convert to milliseconds
-    start_time_ms = int(start_time.timestamp() * 1000)
-    end_time_ms = int(end_time.timestamp() * 1000)
 
-    pattern = re.compile(r'\[(WARNING|ERROR)]')
+def format_time(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
 
-    all_log_events = []
 
-    # Monitor both PollFunction and ScraperFunction log groups
+def summary(scans):
+    """
+    Email body listing the MAX_SIGNATURES most frequent signatures, with counts and first/last seen.
+    """
+    rows = [(group['count'], scan['function_name'], group) for scan in scans for group in scan['groups'].values()]
+    rows.sort(key=lambda row: (-row[0], row[2]['first']))
+    total = sum(scan['events'] for scan in scans)
+    body = "Summary of MARADMIN warnings and errors:\n\n"
+    for scan in scans:
+        body += f"{scan['function_name']}: {format_time(scan['start_ms'])} to {format_time(scan['end_ms'])} UTC, " \
+                f"{scan['events']} events\n"
+    body += f"Total Events: {total} in {len(rows)} distinct messages\n\n"
+    body += "-" * 80 + "\n\n"
+    for count, function_name, group in rows[:MAX_SIGNATURES]:
+        body += f"{count}x [{function_name}] first {format_time(group['first'])}, last {format_time(group['last'])}\n"
+        body += f"    {group['example'].strip()[:500]}\n\n"
+    if len(rows) > MAX_SIGNATURES:
+        body += f"... and {len(rows) - MAX_SIGNATURES} less frequent messages\n"
+    return body
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    now = datetime.now(timezone.utc)
     log_groups = [
         ('PollFunction', POLL_LOG_GROUP),
-        ('ScraperFunction', SCRAPER_LOG_GROUP)
+        ('ScraperFunction', SCRAPER_LOG_GROUP),
+        ('BrowserFetchFunction', BROWSER_FETCH_LOG_GROUP)
     ]
 
-    for function_name, log_group_name in log_groups:
-        try:
-            log_streams = logs_client.describe_log_streams(
-                logGroupName=log_group_name,
-                orderBy='LastEventTime',
-                descending=True,
-                limit=50  # Limit to most recent 50 streams for performance
-            )
+    # the log groups are scanned concurrently
+    with ThreadPoolExecutor(max_workers=len(log_groups)) as executor:
+        scans = [scan for scan in executor.map(lambda group: scan_log_group(group[0], group[1], now), log_groups)
+                 if scan]
 
-            for stream in log_streams['logStreams']:
-                log_stream_name = stream['logStreamName']
+    total = sum(scan['events'] for scan in scans)
+    if not total:
+        log.info('No warnings or errors found in the logs')
+        return {"statusCode": 200, "body": "No warnings or errors found in the logs"}
 
-                events = logs_client.get_log_events(
-                    logGroupName=log_group_name,
-                    logStreamName=log_stream_name,
-                    startTime=start_time_ms,
-                    endTime=end_time_ms,
-                    startFromHead=True
-                )
-
-                for event in events['events']:
-                    message = event['message']
-                    timestamp = datetime.fromtimestamp(event['timestamp'] / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
-                    if pattern.search(message):
-                        all_log_events.append(f'[{function_name}] {timestamp} - {message}')
-
-        except Exception as e:
-            print(f'[ERROR] Failed to fetch logs from {log_group_name}: {e}')
-            all_log_events.append(f'[{function_name}] ERROR: Failed to fetch logs - {e}')
-
-    if all_log_events:
-        email_subject = f"6-Hour Log Summary: {start_time.strftime('%Y-%m-%d %H:%M')} to {end_time.strftime('%H:%M')} UTC"
-        email_body = "Summary of MARADMIN log entries with [WARNING] or [ERROR]:\n\n"
-        email_body += f"Monitoring: PollFunction and ScraperFunction\n"
-        email_body += f"Time Range: {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')} UTC\n"
-        email_body += f"Total Events: {len(all_log_events)}\n\n"
-        email_body += "-" * 80 + "\n\n"
-        email_body += "\n".join(all_log_events)
-
-        ses_response = ses_client.send_email(
+    email_subject = f"Log Summary: {total} warnings/errors to {format_time(max(scan['end_ms'] for scan in scans))} UTC"
+    try:
+        ses_response = aws_clients.client('ses').send_email(
             Source=EMAIL_SENDER,
             Destination={
                 'ToAddresses': [EMAIL_RECIPIENT]
@@ -82,15 +226,15 @@ def lambda_handler(event, context):
                 },
                 'Body': {
                     'Text': {
-                        'Data': email_body
+                        'Data': summary(scans)
                     }
                 }
             }
         )
-        print(f'Email sent successfully: {ses_response["MessageId"]}')
-        print(f'Found {len(all_log_events)} warning/error events')
-        return {"statusCode": 200, "body": f"Email sent with {len(all_log_events)} events"}
-    else:
-        print('No warnings or errors found in the logs')
-        return {"statusCode": 200, "body": "No warnings or errors found in the logs"}
-
+    except Exception:
+        for scan in scans:
+            if not scan['released']:
+                release_window(scan['log_group_name'], scan['previous_end_ms'], scan['end_ms'])
+        raise
+    log.info('Email sent', message_id=ses_response['MessageId'], events=total)
+    return {"statusCode": 200, "body": f"Email sent with {total} events"}
@@ -0,0 +1,89 @@
+# Orders and paces a broadcast's fan-out by recipient domain. Most subscribers share a few domains (usmc.mil,
+# gmail.com), and a receiving MTA that is handed hundreds of our messages at once defers or greylists them, which
+# SES only retries minutes later. interleave spreads every domain evenly over the broadcast. With DOMAIN_CONCURRENCY
+# set on SnsToSqsFunction, schedule also delays each domain's messages (SQS DelaySeconds) so that at most
+# DOMAIN_CONCURRENCY of them are released every DOMAIN_WAVE_SECONDS (default 1). benchmarks/simulate_pacing.py shows
+# the effect of both on a broadcast's makespan.
+import os
+from collections import Counter
+
+from maradmin_globals import email_domain
+import aws_clients
+import log
+
+# SQS DelaySeconds limit
+MAX_DELAY_SECONDS = 900
+
+
+def interleave(emails):
+    """
+    Orders emails so each domain is spread evenly over the whole list: the k-th of a domain's n emails is placed
+    (k + 0.5) / n of the way through. Emails keep their order within a domain.
+    """
+    by_domain = {}
+    for email in emails:
+        by_domain.setdefault(email_domain(email), []).append(email)
+    positions = [((index + 0.5) / len(members), domain, email)
+                 for domain, members in by_domain.items() for index, email in enumerate(members)]
+    return [email for _, _, email in sorted(positions, key=lambda position: position[:2])]
+
+
+def schedule(emails, concurrency=None, wave_seconds=1, send_rate=None):
+    """
+    Args:
+        emails: recipients of a broadcast
+        concurrency: messages released per domain per wave, None or 0 to queue every message without delay
+        wave_seconds: seconds between waves
+        send_rate: SES messages per second, no wave releases more than SES sends in wave_seconds. Messages
+            released faster pile up in the queue and reach SES in whatever domain mix is left, undoing the cap.
+
+    Returns:
+        List of (email, delay in seconds) in the order to queue them
+    """
+    ordered = interleave(emails)
+    if not concurrency:
+        return [(email, 0) for email in ordered]
+    # what does not fit within the SQS delay limit is released in larger waves, rather than all together with the
+    # last one
+    waves = MAX_DELAY_SECONDS // wave_seconds + 1
+    sizes = Counter(email_domain(email) for email in ordered)
+    per_wave = {domain: max(concurrency, -(-count // waves)) for domain, count in sizes.items()}
+    wave_limit = max(int(send_rate * wave_seconds), -(-len(ordered) // waves), 1) if send_rate else len(ordered)
+    raised = {domain: size for domain, size in per_wave.items() if size > concurrency}
+    if raised:
+        log.warning('Domain pacing exceeds the SQS delay limit, sending larger waves', concurrency=concurrency,
+                    raised=raised)
+
+    wave_sizes = Counter()
+    # the first wave that is not full, and for each domain the wave it is filling and how much of it it has used
+    open_wave = 0
+    domain_wave = Counter()
+    domain_used = Counter()
+    scheduled = []
+    for email in ordered:
+        domain = email_domain(email)
+        wave = max(domain_wave[domain], open_wave)
+        while wave_sizes[wave] >= wave_limit:
+            wave += 1
+        if wave != domain_wave[domain]:
+            domain_wave[domain], domain_used[domain] = wave, 0
+        scheduled.append((email, min(wave * wave_seconds, MAX_DELAY_SECONDS)))
+        wave_sizes[wave] += 1
+        domain_used[domain] += 1
+        if domain_used[domain] == per_wave[domain]:
+            domain_wave[domain], domain_used[domain] = wave + 1, 0
+        while wave_sizes[open_wave] >= wave_limit:
+            open_wave += 1
+    return scheduled
+
+
+def configured_schedule(emails):
+    """
+    schedule with the DOMAIN_CONCURRENCY and DOMAIN_WAVE_SECONDS environment variables and the account's SES send
+    rate.
+    """
+    concurrency = int(os.environ.get('DOMAIN_CONCURRENCY', '0'))
+    if not concurrency:
+        return schedule(emails)
+    send_rate = aws_clients.client('ses').get_send_quota()['MaxSendRate']
+    return schedule(emails, concurrency, int(os.environ.get('DOMAIN_WAVE_SECONDS', '1')), send_rate)
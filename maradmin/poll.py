@@ -1,12 +1,18 @@
-import json
 import xml.etree.ElementTree as ET
-import boto3
 import os
 import requests
 from boto3.dynamodb.conditions import Key
+
+import aws_clients
+import log
+import profiling
+import metrics
 # from maradmin_globals import publish_error_sns
 
 
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
 def lambda_handler(event, context):
     """
     We use publish_error_sns when previously identified issues occur trying to scrape the website.
@@ -20,7 +26,8 @@ def lambda_handler(event, context):
     url = 'https://www.marines.mil/DesktopModules/ArticleCS/RSS.ashx?ContentType=6&Site=481&max=1&category=14336'
     retries = 1
     try:
-        response = fetch_url_with_retry(url, retries=retries)
+        with metrics.timer('PollFetch'):
+            response = fetch_url_with_retry(url, retries=retries)
         if response is None:
             # printing and publish_error_sns takes place inside fetch_url_with_retry
             return {"statusCode": 500}
@@ -29,24 +36,20 @@ def lambda_handler(event, context):
         headers = response.headers
         msg = response.text
         if not msg:
-            print(f"[ERROR] Response body is empty. HTTP Status Code: {status_code}. Headers: {headers}")
+            log.error('Response body is empty', status_code=status_code, headers=dict(headers))
             # publish_error_sns('MARADMIN Poll response had empty message body', f'HTTP Status Code: {status_code}. Headers: {headers}')
             return {"statusCode": 500}
-        try:
-            root = ET.fromstring(msg)
-        except ET.ParseError:
+        with metrics.timer('FeedParse'):
             try:
-                print(f'ParseError: response.headers:{json.dumps(dict(response.headers))} msg:{str(msg)}')
-            except TypeError:
-                print(f'ParseError: response.headers:{dict(response.headers)} msg:{str(msg)}')
-            finally:
+                root = ET.fromstring(msg)
+            except ET.ParseError:
+                log.error('RSS feed is not valid XML', headers=dict(response.headers), body=msg)
                 raise
 
-        latest_pub = root[0][4].text
-        print(f'{latest_pub} is latest publication on server.')
+            latest_pub = root[0][4].text
+        log.info('Latest publication on server', pub_date=latest_pub)
 
-        db = boto3.resource('dynamodb')
-        maradmin_table = db.Table(os.environ['MARADMIN_TABLE_NAME'])
+        maradmin_table = aws_clients.table(os.environ['MARADMIN_TABLE_NAME'])
         query_kwargs = {
             'IndexName': 'PubDateIndex',
             'KeyConditionExpression': Key('pub_date').eq(latest_pub)
@@ -54,13 +57,13 @@ def lambda_handler(event, context):
         rs = maradmin_table.query(**query_kwargs)
         if rs['Count'] == 0:
             # MARADMIN website has newer publication
-            client = boto3.client('lambda')
+            client = aws_clients.client('lambda')
             invoke_response = client.invoke(
                 FunctionName=os.environ['SCRAPER_FUNCTION'],
                 InvocationType='Event',
                 Payload='{}'
             )
-            print(f"Invoking Scraper: {invoke_response}")
+            log.info('Invoked scraper', status_code=invoke_response['StatusCode'])
         return {"statusCode": 200}
 
     except Exception:
@@ -70,14 +73,14 @@ def lambda_handler(event, context):
 def fetch_url_with_retry(url, retries=3):
     """
     Fetch URL with comprehensive browser headers to avoid bot detection.
-    Uses the same approach as fetch_page_with_curl_headers in scraper.py.
+    Uses the same approach as fetch_maradmin_body in scraper.py.
     """
     # Get and log Lambda IP address
     try:
         lambda_ip = requests.get('http://checkip.amazonaws.com', timeout=3).text.strip()
-        print(f'[INFO] Lambda IP address: {lambda_ip}')
+        log.info('Lambda IP address', ip=lambda_ip)
     except Exception as e:
-        print(f'[WARNING] Could not determine Lambda IP: {e}')
+        log.warning('Could not determine Lambda IP', **log.exception_fields(e))
         lambda_ip = 'unknown'
 
     session = requests.Session()
@@ -100,24 +103,24 @@ def fetch_url_with_retry(url, retries=3):
     }
     session.headers.update(headers)
 
-    print(f'[DEBUG] Attempting to fetch RSS feed from IP: {lambda_ip}')
+    log.debug('Fetching RSS feed', url=url, ip=lambda_ip)
     try:
         response = session.get(url, timeout=600)  # 10 minute timeout
-        print(f'[DEBUG] Response status code: {response.status_code}')
+        log.debug('RSS feed response', status_code=response.status_code)
         response.raise_for_status()
         return response
     except requests.exceptions.Timeout:
-        print(f'[ERROR] Request timed out after 10 minutes for URL: {url}')
+        log.error('Request timed out after 10 minutes', url=url)
         # publish_error_sns('MARADMIN Polling Error', 'Request timeout')
         return None
     except requests.exceptions.ConnectionError as e:
-        print(f'[ERROR] Connection error for URL {url}: {e}')
+        log.error('Connection error', url=url, **log.exception_fields(e))
         # publish_error_sns('MARADMIN Polling Error', str(e))
         return None
     except requests.exceptions.HTTPError as e:
-        print(f'[ERROR] HTTP error {e.response.status_code} for URL {url}: {e}')
+        log.error('HTTP error', url=url, status_code=e.response.status_code, **log.exception_fields(e))
         # publish_error_sns('MARADMIN Polling Error', str(e))
         return None
     except Exception as e:
-        print(f'[ERROR] Unexpected error fetching URL {url}: {type(e).__name__} - {e}')
+        log.error('Unexpected error fetching URL', url=url, **log.exception_fields(e))
         raise
\ No newline at end of file
@@ -0,0 +1,87 @@
+# Opt-in profiling of a Lambda handler, for the invocation that suddenly takes ten minutes. Set on the function:
+#   PROFILE=cpu,memory        cProfile stats and/or a tracemalloc top-N diff of what the invocation allocated
+#   PROFILE_SAMPLE_RATE=0.1   fraction of the invocations profiled (default 1)
+#   PROFILE_TOP=25            lines in the memory diff (default 25)
+#   PROFILE_BUCKET=bucket     also upload to s3://bucket/profiles/<module>/, the role needs s3:PutObject
+# Without PROFILE the decorator returns the handler itself, so a function that is not profiled pays nothing.
+import cProfile
+import functools
+import os
+import random
+import time
+import tracemalloc
+
+import log
+
+PROFILE_DIR = '/tmp/profiles'
+MODES = ('cpu', 'memory')
+
+# a handler running another in process (a local browser_fetch) is profiled once, by the outer one
+_active = False
+
+
+def _upload(bucket, module, paths):
+    # only profiled invocations with a bucket need boto3, browser_fetch does not import it otherwise
+    import aws_clients
+    s3 = aws_clients.client('s3')
+    for path in paths:
+        try:
+            s3.upload_file(path, bucket, f'profiles/{module}/{os.path.basename(path)}')
+        except Exception as err:
+            log.warning('Could not upload profile', path=path, bucket=bucket, **log.exception_fields(err))
+
+
+def _write_memory_diff(path, before, after, peak, top):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'peak traced memory: {peak / 1024:.1f} KiB\n')
+        for stat in after.compare_to(before, 'lineno')[:top]:
+            f.write(f'{stat}\n')
+
+
+def profiled(handler):
+    """
+    Decorates a lambda_handler to profile its invocations when the PROFILE environment variable is set.
+    """
+    modes = {mode.strip() for mode in os.environ.get('PROFILE', '').lower().split(',') if mode.strip()}
+    if not modes:
+        return handler
+    if not modes <= set(MODES):
+        raise ValueError(f'PROFILE must be a comma separated list of {", ".join(MODES)}, not {os.environ["PROFILE"]}')
+    sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', '1'))
+    top = int(os.environ.get('PROFILE_TOP', '25'))
+    bucket = os.environ.get('PROFILE_BUCKET')
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _active
+        if _active or random.random() >= sample_rate:
+            return handler(event, context)
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f'{handler.__module__}-{getattr(context, "aws_request_id", None) or int(time.time() * 1000)}'
+        profiler = cProfile.Profile() if 'cpu' in modes else None
+        tracing_memory = 'memory' in modes and not tracemalloc.is_tracing()
+        if tracing_memory:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        _active = True
+        try:
+            if profiler:
+                return profiler.runcall(handler, event, context)
+            return handler(event, context)
+        finally:
+            _active = False
+            paths = []
+            if profiler:
+                paths.append(os.path.join(PROFILE_DIR, f'{name}.pstats'))
+                profiler.dump_stats(paths[-1])
+            if tracing_memory:
+                after = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                paths.append(os.path.join(PROFILE_DIR, f'{name}.memory.txt'))
+                _write_memory_diff(paths[-1], before, after, peak, top)
+            log.info('Profiled invocation', files=paths)
+            if bucket:
+                _upload(bucket, handler.__module__, paths)
+    return wrapper
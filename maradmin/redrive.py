@@ -0,0 +1,171 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import aws_clients
+import log
+import profiling
+from dlq_to_s3 import PREFIX, subject_slug
+
+# the rest of the SES send rate is left to live broadcasts running alongside a redrive
+SES_SHARE = 0.5
+# SendMessageBatch limits
+BATCH_ENTRIES = 10
+BATCH_BYTES = 262144
+# the trace of a redriven message would report the incident as time to inbox
+DROPPED_ATTRIBUTES = ('trace',)
+
+
+def partition_of(key):
+    """
+    (date, subject slug) of a dlq_to_s3 object key, None for any other key.
+    """
+    parts = key.split('/')
+    if len(parts) != 4 or not key.endswith('.jsonl.gz') \
+            or not parts[1].startswith('date=') or not parts[2].startswith('subject='):
+        return None
+    return parts[1][len('date='):], parts[2][len('subject='):]
+
+
+def iter_archived(s3, bucket, since=None, subject=None):
+    """
+    Yields the archived SQS records, objects outside the since date or subject are skipped by their key alone.
+    Objects written before archives were batched ('DLQ <uuid>.json', one event each) are read as well.
+    """
+    paginator = s3.get_paginator('list_objects_v2')
+    for prefix in (f'{PREFIX}/', 'DLQ '):
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if prefix == 'DLQ ':
+                    yield from json.load(s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'])['Records']
+                    continue
+                partition = partition_of(obj['Key'])
+                if partition is None or (since and partition[0] < since.strftime('%Y-%m-%d')) \
+                        or (subject and partition[1] != subject_slug(subject)):
+                    continue
+                body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body']
+                # streamed, an object is never held in memory whole
+                with gzip.GzipFile(fileobj=body) as lines:
+                    for line in lines:
+                        yield json.loads(line)
+
+
+def message_attributes(record):
+    # the Lambda event spells attributes in camel case, SendMessage in Pascal case
+    return {name: {'DataType': attribute['dataType'], 'StringValue': attribute['stringValue']}
+            for name, attribute in (record.get('messageAttributes') or {}).items()
+            if name not in DROPPED_ATTRIBUTES and 'stringValue' in attribute}
+
+
+def entry_bytes(entry):
+    return len(entry['MessageBody'].encode('utf-8')) + sum(
+        len(name) + len(attribute['DataType']) + len(attribute['StringValue'].encode('utf-8'))
+        for name, attribute in entry['MessageAttributes'].items())
+
+
+def ses_budget(ses):
+    """
+    Returns:
+        Messages per second the redrive may queue and how many it may queue in all, from the SES send quota
+    """
+    quota = ses.get_send_quota()
+    return quota['MaxSendRate'] * SES_SHARE, int(quota['Max24HourSend'] - quota['SentLast24Hours'])
+
+
+def redrive(bucket, queue_url, since=None, subject=None, rate=None, dry_run=False):
+    """
+    Queues the archived dead letters matching since and subject on queue_url again, once per (subject, email).
+    The queueing rate is the lower of rate and the SES_SHARE of the SES send rate, and stops at the remaining daily
+    SES quota, sqs_to_ses sends as fast as messages arrive.
+
+    Returns:
+        Dict of counts: read, matched, duplicates, skipped (no recipient), queued (would be queued on a dry run),
+        failed and over_quota
+    """
+    s3 = aws_clients.client('s3')
+    sqs = aws_clients.client('sqs')
+    ses_rate, remaining = ses_budget(aws_clients.client('ses'))
+    rate = min(rate, ses_rate) if rate else ses_rate
+    since_ms = since.timestamp() * 1000 if since else None
+    counts = dict.fromkeys(('read', 'matched', 'duplicates', 'skipped', 'queued', 'failed', 'over_quota'), 0)
+    seen = set()
+    batch = []
+    start = time.monotonic()
+
+    def send(entries):
+        # paced on the messages queued so far, a batch waits until the rate allows all of it
+        delay = start + (counts['queued'] + counts['failed'] + len(entries)) / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        failed = response.get('Failed', [])
+        for failure in failed:
+            log.warning('Redrive entry failed', id=failure['Id'], code=failure.get('Code'),
+                        error=failure.get('Message'))
+        counts['failed'] += len(failed)
+        counts['queued'] += len(entries) - len(failed)
+
+    for record in iter_archived(s3, bucket, since, subject):
+        counts['read'] += 1
+        record_subject = (record.get('messageAttributes') or {}).get('subject', {}).get('stringValue')
+        email = (record.get('messageAttributes') or {}).get('email', {}).get('stringValue')
+        if (subject and record_subject != subject) or \
+                (since_ms and int(record['attributes']['SentTimestamp']) < since_ms):
+            continue
+        counts['matched'] += 1
+        if not email or not record_subject:
+            # a transactional email, it belongs on TransactionalEmailQueue and is not a MARADMIN to resend
+            counts['skipped'] += 1
+            continue
+        if (record_subject, email) in seen:
+            counts['duplicates'] += 1
+            continue
+        seen.add((record_subject, email))
+        if counts['queued'] + len(batch) >= remaining:
+            counts['over_quota'] += 1
+            continue
+        if dry_run:
+            counts['queued'] += 1
+            continue
+
+        entry = {'Id': str(len(batch)), 'MessageBody': record['body'], 'MessageAttributes': message_attributes(record)}
+        if batch and (len(batch) == BATCH_ENTRIES or sum(map(entry_bytes, batch)) + entry_bytes(entry) > BATCH_BYTES):
+            send(batch)
+            batch = []
+            entry['Id'] = '0'
+        batch.append(entry)
+    if batch:
+        send(batch)
+
+    log.info('Redrive dry run' if dry_run else 'Redrive complete', rate=rate, **counts)
+    return counts
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    """
+    Invoked by hand, e.g. {"days": 2, "subject": "MARADMIN 001/25", "rate": 5, "dry_run": true}.
+    """
+    since = datetime.now(timezone.utc) - timedelta(days=event['days']) if event.get('days') else None
+    return redrive(os.environ['DlqBucket'], os.environ['SQS_QUEUE'], since=since, subject=event.get('subject'),
+                   rate=event.get('rate'), dry_run=event.get('dry_run', False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Queue archived dead letters for sqs_to_ses again.")
+    parser.add_argument("bucket", help="MaradminDlqBucket name.")
+    parser.add_argument("queue_url", help="MaradminSqsQueue URL.")
+    parser.add_argument("--days", type=int, help="Only dead letters first queued in the last DAYS days.")
+    parser.add_argument("--subject", help="Only dead letters of this MARADMIN subject.")
+    parser.add_argument("--rate", type=float, help="Messages per second, at most half the SES send rate.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be queued without queueing it.")
+    args = parser.parse_args()
+
+    since = datetime.now(timezone.utc) - timedelta(days=args.days) if args.days else None
+    print(json.dumps(redrive(args.bucket, args.queue_url, since=since, subject=args.subject, rate=args.rate,
+                             dry_run=args.dry_run)))
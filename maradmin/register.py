@@ -1,7 +1,9 @@
 from yattag import Doc
 
+from maradmin_globals import make_page, html_response, PUBLIC_CACHE_CONTROL
 
-def lambda_handler(event, context):
+
+def build_register_page():
     page_title = 'MARADMIN'
     doc, tag, text, line = Doc().ttl()
 
@@ -58,6 +60,14 @@ def lambda_handler(event, context):
                                                 line('a', 'Privacy Policy',
                                                      href='https://s3.amazonaws.com/com.christopherbreen.static/maradmin/privacy.html')
                                             doc.stag('br')
+                                            with tag('label', ('for', 'filters')):
+                                                text('Topics (optional)')
+                                            doc.stag('input', ('id', 'filters'), ('aria-describedby', 'filters_help'),
+                                                     type='text', klass='form-control', name='filters', placeholder='all')
+                                            with tag('small', ('id', 'filters_help'), klass='form-text text-muted'):
+                                                text(
+                                                    'Comma separated MOSs (0311), MCCs (MCC 013) or keywords (reserve, PME). Leave blank to receive every MARADMIN.')
+                                            doc.stag('br')
                                             line('button', 'Submit', type='submit', klass='btn btn-primary')
                                 with tag('div', klass='card-footer text-muted text-center'):
                                     text(
@@ -69,12 +79,12 @@ def lambda_handler(event, context):
                  integrity="sha384-B4gt1jrGC7Jh4AgTPSdUtOBvfO8shuf57BaghqFfPlYxofvL8/KUEfYiJOMMV+rV",
                  crossorigin="anonymous")
 
-    html_result = doc.getvalue()
+    return doc.getvalue()
 
-    return {
-        'statusCode': "200",
-        'body': html_result,
-        'headers': {
-            'Content-Type': 'text/html',
-        }
-    }
+
+# the form has no per-request content, build it once per container
+REGISTER_PAGE = make_page(build_register_page())
+
+
+def lambda_handler(event, context):
+    return html_response(event, REGISTER_PAGE, PUBLIC_CACHE_CONTROL)
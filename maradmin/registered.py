@@ -1,11 +1,13 @@
-import boto3
 import os
-import json
 
-from urllib.parse import unquote
-from boto3.dynamodb.conditions import Key
+from urllib.parse import unquote, unquote_plus
+from botocore.exceptions import ClientError
 
-from maradmin_globals import get_token, sanitized_email, build_webpage
+from maradmin_globals import sanitized_email, webpage, html_response, conditional_check_failed, verification_link, \
+    queue_transactional_email
+from routing import parse_filters
+import aws_clients
+import log
 
 
 def lambda_handler(event, context):
@@ -20,75 +22,42 @@ def lambda_handler(event, context):
             message = f'Search your inbox for a verification email sent from maradmin@christopherbreen.com. ' \
                       f'It is very likely in your junk, spam, or promotions tab (gmail users).'
 
-            if already_verified(email):
-                print(f'Duplicate Registration: {email}')
-            else:
-                print(f'Registering: {email}')
-
-                # store information to subscriber table
-                email_token = get_token()
-                verification_link = f'https://maradmin.christopherbreen.com/verify?email={email}&email_token={email_token}'
-                user_data = {
-                    'email': email,
-                    'verified': 'False',
-                    'email_token': email_token
-                }
-                db = boto3.resource('dynamodb')
-                table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
+            log.info('Registering', email=email)
+
+            # store information to subscriber table
+            user_data = {
+                'email': email,
+                'verified': 'False',
+                # routing terms, indexed once the email is verified
+                'filters': parse_filters(unquote_plus(event['queryStringParameters'].get('filters') or ''))
+            }
+            table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+            try:
+                # a single conditional write replaces the lookup for an existing verified subscriber
                 db_response = table.put_item(
-                    Item=user_data
+                    Item=user_data,
+                    ConditionExpression='attribute_not_exists(email) OR verified <> :verified',
+                    ExpressionAttributeValues={':verified': 'True'}
                 )
-                # Log to CloudWatch
-                print('Dynamo Response:', db_response)
+            except ClientError as err:
+                if not conditional_check_failed(err):
+                    raise
+                log.info('Duplicate registration', email=email)
+            else:
 
                 # send verification email
                 html_msg = '<samp><p>Greetings,</p>' \
                            '<p>Thank you for subscribing to the MARADMIN Notifications service.</p>'
                 if domain not in ['mil', 'gov']:
-                    html_msg += f'<p>Please verify your email by visiting {verification_link}</p>'
+                    html_msg += f'<p>Please verify your email by visiting {verification_link(email)}</p>'
                 else:
                     html_msg += f'<p>Please reply to this email and change the subject to SUBSCRIBE to complete the verification process.</p>'
 
-                ses = boto3.client('ses')
-                ses_response = ses.send_templated_email(
-                    Source='"MARADMIN" <maradmin@christopherbreen.com>',
-                    ReplyToAddresses=['maradmin@christopherbreen.com'],
-                    Destination={
-                        'ToAddresses': [email],
-                        'BccAddresses': ['me@christopherbreen.com']
-                    },
-                    Template='NewSubscriberTemplate',
-                    TemplateData=json.dumps({
-                        'title': 'Email Verification Link to enable MARADMIN Notifications',
-                        'html_msg': html_msg,
-                        'text_msg': html_msg
-                    }),
-                    ConfigurationSetName='maradmin',
-                )
-                # Log to CloudWatch
-                print('SES Response:', ses_response)
+                queue_transactional_email(email, 'Email Verification Link to enable MARADMIN Notifications',
+                                          html_msg, html_msg)
 
     except (KeyError, ValueError, TypeError) as err:
-        print(err)
-
-    html_result = build_webpage('MARADMIN', card_title, card_subtitle, message)
-
-    return {
-        'statusCode': "200",
-        'body': html_result,
-        'headers': {
-            'Content-Type': 'text/html',
-        }
-    }
+        log.warning('Invalid registration request', **log.exception_fields(err))
 
+    return html_response(event, webpage(card_title, card_subtitle, message))
 
-def already_verified(email):
-    db = boto3.resource('dynamodb')
-    subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
-    rs = subscriber_table.query(
-        KeyConditionExpression=Key('email').eq(email)
-    )
-    if rs['Count'] > 0 and rs['Items'][0]['verified'] == 'True':
-        return True
-    else:
-        return False
@@ -0,0 +1,39 @@
+import os
+
+import register
+import registered
+import unsubscribe
+import verify
+import aws_clients
+import log
+import profiling
+
+# one function serves the whole sign-up flow, a container warmed by the form stays warm for the submit, the
+# verification link and any later unsubscribe
+ROUTES = {
+    '/register': register.lambda_handler,
+    '/registered': registered.lambda_handler,
+    '/verify': verify.lambda_handler,
+    '/unsubscribe': unsubscribe.lambda_handler,
+}
+
+# created during init, which Lambda runs at full CPU, rather than on the first request
+if 'SUBSCRIBER_TABLE_NAME' in os.environ:
+    aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    # resource is the route API Gateway matched, path is what the browser asked for
+    path = (event.get('resource') or event.get('path') or '').rstrip('/')
+    handler = ROUTES.get(path)
+    if handler is None:
+        log.warning('No route', path=path)
+        return {
+            'statusCode': '404',
+            'body': 'Not Found',
+            'headers': {'Content-Type': 'text/plain'}
+        }
+    return handler(event, context)
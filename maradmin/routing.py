@@ -0,0 +1,219 @@
+import argparse
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from entities import AhoCorasick, normalize_text, _fold, _is_word
+from maradmin_globals import query_verified_emails, verified_shard, VERIFIED_SHARDS
+import aws_clients
+import log
+
+# Every verified subscriber has one row per interest term in the routing table (term HASH, email RANGE).
+# Resolving the recipients of a MARADMIN is then one query per term the MARADMIN contains, so the cost follows
+# the number of matching subscribers rather than the size of the subscriber table.
+ALL = 'ALL'
+# nearly every subscriber is registered under ALL, so its rows are spread over the same shards as
+# VerifiedShardIndex ('ALL#00'..) rather than sharing one partition key
+ALL_PREFIX = 'ALL#'
+MOS_PREFIX = 'MOS#'
+MCC_PREFIX = 'MCC#'
+KEYWORD_PREFIX = 'KW#'
+MAX_FILTERS = 20
+
+# registered keywords are kept in a single row so sns_to_sqs can find them in the MARADMIN text without
+# knowing anything about the subscribers. backfill marks the same row with the LAYOUT it indexed once every verified
+# subscriber is indexed, until then sns_to_sqs sends to every verified subscriber rather than to an incomplete index.
+VOCABULARY_KEY = {'term': '#VOCABULARY', 'email': '#KEYWORDS'}
+# how terms are stored, raise it whenever that changes so the index is rebuilt before it is routed through again.
+# 1 kept ALL in a single partition, 2 spreads it over the ALL# shards (the earlier boolean backfilled is ignored)
+LAYOUT = 2
+
+_MOS_RGX = re.compile(r'^(?:P?MOS\s*[:#]?\s*)?(\d{4})$')
+_MCC_RGX = re.compile(r'^MCC\s*[:#]?\s*([A-Z0-9]{3})$')
+_KEYWORD_RGX = re.compile(r'^[A-Z0-9][A-Z0-9 .&/-]{1,38}[A-Z0-9]$')
+
+
+def routing_table():
+    """
+    Returns the routing table, or None when topic filters are not enabled for this deployment.
+    """
+    table_name = os.environ.get('ROUTING_TABLE_NAME')
+    if not table_name:
+        return None
+    return aws_clients.table(table_name)
+
+
+def parse_filters(user_input):
+    """
+    Turns the comma separated filters a subscriber typed into routing terms.
+
+    Four digit codes (optionally prefixed with MOS/PMOS) are MOSs, 'MCC 013' style entries are MCCs, 'all'
+    subscribes to everything and anything else is a keyword. Entries that cannot be used are dropped.
+
+    Returns:
+        Sorted list of terms, [ALL] if nothing usable was supplied
+    """
+    terms = set()
+    for entry in (user_input or '').split(','):
+        entry = ' '.join(_fold(entry).split())
+        if not entry:
+            continue
+        if entry == ALL:
+            return [ALL]
+        mobj = _MOS_RGX.match(entry)
+        if mobj:
+            terms.add(MOS_PREFIX + mobj.group(1))
+            continue
+        mobj = _MCC_RGX.match(entry)
+        if mobj:
+            terms.add(MCC_PREFIX + mobj.group(1))
+            continue
+        if _KEYWORD_RGX.match(entry):
+            terms.add(KEYWORD_PREFIX + entry)
+    if not terms:
+        return [ALL]
+    return sorted(terms)[:MAX_FILTERS]
+
+
+def message_terms(entities, text, keywords):
+    """
+    Routing terms present in a MARADMIN.
+
+    Args:
+        entities: output of entities.extract_entities for the MARADMIN
+        text: MARADMIN body, searched for the registered keywords
+        keywords: registered keywords (upper case, without prefix)
+
+    Returns:
+        Sorted list of terms, always including ALL
+    """
+    terms = {ALL}
+    terms.update(MOS_PREFIX + code for code in entities.get('mos', []))
+    terms.update(MCC_PREFIX + code for code in entities.get('mcc', []))
+    if keywords:
+        automaton = AhoCorasick()
+        for keyword in keywords:
+            automaton.add(keyword, keyword)
+        automaton.build()
+        normalized = normalize_text(text)
+        terms.update(
+            KEYWORD_PREFIX + keyword
+            for start, end, keyword in automaton.iter(normalized)
+            if _is_word(normalized, start, end)
+        )
+    return sorted(terms)
+
+
+def routing_state(table):
+    """
+    Returns:
+        Tuple of the registered keywords (upper case, without prefix) and whether backfill has completed for the
+        current LAYOUT
+    """
+    item = table.get_item(Key=VOCABULARY_KEY).get('Item') or {}
+    return sorted(item.get('keywords', [])), item.get('backfilled_layout') == LAYOUT
+
+
+def all_shard_terms():
+    return [f'{ALL_PREFIX}{shard:02d}' for shard in range(VERIFIED_SHARDS)]
+
+
+def stored_term(term, email):
+    # the row key a subscriber's term is stored under
+    return f'{ALL_PREFIX}{verified_shard(email)}' if term == ALL else term
+
+
+def index_subscriber(table, email, terms):
+    keywords = set(term[len(KEYWORD_PREFIX):] for term in terms if term.startswith(KEYWORD_PREFIX))
+    with table.batch_writer() as batch:
+        for term in terms:
+            batch.put_item(Item={'term': stored_term(term, email), 'email': email})
+    if keywords:
+        table.update_item(
+            Key=VOCABULARY_KEY,
+            UpdateExpression='ADD keywords :keywords',
+            ExpressionAttributeValues={':keywords': keywords}
+        )
+    log.info('Indexed subscriber', email=email, terms=terms)
+
+
+def unindex_subscriber(table, email, terms):
+    # keywords stay in the vocabulary, a keyword nobody is registered for simply resolves to no recipients
+    with table.batch_writer() as batch:
+        for term in terms:
+            batch.delete_item(Key={'term': stored_term(term, email), 'email': email})
+    log.info('Removed subscriber', email=email, terms=terms)
+
+
+def resolve_recipients(table, terms):
+    """
+    Union of the subscribers registered under any of the terms, one paginated query per term (ALL being one per
+    shard) run concurrently.
+    """
+    # boto3 clients are thread safe, the table resource is not
+    dynamodb = aws_clients.client('dynamodb')
+
+    def query_term(term):
+        emails = []
+        paginator = dynamodb.get_paginator('query')
+        for page in paginator.paginate(
+                TableName=table.name,
+                KeyConditionExpression='term = :term',
+                ExpressionAttributeValues={':term': {'S': term}},
+                ProjectionExpression='email'
+        ):
+            emails.extend(item['email']['S'] for item in page['Items'])
+        return emails
+
+    stored = sorted(set(stored for term in terms
+                        for stored in (all_shard_terms() if term == ALL else [term])))
+    with ThreadPoolExecutor(max_workers=min(len(stored), 16) or 1) as executor:
+        return sorted(set(email for emails in executor.map(query_term, stored) for email in emails))
+
+
+def backfill(subscriber_table_name, routing_table_name):
+    """
+    Indexes every verified subscriber, those that never registered filters receive everything, then marks the
+    routing table as complete so sns_to_sqs starts routing through it. Run it once after deploying the routing
+    table, and again after changing how terms are stored (ALL rows written before sharding are no longer read).
+    """
+    subscriber_table = aws_clients.table(subscriber_table_name)
+    table = aws_clients.table(routing_table_name)
+    # counted before indexing, subscribers verified meanwhile are indexed by verify and only add to count
+    verified = count_verified(subscriber_table_name)
+    count = 0
+    for email in query_verified_emails(subscriber_table_name):
+        subscriber = subscriber_table.get_item(Key={'email': email})['Item']
+        index_subscriber(table, subscriber['email'], subscriber.get('filters', [ALL]))
+        count += 1
+    if count < verified:
+        raise RuntimeError(f'Indexed {count} of {verified} verified subscribers, the routing table is not marked '
+                           f'backfilled. Run migrate_verified_shards.py and then backfill again.')
+    table.update_item(
+        Key=VOCABULARY_KEY,
+        UpdateExpression='SET backfilled_layout = :layout',
+        ExpressionAttributeValues={':layout': LAYOUT}
+    )
+    print(f'Backfilled {count} subscribers')
+
+
+def count_verified(subscriber_table_name):
+    """
+    Verified subscribers in the base table, independent of either verified index.
+    """
+    paginator = aws_clients.client('dynamodb').get_paginator('scan')
+    return sum(page['Count'] for page in paginator.paginate(
+        TableName=subscriber_table_name,
+        Select='COUNT',
+        FilterExpression='verified = :verified',
+        ExpressionAttributeValues={':verified': {'S': 'True'}}
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index existing verified subscribers in the routing table.")
+    parser.add_argument("subscriber_table", help="SubscriberTable name.")
+    parser.add_argument("routing_table", help="RoutingTable name.")
+    args = parser.parse_args()
+
+    backfill(args.subscriber_table, args.routing_table)
@@ -1,20 +1,21 @@
 import json
 import xml.etree.ElementTree as ET
 import re
-import boto3
 import os
 import time
-from openai import OpenAI
-from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
 
 from boto3.dynamodb.conditions import Key
-
+from entities import extract_entities, format_entities
+from browser_fetch import extract_body
+import aws_clients
+import log
+import profiling
+import metrics
+import tracing
+
+# every invocation fetches the RSS feed with requests, openai and selenium are only imported on the paths that
+# use them (a new MARADMIN, a blocked request), most invocations find nothing new and skip their import time
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, WebDriverException
 
 
 # from maradmin_globals import publish_error_sns
@@ -35,14 +36,14 @@ def get_openai_api_key():
                 raise ValueError("OPENAI_API_KEY environment variable not set for local testing")
         else:
             # Running in Lambda, fetch from SSM
-            ssm = boto3.client('ssm')
+            ssm = aws_clients.client('ssm')
             param_name = os.environ.get('OPENAI_API_KEY_PARAM', '/maradmin/openai-api-key')
 
             try:
                 response = ssm.get_parameter(Name=param_name, WithDecryption=True)
                 _openai_api_key = response['Parameter']['Value']
             except Exception as e:
-                print(f"Error fetching API key from SSM: {e}")
+                log.error('Error fetching API key from SSM', **log.exception_fields(e))
                 raise
 
     return _openai_api_key
@@ -83,21 +84,22 @@ def fetch_rss_feed(url):
     }
     session.headers.update(headers)
 
-    print(f'[DEBUG] Fetching RSS feed with cache-busting headers from: {url}')
+    log.debug('Fetching RSS feed with cache-busting headers', url=url)
     response = session.get(url, timeout=600)  # 10 minute timeout
-    print(f'[DEBUG] RSS feed response status code: {response.status_code}')
 
     # Log cache-related response headers
     cache_headers = ['Cache-Control', 'Age', 'X-Cache', 'CF-Cache-Status', 'Expires', 'Last-Modified', 'ETag']
-    for header in cache_headers:
-        if header in response.headers:
-            print(f'[DEBUG] Response header {header}: {response.headers[header]}')
+    log.debug('RSS feed response', status_code=response.status_code,
+              headers={header: response.headers[header] for header in cache_headers if header in response.headers})
 
     response.raise_for_status()
 
     return response.text
 
 
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
 def lambda_handler(event, context):
     url = f'https://www.marines.mil/DesktopModules/ArticleCS/RSS.ashx?ContentType=6&Site=481&max=20&category=14336'
 
@@ -107,19 +109,18 @@ def lambda_handler(event, context):
     except requests.exceptions.HTTPError as err:
         if err.response and err.response.status_code == 403:
             # received 403 forbidden, we are being throttled
-            print('[WARNING] Received HTTP 403 Forbidden Error fetching RSS feed.')
+            log.warning('Received HTTP 403 Forbidden Error fetching RSS feed')
             return {"statusCode": 500}
         else:
             raise
     except requests.exceptions.RequestException as err:
-        print(f'[WARNING] Request error fetching RSS feed: {err}')
+        log.warning('Request error fetching RSS feed', **log.exception_fields(err))
         return {"statusCode": 500}
     except Exception:
         raise
     else:
         try:
             root = ET.fromstring(response)
-            print('Successfully retrieved RSS Feed')
 
             # Log RSS feed metadata for debugging cache issues
             channel = root[0]
@@ -132,13 +133,14 @@ def lambda_handler(event, context):
                 elif elem.tag == 'lastBuildDate':
                     last_build_date = elem.text
 
-            print(f'[DEBUG] RSS Feed pubDate: {pub_date}')
-            print(f'[DEBUG] RSS Feed lastBuildDate: {last_build_date}')
+            log.info('Retrieved RSS feed', pub_date=pub_date, last_build_date=last_build_date)
 
         except ET.ParseError:
-            print('ParseError: ' + response)
+            log.error('RSS feed is not valid XML', body=response)
             raise
 
+        maradmin_table = aws_clients.table(os.environ['MARADMIN_TABLE_NAME'])
+
         # iterate in reverse to ensure errors (particularly 403) mid-way do not prevent poll from instantiating scraper
         # at the next interval.
         for child in reversed(root[0]):
@@ -153,60 +155,61 @@ def lambda_handler(event, context):
                 if item['desc']:
                     # check to see if msg already exists (via description as it includes DTG and MARADMIN #, therefore ensuring uniqueness)
                     # title's have a much higher probability of being duplicated at some point
-                    db = boto3.resource('dynamodb')
-                    maradmin_table = db.Table(os.environ['MARADMIN_TABLE_NAME'])
                     rs = maradmin_table.query(
                         Select='COUNT',
                         KeyConditionExpression=Key('desc').eq(item['desc'])
                     )
                     if rs['Count'] == 0:  # or debug:
-                        print('NEW: ' + item['desc'])
-                        print('Fetching: ' + item['link'])
+                        log.info('New MARADMIN', desc=item['desc'], link=item['link'])
+                        trace_context = tracing.start(item['desc'], item['pub_date'])
                         # message is new, get contents and broadcast
                         try:
-                            full_body = fetch_page_with_curl_headers(item['link'])
-                            start = full_body.find('<div class="body-text">')
-                            end = full_body.find('</div>', start)
-                            body = full_body[start + len('<div class="body-text">'):end]
                             # body is HTML portion of the page trimmed down to just the MARADMIN itself.
+                            body = fetch_maradmin_body(item['link'])
+
+                            # units, MCCs, UICs and MOSs are extracted locally rather than by the LLM so the
+                            # list is deterministic and stored alongside the item
+                            item['entities'] = extract_entities(body)
 
                             try:
-                                bluf = generate_bluf(body)
+                                with metrics.timer('BlufGeneration'):
+                                    bluf = generate_bluf(body)
                             except Exception as e:
-                                print(f'[ERROR] Failed to generate BLUF for {item["link"]}: {type(e).__name__} - {e}')
+                                log.error('Failed to generate BLUF', link=item['link'], **log.exception_fields(e))
                                 bluf = '<p>BLUF: Unable to generate summary.</p>'
+                            bluf += format_entities(item['entities'])
 
                             try:
-                                publish_sns(item, bluf, body)
+                                publish_sns(item, bluf, body, trace_context)
                             except Exception as e:
-                                print(f'[ERROR] Failed to publish to SNS for {item["link"]}: {type(e).__name__} - {e}')
+                                log.error('Failed to publish to SNS', link=item['link'], **log.exception_fields(e))
                                 raise
 
                             try:
                                 maradmin_table.put_item(Item=item)
                             except Exception as e:
-                                print(f'[ERROR] Failed to save to DynamoDB for {item["link"]}: {type(e).__name__} - {e}')
+                                log.error('Failed to save to DynamoDB', link=item['link'], **log.exception_fields(e))
                                 raise
                         except requests.exceptions.HTTPError as e:
                             # HTTPError from fetch - check if 403
                             if hasattr(e, 'response') and e.response and e.response.status_code == 403:
-                                print(f'[WARNING] Unable to fetch MARADMIN {item["desc"]} due to 403 after retries')
-                                print(f'[WARNING] Will retry on next poll cycle (every 15 minutes)')
+                                log.warning('Unable to fetch MARADMIN due to 403 after retries, will retry on next '
+                                            'poll cycle (every 15 minutes)', desc=item['desc'])
                                 # Exit gracefully - return success so no alarms are triggered
                                 return {"statusCode": 200}
                             else:
                                 # Other HTTP errors should still raise
                                 raise
                     else:
-                        print('EXISTING: ' + item['desc'])
+                        log.sampled('Existing MARADMIN', desc=item['desc'])
                 else:
-                    print('[WARNING] Empty description encountered, skipping this item.')
+                    log.warning('Empty description encountered, skipping this item')
         return {"statusCode": 200}
 
 
-def publish_sns(item, bluf, body):
+def publish_sns(item, bluf, body, trace_context=None):
     sns_topic = os.environ['SNS_TOPIC']
-    sns = boto3.client('sns')
+    sns = aws_clients.client('sns')
     title = constrain_sub(item['title'])
     link = item['link']
     text_msg = f'{title} {link}'
@@ -216,7 +219,19 @@ def publish_sns(item, bluf, body):
         'sms': text_msg[:1600]  # max 1,600 characters
     }
 
-    max_bytes = 262144  # 256 KB
+    # entities travel as a message attribute so sns_to_sqs can route on them, attributes count toward the limit
+    message_attributes = {
+        'entities': {
+            'DataType': 'String',
+            'StringValue': json.dumps(item.get('entities', {}))
+        }
+    }
+    if trace_context:
+        message_attributes[tracing.ATTRIBUTE] = tracing.message_attribute(trace_context)
+    attributes_bytes = sum(len(name.encode('utf-8')) + len(attr['DataType']) + len(attr['StringValue'].encode('utf-8'))
+                           for name, attr in message_attributes.items())
+
+    max_bytes = 262144 - attributes_bytes  # 256 KB, less the message attributes
     footer     = f'...<br />Message Truncated.  Visit {link} to read the entire message.'
     footer_b   = footer.encode('utf-8')
 
@@ -249,13 +264,15 @@ def publish_sns(item, bluf, body):
     #     print(f'[DEBUG] Final SNS size {len(message_b)} B (limit {max_bytes})')
     #     return
 
-    response = sns.publish(
-        TopicArn=sns_topic,
-        Message=message_b.decode('utf-8'),
-        Subject=title,
-        MessageStructure='json'
-    )
-    print(f'Published {title} to SNS, Response:{response}')
+    with metrics.timer('SnsPublish'):
+        response = sns.publish(
+            TopicArn=sns_topic,
+            Message=message_b.decode('utf-8'),
+            Subject=title,
+            MessageStructure='json',
+            MessageAttributes=message_attributes
+        )
+    log.info('Published to SNS', title=title, message_id=response['MessageId'], size=len(message_b))
     return response
 
 
@@ -273,163 +290,108 @@ def constrain_sub(orig_title):
         return 'A new MARADMIN has been published'
 
 
-def fetch_page_with_curl_headers(link, rate_limit_delay=2.0):
+def fetch_maradmin_body(link, rate_limit_delay=2.0):
     """
-    Fetch a page, first trying requests with browser-like headers, then falling back to Selenium if blocked.
-    Site uses Akamai CDN which may block requests that don't look like real browsers.
+    Fetch a MARADMIN, first trying requests with browser-like headers, then falling back to the browser_fetch
+    worker if blocked. Site uses Akamai CDN which may block requests that don't look like real browsers.
 
     Args:
         link: URL to fetch
         rate_limit_delay: Delay in seconds before first request to avoid rate limiting (default: 2.0)
 
     Returns:
-        Response text with '(slash)' replaced by '/'
+        The body-text fragment of the page, the MARADMIN itself, with '(slash)' replaced by '/'
 
     Raises:
         requests.exceptions.HTTPError: For non-transient HTTP errors (including 403 after both attempts)
-        TimeoutException: If Selenium fallback times out
-        WebDriverException: For browser-related errors in Selenium fallback
+        RuntimeError: If the browser fallback failed
     """
     # Add delay to avoid Akamai rate limiting on rapid successive requests
     if rate_limit_delay > 0:
         time.sleep(rate_limit_delay)
 
-    # First attempt: Use requests with browser-like headers
-    print(f'[DEBUG] Attempting to fetch with requests library: {link}')
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-User': '?1',
-            'Sec-Fetch-Dest': 'document'
-        }
-        response = requests.get(link, headers=headers, timeout=30)
-
-        # Check if we got blocked
-        if response.status_code == 403 or 'Access Denied' in response.text:
-            print(f'[DEBUG] Requests blocked (status {response.status_code}), falling back to Selenium')
-        else:
-            response.raise_for_status()
-            print(f'[DEBUG] Successfully fetched with requests ({len(response.text)} characters)')
-            return response.text.replace('(slash)', '/')
-    except Exception as e:
-        print(f'[DEBUG] Requests failed: {type(e).__name__} - {e}, falling back to Selenium')
-
-    # Second attempt: Use Selenium with headless Chrome (single attempt)
-    print(f'[DEBUG] Attempting to fetch with Selenium: {link}')
-    driver = None
-    try:
+    # timed from the first attempt, a page the browser had to fetch counts the blocked request as well
+    with metrics.timer('PageFetch', Method='HTTP') as dimensions:
+        # First attempt: Use requests with browser-like headers
+        log.debug('Fetching with requests', link=link)
+        try:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Upgrade-Insecure-Requests': '1',
+                'Sec-Fetch-Site': 'none',
+                'Sec-Fetch-Mode': 'navigate',
+                'Sec-Fetch-User': '?1',
+                'Sec-Fetch-Dest': 'document'
+            }
+            response = requests.get(link, headers=headers, timeout=30)
 
-            # Set up Chrome options for headless browsing
-            chrome_options = Options()
-            chrome_options.add_argument('--headless=new')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            chrome_options.add_experimental_option('useAutomationExtension', False)
-
-            # In Lambda, use the Chrome binary from the layer
-            if os.environ.get('AWS_EXECUTION_ENV'):
-                # Chrome for Testing layer paths for x86_64
-                # LD_LIBRARY_PATH is set in template.yaml to include /opt/lib for NSS/X11 libraries
-                chrome_options.binary_location = '/opt/chrome/chrome'
-                chrome_options.add_argument('--single-process')
-                chrome_options.add_argument('--disable-gpu')
-                chrome_options.add_argument('--window-size=1920,1080')
-                chrome_options.add_argument('--disable-software-rasterizer')
-                chrome_options.add_argument('--disable-setuid-sandbox')
-                chrome_options.add_argument('--disable-dev-tools')
-                chrome_options.add_argument('--no-zygote')
-                chrome_options.add_argument('--disable-extensions')
-
-                # Debug: Check if files exist in layer
-                print(f'[DEBUG] /opt contents: {os.listdir("/opt") if os.path.exists("/opt") else "NOT FOUND"}')
-                if os.path.exists('/opt/chrome'):
-                    print(f'[DEBUG] /opt/chrome contents: {os.listdir("/opt/chrome")}')
-                if os.path.exists('/opt/chromedriver'):
-                    print(f'[DEBUG] /opt/chromedriver contents: {os.listdir("/opt/chromedriver")}')
-
-                # Check chromedriver dependencies
-                import subprocess
-                try:
-                    result = subprocess.run(['ldd', '/opt/chromedriver/chromedriver'],
-                                          capture_output=True, text=True, timeout=5)
-                    print(f'[DEBUG] chromedriver dependencies:\n{result.stdout}')
-                except Exception as e:
-                    print(f'[DEBUG] Could not check chromedriver dependencies: {e}')
-
-                # Use chromedriver from the layer
-                service = Service(executable_path='/opt/chromedriver/chromedriver')
-                driver = webdriver.Chrome(service=service, options=chrome_options)
+            # Check if we got blocked
+            if response.status_code == 403 or 'Access Denied' in response.text:
+                log.debug('Requests blocked, falling back to Selenium', status_code=response.status_code)
             else:
-                # Running locally, let Selenium find chromedriver automatically
-                # Make sure chromedriver is installed and in PATH
-                driver = webdriver.Chrome(options=chrome_options)
+                response.raise_for_status()
+                log.debug('Fetched with requests', characters=len(response.text))
+                return extract_body(response.text)
+        except Exception as e:
+            log.debug('Requests failed, falling back to Selenium', **log.exception_fields(e))
 
-            # Mask automation detection
-            driver.execute_cdp_cmd('Network.setUserAgentOverride', {
-                "userAgent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
-            })
-            driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        dimensions['Method'] = 'Selenium'
+        return fetch_with_browser_worker(link)
 
-            # Navigate to page
-            driver.get(link)
 
-            # Wait for page to load (Akamai JS challenges need time)
-            time.sleep(5)
-
-            # Get page source
-            page_source = driver.page_source
-
-            # Check if we got blocked
-            if 'Access Denied' in page_source:
-                print(f'[ERROR] Access Denied page received from Selenium for URL {link}')
-                error = requests.exceptions.HTTPError(f'403 Client Error: Forbidden for url: {link}')
-                # Create a mock response object
-                class MockResponse:
-                    status_code = 403
-                error.response = MockResponse()
-                raise error
-
-            print(f'[DEBUG] Successfully fetched page with Selenium ({len(page_source)} characters)')
-            return page_source.replace('(slash)', '/')
-
-    except TimeoutException as e:
-        print(f'[ERROR] Browser timeout for URL: {link}')
-        raise
-
-    except WebDriverException as e:
-        print(f'[ERROR] WebDriver error for URL {link}: {e}')
-        raise
+def fetch_with_browser_worker(link):
+    """
+    Fetch the MARADMIN with headless Chrome, in the browser_fetch function so only blocked fetches pay for the
+    Chrome layer's memory and cold start. Locally the browser runs in process.
 
-    except Exception as e:
-        print(f'[ERROR] Unexpected error fetching URL {link}: {type(e).__name__} - {e}')
-        raise
+    Returns:
+        The body-text fragment
 
-    finally:
-        # Always close the browser
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+    Raises:
+        requests.exceptions.HTTPError: 403 when the browser was refused as well
+        RuntimeError: If the browser_fetch function failed
+    """
+    log.debug('Fetching with the browser_fetch worker', link=link)
+    payload = {'link': link, 'correlation_id': log.correlation_id()}
+    if os.environ.get('AWS_EXECUTION_ENV') is None:
+        import browser_fetch
+        response = browser_fetch.lambda_handler(payload, None)
+    else:
+        client = aws_clients.client('lambda', aws_clients.SYNCHRONOUS_INVOKE_CONFIG)
+        invoke_response = client.invoke(
+            FunctionName=os.environ['BROWSER_FETCH_FUNCTION'],
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload)
+        )
+        response = json.loads(invoke_response['Payload'].read())
+        if 'FunctionError' in invoke_response:
+            raise RuntimeError(f'Browser fetch failed for {link}: {response}')
+
+    if response['statusCode'] == 403:
+        error = requests.exceptions.HTTPError(f'403 Client Error: Forbidden for url: {link}')
+        # Create a mock response object
+        class MockResponse:
+            status_code = 403
+        error.response = MockResponse()
+        raise error
+
+    log.debug('Fetched with Selenium', characters=len(response['body']))
+    return response['body']
 
 
 def generate_bluf(body):
-    print(f'[DEBUG] Calling LLM for BLUF')
+    from openai import OpenAI
+    from openai.types.chat import ChatCompletionSystemMessageParam, ChatCompletionUserMessageParam
+
+    log.debug('Calling LLM for BLUF')
     # Extract the BLUF from the body
     system_prompt = (
         "Provide a short, military style BLUF summary of this MARADMIN. It should be one paragraph max, plain text with no headers or formatting. "
         "Prefix your response with 'BLUF: ', and get right to the point, i.e. do not include statements like 'This MARADMIN is about...'. "
-        "If you find what appears to be military units, MCCs, UICs, etc., include an alphabetical list in the summary on a single line, "
-        "comma seperated, but omit this line entirely if it's not relevant to the MARADMIN. Note that MCC and UIC are three digits. "
-        "If it's four digits, it's likely an MOS.")
+        "Do not list military units, MCCs, UICs or MOSs, those are extracted separately.")
     
     # Get API key from SSM Parameter Store
     api_key = get_openai_api_key()
@@ -444,7 +406,7 @@ def generate_bluf(body):
     )
 
     response = completion.choices[0].message.content
-    print(f'[DEBUG] LLM returned BLUF')
+    log.debug('LLM returned BLUF')
     return '<p>' + response + '</p>'
 
 
@@ -0,0 +1,310 @@
+# The 'maradmin' configuration set publishes every bounce, complaint and delivery to SesFeedbackTopic, which
+# SesFeedbackQueue delivers here in batches. A subscriber that reaches a limit below is marked undeliverable: the row
+# goes back to verified = 'False' and loses verified_shard, which takes it out of VerifiedShardIndex, and its routing
+# rows are removed, so no broadcast is queued for it again. Registering and verifying again clears the mark.
+#   HARD_BOUNCE_LIMIT=1    permanent bounces, the mailbox does not exist or SES suppresses it
+#   SOFT_BOUNCE_LIMIT=5    consecutive transient bounces (mailbox full, message too large), a delivery to the
+#                          address starts the count again
+#   COMPLAINT_LIMIT=1      the subscriber reported a MARADMIN as spam
+# Per-domain counts of every outcome are kept in DeliveryStatsTable by day, report them with
+#   python ses_feedback.py <DeliveryStatsTable name> --days 30
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from maradmin_globals import conditional_check_failed, email_domain
+import aws_clients
+import log
+import metrics
+import profiling
+import routing
+
+HARD_BOUNCES = 'hard_bounces'
+SOFT_BOUNCES = 'soft_bounces'
+COMPLAINTS = 'complaints'
+DELIVERED = 'delivered'
+OUTCOMES = (DELIVERED, HARD_BOUNCES, SOFT_BOUNCES, COMPLAINTS)
+
+LIMITS = {
+    HARD_BOUNCES: int(os.environ.get('HARD_BOUNCE_LIMIT', '1')),
+    SOFT_BOUNCES: int(os.environ.get('SOFT_BOUNCE_LIMIT', '5')),
+    COMPLAINTS: int(os.environ.get('COMPLAINT_LIMIT', '1')),
+}
+STATS_RETENTION_DAYS = 90
+# BatchGetItem limit
+BATCH_GET_KEYS = 100
+
+
+def feedback(ses_event):
+    """
+    Returns:
+        Tuple of the outcome (one of OUTCOMES) and the recipients it applies to, (None, []) for other event types
+    """
+    event_type = ses_event.get('eventType')
+    if event_type == 'Bounce':
+        bounce = ses_event['bounce']
+        # Undetermined bounces are counted as transient, SES could not tell
+        outcome = HARD_BOUNCES if bounce['bounceType'] == 'Permanent' else SOFT_BOUNCES
+        return outcome, [recipient['emailAddress'] for recipient in bounce['bouncedRecipients']]
+    if event_type == 'Complaint':
+        return COMPLAINTS, [recipient['emailAddress'] for recipient in ses_event['complaint']['complainedRecipients']]
+    if event_type == 'Delivery':
+        return DELIVERED, ses_event['delivery']['recipients']
+    return None, []
+
+
+def tally(records):
+    """
+    Counts the outcomes in a batch of SQS records so each subscriber and each domain is written once per batch.
+    Events are taken in the order SES recorded them, the queue does not keep it.
+
+    Returns:
+        Tuple of {email: Counter of outcomes}, {email: [SQS message ids]} and {(domain, date): Counter of outcomes}.
+        A subscriber's DELIVERED is 1 when the batch delivered to it, its soft bounces are then only those after
+        the last delivery.
+    """
+    events = []
+    for record in records:
+        ses_event = json.loads(record['body'])
+        if ses_event.get('Type') == 'Notification':
+            # a subscription without RawMessageDelivery wraps the event in the SNS envelope
+            ses_event = json.loads(ses_event['Message'])
+        mail_timestamp = ses_event.get('mail', {}).get('timestamp', '')
+        timestamp = ses_event.get(str(ses_event.get('eventType')).lower(), {}).get('timestamp', mail_timestamp)
+        events.append((timestamp, mail_timestamp[:10], record['messageId'], ses_event))
+
+    subscribers = {}
+    message_ids = {}
+    domains = {}
+    for _, date, message_id, ses_event in sorted(events, key=lambda event: event[0]):
+        outcome, emails = feedback(ses_event)
+        for email in emails:
+            domains.setdefault((email_domain(email), date), Counter())[outcome] += 1
+            counts = subscribers.setdefault(email, Counter())
+            if outcome == DELIVERED:
+                counts[DELIVERED] = 1
+                counts.pop(SOFT_BOUNCES, None)
+            else:
+                counts[outcome] += 1
+            message_ids.setdefault(email, []).append(message_id)
+    return subscribers, message_ids, domains
+
+
+def record_feedback(table, email, counts, now):
+    """
+    Adds a subscriber's bounces and complaints to its row. After a delivery the soft bounces are replaced rather
+    than added to.
+
+    Returns:
+        The outcome whose limit a verified subscriber has reached, None while it is under every limit or is not
+        a subscriber at all
+    """
+    counts = dict(counts)
+    assignments = ['last_feedback = :now']
+    if counts.pop(DELIVERED, 0):
+        assignments.append(f'{SOFT_BOUNCES} = :{SOFT_BOUNCES}')
+        values = {f':{SOFT_BOUNCES}': counts.pop(SOFT_BOUNCES, 0)}
+    else:
+        values = {}
+    values.update({f':{outcome}': count for outcome, count in counts.items()})
+    additions = ' ADD ' + ', '.join(f'{outcome} :{outcome}' for outcome in counts) if counts else ''
+    try:
+        response = table.update_item(
+            Key={'email': email},
+            UpdateExpression='SET ' + ', '.join(assignments) + additions,
+            ConditionExpression='attribute_exists(email)',
+            ExpressionAttributeValues={':now': now, **values},
+            ReturnValues='ALL_NEW'
+        )
+    except ClientError as err:
+        if not conditional_check_failed(err):
+            raise
+        # unsubscribed since the send, the update must not recreate the row
+        return None
+    item = response['Attributes']
+    if item.get('verified') != 'True':
+        return None
+    return next((outcome for outcome, limit in LIMITS.items() if item.get(outcome, 0) >= limit), None)
+
+
+def soft_bouncing(table, emails):
+    """
+    Reads the soft bounces of the rows of emails, so a delivery only costs a write for a subscriber that has some.
+
+    Returns:
+        {email: soft bounces} of the rows that have soft bounces
+    """
+    resource = aws_clients.resource('dynamodb')
+    emails = list(emails)
+    found = {}
+    for start in range(0, len(emails), BATCH_GET_KEYS):
+        request = {table.name: {'Keys': [{'email': email} for email in emails[start:start + BATCH_GET_KEYS]],
+                                'ProjectionExpression': f'email, {SOFT_BOUNCES}'}}
+        attempt = 0
+        while request:
+            if attempt:
+                # keys left unprocessed by throttling
+                time.sleep(0.05 * 2 ** attempt)
+            response = resource.batch_get_item(RequestItems=request)
+            found.update({item['email']: item[SOFT_BOUNCES] for item in response['Responses'].get(table.name, [])
+                          if item.get(SOFT_BOUNCES)})
+            request = response.get('UnprocessedKeys')
+            attempt += 1
+    return found
+
+
+def reset_soft_bounces(table, email, soft_bounces):
+    try:
+        table.update_item(
+            Key={'email': email},
+            UpdateExpression=f'REMOVE {SOFT_BOUNCES}',
+            # a bounce recorded since the read is not lost
+            ConditionExpression=f'{SOFT_BOUNCES} = :seen',
+            ExpressionAttributeValues={':seen': soft_bounces}
+        )
+    except ClientError as err:
+        if not conditional_check_failed(err):
+            raise
+
+
+def mark_undeliverable(table, email, reason, now):
+    """
+    Takes a subscriber out of VerifiedShardIndex and the routing table.
+
+    Returns:
+        True if this call marked it, False if it was no longer a verified subscriber
+    """
+    try:
+        response = table.update_item(
+            Key={'email': email},
+            UpdateExpression=f'SET verified = :false, undeliverable = :reason, undeliverable_at = :now '
+                             f'REMOVE verified_shard, {HARD_BOUNCES}, {SOFT_BOUNCES}, {COMPLAINTS}',
+            ConditionExpression='verified = :true',
+            ExpressionAttributeValues={':false': 'False', ':true': 'True', ':reason': reason, ':now': now},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as err:
+        if not conditional_check_failed(err):
+            raise
+        return False
+    routing_table = routing.routing_table()
+    if routing_table:
+        routing.unindex_subscriber(routing_table, email, response['Attributes'].get('filters', [routing.ALL]))
+    log.info('Subscriber undeliverable', email=email, reason=reason)
+    return True
+
+
+def record_domain_stats(table, domains):
+    # DeliveryStatsTable's time to live attribute
+    expires_at = int(time.time()) + STATS_RETENTION_DAYS * 86400
+    for (domain, date), counts in domains.items():
+        table.update_item(
+            Key={'domain': domain, 'date': date},
+            UpdateExpression='SET expires_at = :expires_at ADD ' + ', '.join(
+                f'{outcome} :{outcome}' for outcome in counts),
+            ExpressionAttributeValues={':expires_at': expires_at,
+                                       **{f':{outcome}': count for outcome, count in counts.items()}}
+        )
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    """
+    Applies a batch of SES feedback events. The records of a subscriber whose write failed are reported back and
+    delivered again, the domain statistics only count the records that will not be.
+    """
+    subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+    subscribers, message_ids, domains = tally(event['Records'])
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    failed = set()
+    undeliverable = 0
+    delivered = []
+    for email, counts in subscribers.items():
+        if set(counts) == {DELIVERED}:
+            delivered.append(email)
+            continue
+        try:
+            reason = record_feedback(subscriber_table, email, counts, now)
+            if reason and mark_undeliverable(subscriber_table, email, reason, now):
+                undeliverable += 1
+        except Exception as err:
+            log.error('Failed to record feedback', email=email, **log.exception_fields(err))
+            failed.update(message_ids[email])
+
+    # deliveries alone only reset soft bounces
+    try:
+        resets = soft_bouncing(subscriber_table, delivered)
+    except Exception as err:
+        log.error('Failed to read soft bounces', emails=len(delivered), **log.exception_fields(err))
+        resets = {}
+        failed.update(message_id for email in delivered for message_id in message_ids[email])
+    for email, soft_bounces in resets.items():
+        try:
+            reset_soft_bounces(subscriber_table, email, soft_bounces)
+        except Exception as err:
+            log.error('Failed to reset soft bounces', email=email, **log.exception_fields(err))
+            failed.update(message_ids[email])
+
+    if failed:
+        _, _, domains = tally(record for record in event['Records'] if record['messageId'] not in failed)
+    try:
+        record_domain_stats(aws_clients.table(os.environ['DELIVERY_STATS_TABLE']), domains)
+    except Exception as err:
+        # statistics are not worth delivering feedback twice for
+        log.warning('Failed to record domain statistics', **log.exception_fields(err))
+
+    totals = Counter()
+    for counts in domains.values():
+        totals.update(counts)
+    for outcome in OUTCOMES:
+        metrics.put('SesFeedback', totals[outcome], metrics.COUNT, Outcome=outcome)
+    metrics.put('UndeliverableSubscribers', undeliverable, metrics.COUNT)
+    log.info('Recorded feedback', records=len(event['Records']), undeliverable=undeliverable, resets=len(resets),
+             failed=len(failed), **totals)
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed)]}
+
+
+def domain_report(table_name, days):
+    """
+    Returns:
+        Per domain totals of the last days days, busiest domain first
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d')
+    table = aws_clients.table(table_name)
+    totals = {}
+    kwargs = {'FilterExpression': Attr('date').gte(since)}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response['Items']:
+            totals.setdefault(item['domain'], Counter()).update(
+                {outcome: int(item.get(outcome, 0)) for outcome in OUTCOMES})
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return sorted(totals.items(), key=lambda domain: -sent(domain[1]))
+
+
+def sent(counts):
+    # a complaint follows a delivery of the same message
+    return counts[DELIVERED] + counts[HARD_BOUNCES] + counts[SOFT_BOUNCES]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Delivery, bounce and complaint counts per recipient domain.")
+    parser.add_argument("table", help="DeliveryStatsTable name.")
+    parser.add_argument("--days", type=int, default=30, help="Days to report on (default 30).")
+    args = parser.parse_args()
+
+    print(f'{"domain":<30} {"sent":>8} {"hard":>6} {"soft":>6} {"spam":>6} {"bounce":>7}')
+    for domain, counts in domain_report(args.table, args.days):
+        bounces = counts[HARD_BOUNCES] + counts[SOFT_BOUNCES]
+        print(f'{domain:<30} {sent(counts):>8} {counts[HARD_BOUNCES]:>6} {counts[SOFT_BOUNCES]:>6} '
+              f'{counts[COMPLAINTS]:>6} {bounces / max(sent(counts), 1):>7.2%}')
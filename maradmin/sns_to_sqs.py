@@ -1,57 +1,101 @@
-import boto3
+import json
 import os
+import time
 
 from boto3.dynamodb.conditions import Key
 
+from maradmin_globals import query_verified_emails
+import aws_clients
+import log
+import profiling
+import metrics
+import pacing
+import routing
+import tracing
 
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
 def lambda_handler(event, context):
     # print(f'Event:{event}')  # sns_to_sqs is only fired once per new maradmin
-    sqs = boto3.client('sqs')
-    db = boto3.resource('dynamodb')
-    subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
-    done = False
-    start_key = None
+    sqs = aws_clients.client('sqs')
+    sns_record = event['Records'][0]['Sns']
+    subject = sns_record['Subject']
+    # sqs_to_ses logs each recipient's send under the broadcast's correlation id
+    trace_attributes = {'correlation_id': {'DataType': 'String', 'StringValue': log.correlation_id()}} \
+        if log.correlation_id() else {}
+    # carries the time SNS accepted the broadcast on to sqs_to_ses
+    trace_context = tracing.from_sns(sns_record)
+    if trace_context:
+        trace_attributes[tracing.ATTRIBUTE] = tracing.message_attribute(trace_context)
+
+    count = 0
+    start = time.perf_counter()
+    # interleaved by domain, and delayed per domain when DOMAIN_CONCURRENCY is set
+    for email, delay in pacing.configured_schedule(iter_recipients(event)):
+        sqs_response = sqs.send_message(
+            QueueUrl=os.environ['SQS_QUEUE'],
+            MessageBody=sns_record['Message'],
+            DelaySeconds=delay,
+            MessageAttributes={
+                'email': {
+                    'DataType': 'String',
+                    'StringValue': email
+                },
+                'subject': {
+                    'DataType': 'String',
+                    'StringValue': subject
+                },
+                # 'email_token': {
+                #     'DataType': 'String',
+                #     'StringValue': email_token
+                # }
+                **trace_attributes
+            }
+        )
+        count += 1
+        log.sampled('Queued recipient', subject=subject, email=email, message_id=sqs_response['MessageId'])
+
+    # measured from the start of recipient resolution, the rate is what a subscriber at the back of the queue sees
+    seconds = time.perf_counter() - start
+    metrics.put('EnqueuedMessages', count, metrics.COUNT)
+    if count:
+        metrics.put('EnqueueRate', round(count / seconds, 1), metrics.COUNT_PER_SECOND)
+    log.info('Queued broadcast', subject=subject, recipients=count, seconds=round(seconds, 3))
+    return {"statusCode": 200}
+
+
+def iter_recipients(event):
+    """
+    Yields the email addresses that should receive the MARADMIN in the SNS event.
+
+    With topic filters enabled (ROUTING_TABLE_NAME set and the routing table backfilled) only subscribers
+    registered under ALL or under a term found in the MARADMIN are returned, otherwise every verified subscriber is.
+    """
+    sns_record = event['Records'][0]['Sns']
 
     if 'Developer' in event:
         # use custom formatted sns_input.json for testing new features to prevent mass-emailing subscriber table
-        query_kwargs = {
-            'KeyConditionExpression': Key('email').eq('breencp@gmail.com')
-        }
-    else:
-        query_kwargs = {
-            'IndexName': 'VerifiedIndex',
-            'KeyConditionExpression': Key('verified').eq('True')
-        }
-
-    while not done:
-        if start_key:
-            query_kwargs['ExclusiveStartKey'] = start_key
-        db_response = subscriber_table.query(**query_kwargs)
-        start_key = db_response.get('LastEvaluatedKey', None)
-        done = start_key is None
+        subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+        db_response = subscriber_table.query(KeyConditionExpression=Key('email').eq('breencp@gmail.com'))
         for item in db_response['Items']:
-            email = item['email']
-            # email_token = item['email_token']
-            subject = event['Records'][0]['Sns']['Subject']
-            sqs_response = sqs.send_message(
-                QueueUrl=os.environ['SQS_QUEUE'],
-                MessageBody=event['Records'][0]['Sns']['Message'],
-                MessageAttributes={
-                    'email': {
-                        'DataType': 'String',
-                        'StringValue': email
-                    },
-                    'subject': {
-                        'DataType': 'String',
-                        'StringValue': subject
-                    },
-                    # 'email_token': {
-                    #     'DataType': 'String',
-                    #     'StringValue': email_token
-                    # }
-                }
-            )
-            # Log CloudWatch
-            print(f'Adding {subject} for {email} to SQS, Response:{sqs_response}')
+            yield item['email']
+        return
 
-    return {"statusCode": 200}
+    routing_table = routing.routing_table()
+    if routing_table:
+        keywords, backfilled = routing.routing_state(routing_table)
+        if backfilled:
+            attribute = sns_record.get('MessageAttributes', {}).get('entities')
+            entities = json.loads(attribute['Value']) if attribute else {}
+            terms = routing.message_terms(entities, sns_record['Message'], keywords)
+            recipients = routing.resolve_recipients(routing_table, terms)
+            log.info('Routing broadcast', subject=sns_record['Subject'], recipients=len(recipients), terms=terms)
+            yield from recipients
+            return
+        # an empty or partial index would silently drop subscribers
+        log.warning('Routing table has not been backfilled, sending to every verified subscriber. '
+                    'Run routing.py to enable topic filters.')
+
+    yield from query_verified_emails(os.environ['SUBSCRIBER_TABLE_NAME'])
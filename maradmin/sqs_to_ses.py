@@ -1,26 +1,58 @@
-import boto3
 import json
+import time
 
+from botocore.exceptions import ClientError
 
+from maradmin_globals import unsubscribe_link
+import aws_clients
+import log
+import profiling
+import metrics
+import tracing
+
+# SES reports both the maximum send rate and the daily quota as Throttling, SQS redelivers the message after its
+# visibility timeout
+SES_THROTTLING_CODES = ('Throttling', 'ThrottlingException')
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
 def lambda_handler(event, context):
     email = event['Records'][0]['messageAttributes']['email']['stringValue']
     html_msg = event['Records'][0]['body']
     subject = event['Records'][0]['messageAttributes']['subject']['stringValue']
-    ses = boto3.client('ses')
+    ses = aws_clients.client('ses')
     template_data = json.dumps({
         'title': subject,
         'html_msg': html_msg,
         'email': email,
+        'unsubscribe_link': unsubscribe_link(email),
     })
-    ses_response = ses.send_templated_email(
-        Source='"MARADMIN" <maradmin@christopherbreen.com>',
-        ReplyToAddresses=['maradmin@christopherbreen.com'],
-        Destination={'ToAddresses': [email]},
-        Template='MaradminTemplate',
-        TemplateData=template_data,
-        ConfigurationSetName='maradmin',
-    )
-    # log response to CloudWatch (keep in production)
-    print(f'Emailing {subject} to {email}, Response: {ses_response}')
+    start = time.perf_counter()
+    try:
+        ses_response = ses.send_templated_email(
+            Source='"MARADMIN" <maradmin@christopherbreen.com>',
+            ReplyToAddresses=['maradmin@christopherbreen.com'],
+            Destination={'ToAddresses': [email]},
+            Template='MaradminTemplate',
+            TemplateData=template_data,
+            ConfigurationSetName='maradmin',
+        )
+    except ClientError as err:
+        if err.response['Error']['Code'] in SES_THROTTLING_CODES:
+            metrics.put('SesThrottles', 1, metrics.COUNT)
+        raise
+    # includes the retries botocore makes on throttling
+    latencies = {'SesSendLatency': round((time.perf_counter() - start) * 1000, 1)}
+    trace_context = tracing.from_sqs(event['Records'][0])
+    properties = None
+    if trace_context:
+        # one record per recipient, latency_report.py takes each broadcast's percentiles over them
+        latencies.update(tracing.stage_latencies(trace_context, tracing.now_ms()))
+        properties = {'maradmin_id': trace_context['maradmin_id'], 'subject': subject}
+    metrics.put_values(latencies, properties=properties)
+    # one line per recipient of every broadcast, sampled
+    log.sampled('Emailed recipient', subject=subject, email=email, ses_message_id=ses_response['MessageId'])
 
     return {"statusCode": 200}
@@ -0,0 +1,80 @@
+# Trace context following a MARADMIN from the RSS feed to each subscriber's inbox. The scraper starts it when it
+# detects the MARADMIN, it travels as the 'trace' message attribute on the SNS message and on every SQS message
+# sns_to_sqs queues, and sqs_to_ses turns it into per-stage latencies once the email is handed to SES.
+import json
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+ATTRIBUTE = 'trace'
+# in the order a MARADMIN goes through them
+STAGES = ('Detection', 'Publish', 'FanOut', 'Delivery')
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def pub_date_ms(pub_date):
+    """
+    The RSS pubDate (RFC 822) in epoch milliseconds, None when it cannot be parsed.
+    """
+    try:
+        return int(parsedate_to_datetime(pub_date).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+def start(maradmin_id, pub_date):
+    return {'maradmin_id': maradmin_id, 'published_ms': pub_date_ms(pub_date), 'detected_ms': now_ms()}
+
+
+def message_attribute(context):
+    return {'DataType': 'String', 'StringValue': json.dumps(context)}
+
+
+def from_sns(sns_record):
+    """
+    The trace context of an SNS record with the time SNS accepted the message added, None for an untraced message.
+    """
+    attribute = (sns_record.get('MessageAttributes') or {}).get(ATTRIBUTE)
+    if not attribute:
+        return None
+    context = json.loads(attribute['Value'])
+    timestamp = sns_record.get('Timestamp')
+    if timestamp:
+        context['broadcast_ms'] = int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000)
+    return context
+
+
+def from_sqs(sqs_record):
+    """
+    The trace context of an SQS record with the time it was queued added, None for an untraced message.
+    """
+    attribute = (sqs_record.get('messageAttributes') or {}).get(ATTRIBUTE)
+    if not attribute:
+        return None
+    context = json.loads(attribute['stringValue'])
+    context['queued_ms'] = int(sqs_record['attributes']['SentTimestamp'])
+    return context
+
+
+def stage_latencies(context, delivered_ms):
+    """
+    Milliseconds spent in each stage, for the stages whose boundaries are known, and TimeToInbox from publication
+    (from detection when the pubDate could not be parsed).
+    """
+    boundaries = [context.get('published_ms'), context.get('detected_ms'), context.get('broadcast_ms'),
+                  context.get('queued_ms'), delivered_ms]
+    latencies = {}
+    for stage, begin, end in zip(STAGES, boundaries, boundaries[1:]):
+        if begin is not None and end is not None:
+            # pubDate has a resolution of a minute, clocks of different hosts are not exactly in step
+            latencies[stage] = max(0, end - begin)
+    origin = context.get('published_ms') or context['detected_ms']
+    latencies['TimeToInbox'] = max(0, delivered_ms - origin)
+    return latencies
+
+
+def slowest_stage(latencies):
+    return max((stage for stage in STAGES if stage in latencies), key=latencies.get, default=None)
@@ -0,0 +1,47 @@
+import json
+
+import aws_clients
+import log
+import profiling
+
+
+def send(message):
+    ses = aws_clients.client('ses')
+    return ses.send_templated_email(
+        Source='"MARADMIN" <maradmin@christopherbreen.com>',
+        ReplyToAddresses=['maradmin@christopherbreen.com'],
+        Destination={'ToAddresses': [message['email']], 'BccAddresses': ['me@christopherbreen.com']},
+        Template='NewSubscriberTemplate',
+        TemplateData=json.dumps({
+            'title': message['title'],
+            'html_msg': message['html_msg'],
+            'text_msg': message['text_msg']
+        }),
+        ConfigurationSetName='maradmin',
+    )
+
+
+@log.correlated
+@profiling.profiled
+@aws_clients.reports_construction_time
+def lambda_handler(event, context):
+    """
+    Sends the verification and confirmation emails queued by queue_transactional_email.
+
+    Only the messages that failed are reported back, SQS retries those and moves them to the dead letter queue
+    once maxReceiveCount is reached, the rest of the batch is not sent twice.
+    """
+    failures = []
+    for record in event['Records']:
+        try:
+            message = json.loads(record['body'])
+            ses_response = send(message)
+        except Exception as err:
+            log.warning('Failed to send transactional email', message_id=record['messageId'],
+                        receive_count=record['attributes']['ApproximateReceiveCount'], **log.exception_fields(err))
+            failures.append({'itemIdentifier': record['messageId']})
+        else:
+            log.info('Sent transactional email', title=message['title'], email=message['email'],
+                     ses_message_id=ses_response['MessageId'])
+
+    return {'batchItemFailures': failures}
@@ -1,10 +1,13 @@
-from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 
-import boto3
 import os
 from urllib.parse import unquote
-from maradmin_globals import sanitized_email, sanitized_token, build_webpage
+from maradmin_globals import sanitized_email, webpage, html_response, sanitized_token, conditional_check_failed, \
+    is_signed_token, valid_signed_token, UNSUBSCRIBE_PURPOSE
 import json
+import aws_clients
+import log
+import routing
 
 
 def lambda_handler(event, context):
@@ -22,39 +25,47 @@ def lambda_handler(event, context):
             email, domain = sanitized_email(unquote(email_param))
             email_token = sanitized_token(token_param)
 
-            if email and email_token:
-                db = boto3.resource('dynamodb')
-                subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
-                rs = subscriber_table.query(KeyConditionExpression=Key('email').eq(email))
-                if rs['Items'] and rs['Items'][0]['email_token'] == email_token:
+            if email and email_token and is_signed_token(email_token) \
+                    and not valid_signed_token(email, UNSUBSCRIBE_PURPOSE, email_token):
+                # rejected without touching the subscriber table
+                log.info('Failed unsubscribe, invalid signature', email=email)
+            elif email and email_token:
+                delete_kwargs = {
+                    'Key': {
+                        'email': email
+                    },
+                    'ReturnValues': 'ALL_OLD'
+                }
+                if not is_signed_token(email_token):
+                    # legacy token stored with the subscription, the token check and the delete are a single
+                    # conditional write
+                    delete_kwargs['ConditionExpression'] = 'email_token = :email_token'
+                    delete_kwargs['ExpressionAttributeValues'] = {':email_token': email_token}
+                subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+                try:
+                    db_response = subscriber_table.delete_item(**delete_kwargs)
+                except ClientError as err:
+                    if not conditional_check_failed(err):
+                        raise
+                    log.info('Failed unsubscribe, incorrect token or unknown email', email=email)
+                else:
                     card_title = 'Unsubscribed'
                     card_subtitle = 'Successfully removed'
                     message = 'Was it something we did?  You have been successfully unsubscribed and will no longer ' \
                               'receive MARADMIN Notifications. Please let us know if there was something we could have done better. ' \
                               'Send your feedback to maradmin@christopherbreen.com.'
 
-                    # update verified status in subscriber table
-                    db_response = subscriber_table.delete_item(
-                        Key={
-                            'email': email
-                        }
-                    )
-                    # log to CloudWatch
-                    print(F'WWW-UNSUBSCRIBE: {email} - {db_response}')
+                    log.info('Web unsubscribe', email=email, existed='Attributes' in db_response)
 
+                    routing_table = routing.routing_table()
+                    if routing_table and db_response.get('Attributes', {}).get('verified') == 'True':
+                        routing.unindex_subscriber(routing_table, email,
+                                                   db_response['Attributes'].get('filters', [routing.ALL]))
         except Exception as e:
-            print(json.dumps(context))
+            log.error('Unsubscribe failed', **log.exception_fields(e))
             raise e
 
-    html_result = build_webpage('MARADMIN', card_title, card_subtitle, message)
-
-    return {
-        'statusCode': "200",
-        'body': html_result,
-        'headers': {
-            'Content-Type': 'text/html',
-        }
-    }
+    return html_response(event, webpage(card_title, card_subtitle, message))
 
 
 if __name__ == '__main__':
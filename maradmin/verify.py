@@ -1,7 +1,10 @@
-from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
 from urllib.parse import unquote
-from maradmin_globals import sanitized_email, sanitized_token, build_webpage
-import boto3
+from maradmin_globals import sanitized_email, webpage, html_response, sanitized_token, conditional_check_failed, \
+    is_signed_token, valid_signed_token, VERIFY_PURPOSE, verified_shard
+import aws_clients
+import log
+import routing
 import os
 
 
@@ -12,43 +15,43 @@ def lambda_handler(event, context):
     try:
         email, domain = sanitized_email(unquote(event['queryStringParameters']['email']))
         email_token = sanitized_token(event['queryStringParameters']['email_token'])
-        if email and email_token:
-            # email and token are formatted correctly, let's see if they match
-            db = boto3.resource('dynamodb')
-            subscriber_table = db.Table(os.environ['SUBSCRIBER_TABLE_NAME'])
-            rs = subscriber_table.query(
-                KeyConditionExpression=Key('email').eq(email)
-            )
-            if rs['Items']:
-                if rs['Items'][0]['email_token'] == email_token or rs['Items'][0]['verified'] == 'True':
-                    card_title = 'Success'
-                    card_subtitle = 'Email Verified'
-                    message = 'Be sure to add maradmin@christopherbreen.com to your contacts list and feel ' \
-                              'free to reach out anytime at that same address.  Enjoy!'
-
-                    # update verified status in subscriber table
-                    subscriber_table.update_item(
-                        Key={'email': email},
-                        UpdateExpression='set verified = :verified',
-                        ExpressionAttributeValues={':verified': 'True'})
-                    print(f'WWW Verified: {email}')
-                else:
-                    print(f'Failed Verification - Incorrect Token: {email}')
+        if email and email_token and is_signed_token(email_token) \
+                and not valid_signed_token(email, VERIFY_PURPOSE, email_token):
+            # rejected without touching the subscriber table
+            log.info('Failed verification, invalid signature', email=email)
+        elif email and email_token:
+            if is_signed_token(email_token):
+                # the signature proves the link, the update only needs the registration to exist
+                condition = 'attribute_exists(email)'
+                expression_values = {':verified': 'True', ':shard': verified_shard(email)}
+            else:
+                # legacy token stored with the registration, the update only applies if they match
+                condition = 'email_token = :email_token OR verified = :verified'
+                expression_values = {':verified': 'True', ':shard': verified_shard(email), ':email_token': email_token}
+            subscriber_table = aws_clients.table(os.environ['SUBSCRIBER_TABLE_NAME'])
+            try:
+                db_response = subscriber_table.update_item(
+                    Key={'email': email},
+                    UpdateExpression='set verified = :verified, verified_shard = :shard',
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=expression_values,
+                    ReturnValues='ALL_OLD')
+            except ClientError as err:
+                if not conditional_check_failed(err):
+                    raise
+                log.info('Failed verification, incorrect token or unknown email', email=email)
             else:
-                print(f'Failed Verification - Unknown Email: {email}')
-    except KeyError as err:
-        print('KeyError')
-    except ValueError as err:
-        print('ValueError')
-    except TypeError as err:
-        print('TypeError')
+                card_title = 'Success'
+                card_subtitle = 'Email Verified'
+                message = 'Be sure to add maradmin@christopherbreen.com to your contacts list and feel ' \
+                          'free to reach out anytime at that same address.  Enjoy!'
+                log.info('Web verified', email=email)
 
-    html_result = build_webpage('MARADMIN', card_title, card_subtitle, message)
+                previous = db_response['Attributes']
+                routing_table = routing.routing_table()
+                if routing_table and previous['verified'] != 'True':
+                    routing.index_subscriber(routing_table, email, previous.get('filters', [routing.ALL]))
+    except (KeyError, ValueError, TypeError) as err:
+        log.warning('Invalid verification request', **log.exception_fields(err))
 
-    return {
-        'statusCode': "200",
-        'body': html_result,
-        'headers': {
-            'Content-Type': 'text/html',
-        }
-    }
+    return html_response(event, webpage(card_title, card_subtitle, message))
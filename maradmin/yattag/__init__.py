@@ -57,6 +57,6 @@ Full tutorial on yattag.org_
 __author__ = "Benjamin Le Forestier (benjamin@leforestier.org)"
 __version__ = '1.14.0'
 
-from yattag.simpledoc import SimpleDoc
+from yattag.simpledoc import SimpleDoc, Template, gzip_chunks
 from yattag.doc import Doc
-from yattag.indentation import indent, NO, FIRST_LINE, EACH_LINE
+from yattag.indentation import indent, iter_indent, NO, FIRST_LINE, EACH_LINE
@@ -1,4 +1,4 @@
-from yattag.simpledoc import dict_to_attrs, html_escape, attr_escape, SimpleDoc, DocError
+from yattag.simpledoc import dict_to_attrs, html_escape, attr_escape, SimpleDoc, DocError, Template
 from typing import Any
 from typing import Dict
 from typing import List
@@ -20,7 +20,8 @@ class SimpleInput(object):
     """
     class representing text inputs, password inputs, hidden inputs etc...
     """
-    
+    __slots__ = ('name', 'tpe', 'attrs')
+
     def __init__(self, name, tpe, attrs):
         # type: (str, str, Dict[str, Union[str, int, float]]) -> None
         self.name = name
@@ -50,6 +51,7 @@ class SimpleInput(object):
         
 
 class CheckableInput(object):
+    __slots__ = ('name', 'rank', 'attrs')
     tpe = 'checkbox'
 
     def __init__(self, name, attrs):
@@ -106,9 +108,10 @@ class CheckableInput(object):
         
 
 class CheckboxInput(CheckableInput):
-    pass
+    __slots__ = ()
     
 class RadioInput(CheckableInput):
+    __slots__ = ()
     tpe = 'radio'
     
     @classmethod
@@ -122,6 +125,7 @@ def groupclass(inputclass):
     # type: (Any) -> Any
 
     class InputGroup(object):
+        __slots__ = ('name', 'n_items')
 
         def __init__(self, name):
             # type: (str) -> None
@@ -138,6 +142,7 @@ def groupclass(inputclass):
     return InputGroup
 
 class ContainerTag(object):
+    __slots__ = ('name', 'attrs')
 
     tag_name = 'textarea' 
 
@@ -168,13 +173,16 @@ class ContainerTag(object):
         return ''.join(lst)
 
 class Textarea(ContainerTag):
-    pass
+    __slots__ = ()
 
 class Select(ContainerTag):
+    __slots__ = ()
     tag_name = 'select'
 
 
 class Option(object):
+    __slots__ = ('name', 'multiple', 'value', 'attrs')
+
     def __init__(self, name, multiple, value, attrs):
         # type: (str, str, Union[str, int, float], Dict[str, Any]) -> None
         self.name = name
@@ -261,6 +269,8 @@ class Doc(SimpleDoc):
     Option = Option
     
     class TextareaTag(object):
+        __slots__ = ('doc', 'name', 'attrs', 'parent_tag', 'position')
+
         def __init__(self, doc, name, attrs):
             # type: (Doc, str, Dict[str, Union[str, int, float]]) -> None
             # name is the name attribute of the textarea, ex: 'contact_message'
@@ -292,6 +302,8 @@ class Doc(SimpleDoc):
                 
     
     class SelectTag(object):
+        __slots__ = ('doc', 'name', 'attrs', 'multiple', 'old_current_select', 'parent_tag', 'position')
+
         def __init__(self, doc, name, attrs):
             # type: (Doc, str, Dict[str, Union[str, int, float]]) -> None
             # name is the name attribute of the select, ex: 'color'
@@ -328,6 +340,8 @@ class Doc(SimpleDoc):
                 
 
     class OptionTag(object):
+        __slots__ = ('doc', 'select', 'attrs', 'value', 'parent_tag', 'position')
+
         def __init__(self, doc, select, value, attrs):
             # type: (Doc, Doc.SelectTag, str, Dict[str, Union[str, int, float]]) -> None
             self.doc = doc
@@ -407,13 +421,14 @@ class Doc(SimpleDoc):
         self.checkbox_group_class = groupclass(self.__class__.CheckboxInput)
         self._fields = set() # type: Set[Any]
         self._detached_errors_pos = [] # type: List[Any]
+        self._detached_errors_streamed = False
     
      
     def input(self, *args, **kwargs):
         # type: (Any, Union[str, int, float]) -> None
         "required attributes: 'name' and 'type'"
         name, type, attrs = _attrs_from_args(('name', 'type'), *args, **kwargs)
-        self._fields.add(name)
+        self._add_field(name)
         if type in (
             'text','file','tel', 'password', 'hidden', 'search', 'email', 'url', 'number',
             'range', 'date', 'datetime', 'datetime-local', 'month', 'week',
@@ -445,14 +460,14 @@ class Doc(SimpleDoc):
         # type: (Any, Union[str, int, float]) -> Doc.TextareaTag
         "required attribute: 'name'"
         name, attrs = _attrs_from_args(('name',), *args, **kwargs)
-        self._fields.add(name)
+        self._add_field(name)
         return self.__class__.TextareaTag(self, name, attrs)
         
     def select(self, *args, **kwargs):
         # type: (Any, Union[str, int, float]) -> Doc.SelectTag
         "required attribute: 'name'"
         name, attrs = _attrs_from_args(('name',), *args, **kwargs)
-        self._fields.add(name)
+        self._add_field(name)
         return self.__class__.SelectTag(self, name, attrs)
         
     def option(self, *args, **kwargs):
@@ -487,11 +502,55 @@ class Doc(SimpleDoc):
         """
         returns the whole document as a string
         """
+        self._render_detached_errors()
+        return ''.join(self.result)
+
+    def compile(self):
+        # type: () -> Template
+        """
+        freezes the document into a Template, see SimpleDoc.compile
+        detached errors are rendered once, at compile time
+        """
+        self._render_detached_errors()
+        return SimpleDoc.compile(self)
+
+    def _finished_end(self, limit = None):
+        # type: (Union[None, int]) -> int
+        # detached errors list the errors of fields added later, so they hold back the output
+        # until the document has no open tag, then they are rendered for good and adding a field
+        # with an error afterwards raises DocError (see _add_field)
+        if self._detached_errors_pos:
+            if isinstance(self.current_tag, SimpleDoc.DocumentRoot):
+                self._render_detached_errors()
+                self._detached_errors_pos = []
+                self._detached_errors_streamed = True
+            else:
+                return SimpleDoc._finished_end(self, self._detached_errors_pos[0][0])
+        return SimpleDoc._finished_end(self, limit)
+
+    def _add_field(self, name):
+        # type: (str) -> None
+        # once streamed, the detached errors can no longer leave out the error of a field added afterwards, it
+        # would be shown twice
+        if self._detached_errors_streamed and name in self.errors and name not in self._fields:
+            raise DocError(
+                "Can't add the field %s, its error was already streamed in the detached errors." % name
+            )
+        self._fields.add(name)
+
+    def _discard(self, count):
+        # type: (int) -> None
+        SimpleDoc._discard(self, count)
+        self._detached_errors_pos = [
+            (position - count, render_function) for position, render_function in self._detached_errors_pos
+        ]
+
+    def _render_detached_errors(self):
+        # type: () -> None
         for position, render_function in self._detached_errors_pos:
             self.result[position] = render_function(
                 dict((name, self.errors[name]) for name in self.errors if name not in self._fields)
             )
-        return ''.join(self.result)
 
 def _add_class(dct, klass):
     # type: (Dict[str, Any], str) -> None
@@ -1,5 +1,9 @@
 import re
+from collections import deque
+from itertools import chain
 from typing import Any
+from typing import Iterable
+from typing import Iterator
 from typing import Dict
 from typing import List
 from typing import Set
@@ -13,7 +17,7 @@ NO = False
 FIRST_LINE = True
 EACH_LINE = 2
 
-__all__ = ['indent', 'NO', 'FIRST_LINE', 'EACH_LINE']
+__all__ = ['indent', 'iter_indent', 'NO', 'FIRST_LINE', 'EACH_LINE']
 
 class TokenMeta(type):
 
@@ -181,9 +185,10 @@ class Tokenizer(object):
 
         return result
 
-tokenize = Tokenizer(
+_tokenizer = Tokenizer(
     (Text, Comment, CData, Doctype, XMLDeclaration, Script, Style, OpenTag, SelfTag, CloseTag, XMLProcessingInstruction)
-).tokenize
+)
+tokenize = _tokenizer.tokenize
 
 class TagMatcher(object):
 
@@ -381,6 +386,324 @@ def indent(string, indentation = '  ', newline = '\n', indent_text = NO, blank_i
             tag_appeared = True
     return ''.join(result)
 
+# Streaming indentation
+# ---------------------
+#
+# iter_indent produces the output of indent() without holding the document in memory. Tokens are
+# read from the input chunks one at a time (a token is held back until its end has been read), and
+# the only structure kept is the stack of open elements plus the tokens following the earliest open
+# tag whose layout is not known yet.
+#
+# indent() needs two facts about an open tag before writing what follows it: whether it is matched
+# by a close tag, and whether it directly contains text. Both are known once the element closes.
+# Void html elements (<br>, <img>...) are settled by the next open or close tag instead: either it
+# is their own close tag (xml style <link>...</link>) or they are standalone.
+# When the held back tokens exceed `lookahead` characters, the earliest open tag is assumed to be
+# matched without direct text (the case of <html>, <body> and other containers of a well-formed
+# document) so memory stays bounded.
+
+VOID_ELEMENTS = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'meta', 'param',
+    'source', 'track', 'wbr'
+))
+
+_TEXT_END = re.compile(r'[<>]')
+_TAG_END = re.compile(r'>')
+_COMMENT_END = re.compile(r'-->')
+_CDATA_END = re.compile(r'\]\]>')
+_RAW_TEXT_START = re.compile(r'<\s*(script|style)(?=[\s>])', re.I)
+_RAW_TEXT_ENDS = {
+    'script': re.compile(Script._end_script, re.I),
+    'style': re.compile(Style._end_style, re.I),
+}
+# characters of the previous input searched again with a new chunk, for a terminator split across chunks
+_OVERLAP = 64
+
+def _missing_end(string, pos):
+    # type: (str, int) -> Any
+    """
+    returns the regex that has to be found in more input before the token
+    starting at `pos` can be matched, None if the token is complete
+    """
+    if string[pos] != '<':
+        return None if _TEXT_END.search(string, pos) else _TEXT_END
+    if string.find('>', pos) == -1:
+        return _TAG_END
+    if string.startswith('<!--', pos):
+        return None if string.find('-->', pos + 4) != -1 else _COMMENT_END
+    if string.startswith('<![CDATA[', pos):
+        return None if string.find(']]>', pos + 9) != -1 else _CDATA_END
+    mobj = _RAW_TEXT_START.match(string, pos)
+    if mobj:
+        end_rgx = _RAW_TEXT_ENDS[mobj.group(1).lower()]
+        return None if end_rgx.search(string, mobj.end()) else end_rgx
+    return None
+
+def _iter_tokens(chunks):
+    # type: (Iterable[str]) -> Iterator[Tuple[str, str, Any]]
+    """
+    yields (token class name, content, tag name) tuples for the concatenation of `chunks`
+    """
+    if not _tokenizer.get_token:
+        _tokenizer._compile_regex()
+    get_token = _tokenizer.get_token
+    string = ''
+    pos = 0
+    pieces = [] # type: List[str]
+    waiting_for = None # type: Any
+    for chunk in chain(chunks, [None]):
+        final = chunk is None
+        if not final:
+            if not chunk:
+                continue
+            if waiting_for is not None:
+                # only the new input is searched, the token may span many chunks
+                tail = (pieces[-1] if pieces else string)[-_OVERLAP:]
+                pieces.append(chunk)
+                if not waiting_for.search(tail + chunk):
+                    continue
+            else:
+                pieces.append(chunk)
+        string = string[pos:] + ''.join(pieces)
+        pos = 0
+        pieces = []
+        waiting_for = None
+        length = len(string)
+        while pos < length:
+            if not final:
+                waiting_for = _missing_end(string, pos)
+                if waiting_for is not None:
+                    break
+            if string.startswith('<![CDATA[', pos):
+                # ends at the first ']]>', where the CData regex would run to the last one read so far
+                end = string.find(']]>', pos + 9)
+                if end != -1:
+                    yield 'CData', string[pos:end + 3], None
+                    pos = end + 3
+                    continue
+            mobj = get_token(string, pos)
+            if mobj is None:
+                if final:
+                    raise XMLTokenError("Unrecognized XML token near %s" % repr(string[pos:pos + 100]))
+                waiting_for = _TAG_END # e.g. a quoted '>' inside an attribute value
+                break
+            name = mobj.lastgroup
+            tag_name_key = getattr(TokenMeta.getclass(name), 'tag_name_key', None)
+            yield name, mobj.group(name), tag_name_key and mobj.group(tag_name_key)
+            pos = mobj.end()
+
+# indices in the records of open tags
+_NAME, _MATCHED, _DIRECT = 0, 1, 2
+# kinds of tokens, as far as indentation is concerned
+_TEXT, _OPEN, _CLOSE, _OTHER = 0, 1, 2, 3
+
+class _StreamIndenter(object):
+    __slots__ = (
+        'indentation', 'newline', 'indent_text', 'blank_is_text', 'lookahead',
+        'pending', 'pending_size', 'stack', 'void', 'void_text',
+        'level', 'sameline', 'was_just_opened', 'tag_appeared', 'out'
+    )
+
+    def __init__(self, indentation, newline, indent_text, blank_is_text, lookahead):
+        # type: (str, str, Any, bool, int) -> None
+        self.indentation = indentation
+        self.newline = newline
+        self.indent_text = indent_text
+        self.blank_is_text = blank_is_text
+        self.lookahead = lookahead
+        # tokens read but not written yet, as (kind, content, open tag record)
+        self.pending = deque() # type: Any
+        self.pending_size = 0
+        # records of open elements: [tag name, matched, directly contains text], None while unknown
+        self.stack = [] # type: List[List[Any]]
+        self.void = None # type: Any
+        self.void_text = False
+        # same state as the indent() loop
+        self.level = 0
+        self.sameline = 0
+        self.was_just_opened = False
+        self.tag_appeared = False
+        self.out = [] # type: List[str]
+
+    def feed(self, token_name, content, tag_name):
+        # type: (str, str, Any) -> None
+        record = None
+        if token_name == 'Text':
+            if not (self.blank_is_text or content.strip()):
+                return
+            if self.void is not None:
+                self.void_text = True
+            elif self.stack and self.stack[-1][_DIRECT] is None:
+                self.stack[-1][_DIRECT] = True
+            kind = _TEXT
+        elif token_name == 'OpenTag':
+            self._settle_void(None)
+            record = [tag_name, None, None]
+            if tag_name.lower() in VOID_ELEMENTS:
+                self.void = record
+                self.void_text = False
+            else:
+                self.stack.append(record)
+            kind = _OPEN
+        elif token_name == 'CloseTag':
+            kind = _CLOSE if self._close(tag_name) else _OTHER
+        else:
+            kind = _OTHER
+        self.pending.append((kind, content, record))
+        self.pending_size += len(content)
+        self.flush(False)
+
+    def _settle_void(self, close_name):
+        # type: (Any) -> bool
+        void = self.void
+        if void is None:
+            return False
+        self.void = None
+        if close_name == void[_NAME] and void[_MATCHED] is None:
+            void[_MATCHED] = True
+            void[_DIRECT] = self.void_text
+            return True
+        void[_MATCHED] = False
+        if self.void_text and self.stack and self.stack[-1][_DIRECT] is None:
+            self.stack[-1][_DIRECT] = True
+        return False
+
+    def _close(self, tag_name):
+        # type: (str) -> bool
+        if self._settle_void(tag_name):
+            return True
+        stack = self.stack
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index][_NAME] == tag_name:
+                record = stack[index]
+                # elements left open inside this one are unmatched, their text belongs to this one
+                for unclosed in stack[index + 1:]:
+                    if unclosed[_MATCHED] is None:
+                        unclosed[_MATCHED] = False
+                        if unclosed[_DIRECT] and record[_DIRECT] is None:
+                            record[_DIRECT] = True
+                if record[_MATCHED] is None:
+                    record[_MATCHED] = True
+                if record[_DIRECT] is None:
+                    record[_DIRECT] = False
+                del stack[index:]
+                return record[_MATCHED]
+        return False
+
+    def flush(self, final):
+        # type: (bool) -> None
+        pending = self.pending
+        while pending:
+            kind, content, record = pending[0]
+            if kind is _OPEN and (record[_MATCHED] is None or record[_DIRECT] is None):
+                if final:
+                    # never closed
+                    if record[_MATCHED] is None:
+                        record[_MATCHED] = False
+                elif self.pending_size > self.lookahead:
+                    if record[_MATCHED] is None:
+                        record[_MATCHED] = record is not self.void
+                    if record[_DIRECT] is None:
+                        record[_DIRECT] = False
+                else:
+                    break
+            pending.popleft()
+            self.pending_size -= len(content)
+            if kind is _OPEN and not record[_MATCHED]:
+                kind = _OTHER
+            self._write(kind, content, record)
+
+    def _indent(self):
+        # type: () -> None
+        if self.tag_appeared:
+            self.out.append(self.newline)
+        if self.level:
+            self.out.append(self.indentation * self.level)
+
+    def _write(self, kind, content, record):
+        # type: (int, str, Any) -> None
+        append = self.out.append
+        if kind is _TEXT:
+            if not self.sameline:
+                self._indent()
+            if self.indent_text is EACH_LINE:
+                append(new_line_rgx.sub(r'\1' + self.indentation * self.level, content))
+            else:
+                append(content)
+            self.was_just_opened = False
+        elif kind is _OPEN:
+            self.was_just_opened = True
+            if self.sameline:
+                self.sameline += 1
+            else:
+                self._indent()
+            if self.indent_text is NO and record[_DIRECT]:
+                self.sameline = self.sameline or 1
+            append(content)
+            self.level += 1
+            self.tag_appeared = True
+        elif kind is _CLOSE:
+            self.level -= 1
+            self.tag_appeared = True
+            if self.sameline:
+                self.sameline -= 1
+            elif not self.was_just_opened:
+                self._indent()
+            append(content)
+            self.was_just_opened = False
+        else:
+            if not self.sameline:
+                self._indent()
+            append(content)
+            self.was_just_opened = False
+            self.tag_appeared = True
+
+def iter_indent(chunks, indentation = '  ', newline = '\n', indent_text = NO, blank_is_text = False,
+                lookahead = 1 << 20):
+    # type: (Iterable[str], str, str, Any, bool, int) -> Iterator[str]
+    """
+    streaming version of `indent`: takes an iterable of strings (chunks of a
+    html or xml document, split anywhere) and yields the well indented
+    document in chunks
+
+    the options are the ones of `indent`, plus:
+    - lookahead: the number of characters that may be held back while waiting
+      to know the layout of an open tag (default 1 MiB)
+
+    memory is bounded by the lookahead, the largest token and the depth of the
+    document, and the time is linear in the size of the document
+
+    the output is the same as the output of `indent` for documents where
+    every element other than void html elements is closed, in order,
+    and for any document shorter than the lookahead that has no misnested tags,
+    except that:
+    - a CDATA section always ends at its first ']]>' (`indent` extends
+      it to the last ']]>' of the document)
+    - a void html element is settled by the next tag, so one closed xml style
+      after child tags is written as a standalone tag and its children are not
+      indented: `<link><b>x</b></link>` gives '<link>\n<b>x</b>\n</link>'
+      where `indent` gives '<link>\n  <b>x</b>\n</link>' (text alone inside
+      it, `<link>x</link>`, is handled like `indent`)
+
+    Example::
+
+        with open('archive.html') as infile, open('indented.html', 'w') as outfile:
+            for chunk in iter_indent(iter(lambda: infile.read(65536), '')):
+                outfile.write(chunk)
+    """
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    indenter = _StreamIndenter(indentation, newline, indent_text, blank_is_text, lookahead)
+    out = indenter.out
+    for token in _iter_tokens(chunks):
+        indenter.feed(*token)
+        if len(out) >= 1024:
+            yield ''.join(out)
+            del out[:]
+    indenter.flush(True)
+    if out:
+        yield ''.join(out)
+
 if __name__ == '__main__':
     import sys
     print(indent(sys.stdin.read()))
@@ -1,7 +1,10 @@
-__all__ = ['SimpleDoc']
+__all__ = ['SimpleDoc', 'Template', 'gzip_chunks']
 
 import re
+import zlib
 from typing import Any
+from typing import Iterable
+from typing import Iterator
 from typing import Callable
 from typing import Dict
 from typing import List
@@ -29,34 +32,41 @@ class SimpleDoc(object):
     """
 
     class Tag(object):
+        __slots__ = ('doc', 'name', 'attrs', 'parent_tag', 'position', 'streamed')
+
         def __init__(self, doc, name, attrs): # name is the tag name (ex: 'div')
             # type: (SimpleDoc, str, Dict[str, Union[str, int, float]]) -> None
 
             self.doc = doc
             self.name = name
             self.attrs = attrs
+            self.streamed = False # start tag already written by iter_chunks
 
         def __enter__(self):
             # type: () -> None
-            self.parent_tag = self.doc.current_tag
-            self.doc.current_tag = self
-            self.position = len(self.doc.result)
-            self.doc._append('')
+            doc = self.doc
+            self.parent_tag = doc.current_tag
+            doc.current_tag = self
+            self.position = len(doc.result)
+            doc._append('')
 
         def __exit__(self, tpe, value, traceback):
             # type: (Any, Any, Any) -> None
             if value is None:
-                if self.attrs:
-                    self.doc.result[self.position] = "<%s %s>" % (
-                        self.name,
-                        dict_to_attrs(self.attrs),
-                    )
-                else:
-                    self.doc.result[self.position] = "<%s>" % self.name
-                self.doc._append("</%s>" % self.name)
-                self.doc.current_tag = self.parent_tag
+                doc = self.doc
+                if not self.streamed:
+                    doc.result[self.position] = self.start_tag()
+                doc._append('</' + self.name + '>')
+                doc.current_tag = self.parent_tag
+
+        def start_tag(self):
+            # type: () -> str
+            if self.attrs:
+                return '<' + self.name + ' ' + dict_to_attrs(self.attrs) + '>'
+            return '<' + self.name + '>'
 
     class DocumentRoot(object):
+        __slots__ = ()
 
         class DocumentRootError(DocError, AttributeError):
             # Raising an AttributeError on __getattr__ instead of just a DocError makes it compatible
@@ -101,6 +111,7 @@ class SimpleDoc(object):
         self._stag_end = stag_end
         self._br = '<br' + stag_end
         self._nl2br = nl2br
+        self._slot_count = 0
 
     def tag(self, tag_name, *args, **kwargs):
         # type: (str, Tuple[str, Union[str, int, float]], Union[str, int, float]) -> Tag
@@ -175,17 +186,17 @@ class SimpleDoc(object):
             'pistachio<br>ice cream'
 
         """
+        if not self._nl2br:
+            for strg in strgs:
+                self._append(html_escape(strg))
+            return
         for strg in strgs:
-            transformed_string = html_escape(strg)
-            if self._nl2br:
-                self._append(
-                    self.__class__._newline_rgx.sub(
-                        self._br,
-                        transformed_string
-                    )
+            self._append(
+                self.__class__._newline_rgx.sub(
+                    self._br,
+                    html_escape(strg)
                 )
-            else:
-                self._append(transformed_string)
+            )
 
     def line(self, tag_name, text_content, *args, **kwargs):
         # type: (str, str, Tuple[str, Union[str, int, float]], Union[str, int, float]) -> None
@@ -278,6 +289,7 @@ class SimpleDoc(object):
             # you get: <td data-search="lemon" data-order="1384">Citrus Limon</td>
 
         """
+        self._check_not_streamed()
         self.current_tag.attrs.update(_attributes(args, kwargs))
 
     def data(self, *args, **kwargs):
@@ -343,13 +355,9 @@ class SimpleDoc(object):
             '<br>'
         """
         if args or kwargs:
-            self._append("<%s %s%s" % (
-                tag_name,
-                dict_to_attrs(_attributes(args, kwargs)),
-                self._stag_end
-            ))
+            self._append('<' + tag_name + ' ' + dict_to_attrs(_attributes(args, kwargs)) + self._stag_end)
         else:
-            self._append("<%s%s" % (tag_name, self._stag_end))
+            self._append('<' + tag_name + self._stag_end)
 
     def cdata(self, strg, safe = False):
         # type: (str, bool) -> None
@@ -376,6 +384,151 @@ class SimpleDoc(object):
         """
         return ''.join(self.result)
 
+    def slot(self, name):
+        # type: (str) -> None
+        """
+        appends a named placeholder for text supplied later, when rendering the
+        compiled document (see the `compile` method)
+        the text is escaped exactly as the `text` method would escape it
+        slots are only allowed in text content, not in attribute values
+        `getvalue` renders slots as empty strings
+
+        Example::
+
+            with tag('h1'):
+                doc.slot('title')
+        """
+        self._slot_count += 1
+        self._append(_Slot(name, self._nl2br))
+
+    def compile(self):
+        # type: () -> Template
+        """
+        freezes the document into a Template made of static string segments and
+        the slots added with the `slot` method
+        build the document once, then render it as many times as needed:
+
+        Example::
+
+            doc, tag, text = SimpleDoc().tagtext()
+            with tag('h1'):
+                doc.slot('title')
+            template = doc.compile()
+
+            template.render(title = 'Hello world!') # '<h1>Hello world!</h1>'
+        """
+        segments = [] # type: List[str]
+        slots = [] # type: List[_Slot]
+        start = 0
+        for position, strg in enumerate(self.result):
+            if isinstance(strg, _Slot):
+                segments.append(''.join(self.result[start:position]))
+                slots.append(strg)
+                start = position + 1
+        segments.append(''.join(self.result[start:]))
+        if len(slots) != self._slot_count:
+            raise DocError(
+                "Slots can't be placed inside form fields (textarea, select, option)"
+                " or in a part of the document that was already streamed."
+            )
+        return Template(segments, slots, self._br)
+
+    def iter_chunks(self, chunk_size = 65536):
+        # type: (int) -> Iterator[str]
+        """
+        yields the part of the document built so far, in strings of about
+        `chunk_size` characters, and removes it from the document
+        fragments are released as they are yielded, so the document never
+        exists twice in memory
+
+        called once the document is complete, it yields the whole document
+        it can also be called while the document is being built, inside `with`
+        blocks, to stream the parts already built. The start tags of the open
+        tags are then written with their current attributes, which can't be
+        changed afterwards (DocError):
+
+        Example::
+
+            with tag('table'):
+                for row in rows:
+                    with tag('tr'):
+                        line('td', row)
+                    for chunk in doc.iter_chunks():
+                        response.write(chunk)
+            for chunk in doc.iter_chunks():
+                response.write(chunk)
+
+        the document must not be modified while iterating
+        `getvalue` only returns what has not been yielded yet
+        """
+        result = self.result
+        end = self._finished_end()
+        batch = [] # type: List[str]
+        size = 0
+        for position in range(end):
+            strg = result[position]
+            result[position] = ''
+            batch.append(strg)
+            size += len(strg)
+            if size >= chunk_size:
+                yield ''.join(batch)
+                batch = []
+                size = 0
+        if batch:
+            yield ''.join(batch)
+        self._discard(end)
+
+    def write_to(self, fileobj, encoding = None, chunk_size = 65536):
+        # type: (Any, Union[None, str], int) -> None
+        """
+        writes the finished part of the document to `fileobj` (see `iter_chunks`)
+        strings are encoded with `encoding` if it is supplied, for binary files
+
+        for gzip output, write to a gzip.GzipFile, which compresses incrementally
+        across calls:
+
+        Example::
+
+            with gzip.GzipFile(fileobj = raw, mode = 'wb') as gz:
+                doc.write_to(gz, encoding = 'utf-8')
+        """
+        for chunk in self.iter_chunks(chunk_size):
+            fileobj.write(chunk.encode(encoding) if encoding else chunk)
+
+    def _open_tags(self):
+        # type: () -> Iterator[Any]
+        tag = self.current_tag
+        while not isinstance(tag, SimpleDoc.DocumentRoot):
+            yield tag
+            tag = tag.parent_tag
+
+    def _finished_end(self, limit = None):
+        # type: (Union[None, int]) -> int
+        # writes the start tags of the open tags and returns the length of the final part of the
+        # result, which ends at `limit` or at the first open tag rendered as a whole when it closes
+        # (the form fields of Doc)
+        end = len(self.result) if limit is None else limit
+        for tag in reversed(list(self._open_tags())):
+            if getattr(tag, 'streamed', False):
+                # already written and discarded, its position is no longer kept up to date
+                continue
+            if tag.position >= end:
+                break
+            if not isinstance(tag, SimpleDoc.Tag):
+                end = tag.position
+                break
+            if not tag.streamed:
+                self.result[tag.position] = tag.start_tag()
+                tag.streamed = True
+        return end
+
+    def _discard(self, count):
+        # type: (int) -> None
+        del self.result[:count]
+        for tag in self._open_tags():
+            if not getattr(tag, 'streamed', False):
+                tag.position -= count
+
     def tagtext(self):
         # type: () -> Tuple[SimpleDoc, Any, Any]
         """
@@ -462,6 +615,13 @@ class SimpleDoc(object):
         self._set_classes(classes)
 
 
+    def _check_not_streamed(self):
+        # type: () -> None
+        if getattr(self.current_tag, 'streamed', False):
+            raise DocError(
+                "Can't change the attributes of <%s>, its start tag was already streamed." % self.current_tag.name
+            )
+
     def _get_classes(self):
         # type: () -> Set[str]
         try:
@@ -473,6 +633,7 @@ class SimpleDoc(object):
 
     def _set_classes(self, classes_set):
         # type: (Set[str]) -> None
+        self._check_not_streamed()
         if classes_set:
             self.current_tag.attrs['class'] = ' '.join(classes_set)
         else:
@@ -481,8 +642,83 @@ class SimpleDoc(object):
             except KeyError:
                 pass
 
+def gzip_chunks(chunks, encoding = 'utf-8', compresslevel = 9):
+    # type: (Iterable[str], str, int) -> Iterator[bytes]
+    """
+    gzip encodes an iterable of strings incrementally, for instance the chunks
+    of `SimpleDoc.iter_chunks`, and yields the compressed bytes
+
+    Example::
+
+        body = b''.join(gzip_chunks(doc.iter_chunks()))
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31) # 31: gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Slot(str):
+    # an empty string, so that getvalue still works, remembering the slot name
+    # and the nl2br setting of the document it was added to
+
+    def __new__(cls, name, nl2br):
+        # type: (str, bool) -> _Slot
+        slot = str.__new__(cls, '')
+        slot.name = name
+        slot.nl2br = nl2br
+        return slot
+
+
+class Template(object):
+
+    """
+    a compiled document: static segments with escaped slot insertions between them
+    rendering is a single join, no tag or attribute processing takes place
+
+    template = doc.compile()
+    html = template.render(title = 'Hello world!')
+    """
+
+    _newline_rgx = SimpleDoc._newline_rgx
+
+    def __init__(self, segments, slots, br = '<br />'):
+        # type: (List[str], List[Any], str) -> None
+        assert len(segments) == len(slots) + 1
+        self.segments = segments
+        self.slots = [(slot.name, slot.nl2br) for slot in slots]
+        self._br = br
+
+    def render(self, **values):
+        # type: (Union[str, int, float]) -> str
+        """
+        returns the document with each slot replaced with the escaped value of
+        the keyword argument of the same name
+        a KeyError is raised if a slot has no value
+        """
+        segments = self.segments
+        parts = [segments[0]]
+        for index, (name, nl2br) in enumerate(self.slots):
+            escaped = html_escape(values[name])
+            if nl2br:
+                escaped = self._newline_rgx.sub(self._br, escaped)
+            parts.append(escaped)
+            parts.append(segments[index + 1])
+        return ''.join(parts)
+
+
+# Escaping checks for the special characters before replacing them: most text and attribute values contain
+# none, and `in` scans are cheaper than building new strings. This measured faster than a single pass
+# str.translate with a translation table, which goes through a per character mapping lookup in CPython.
+
 def html_escape(s):
     # type: (Union[str, int, float]) -> str
+    if s.__class__ is str:
+        if '&' in s or '<' in s or '>' in s:
+            return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        return s
     if isinstance(s,(int,float)):
         return str(s)
     try:
@@ -496,6 +732,10 @@ def html_escape(s):
 
 def attr_escape(s):
     # type: (Union[str, int, float]) -> str
+    if s.__class__ is str:
+        if '&' in s or '<' in s or '"' in s:
+            return s.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+        return s
     if isinstance(s,(int,float)):
         return str(s)
     try:
@@ -509,16 +749,40 @@ def attr_escape(s):
 
 ATTR_NO_VALUE = object()
 
+# Serialized attributes keyed by the attribute items. Pages repeat the same attribute dicts (class names,
+# stylesheet links...) on every render. Only dicts made of str values are stored, so an int 1 and a str '1'
+# (or True and 1, which hash alike) can never share an entry.
+_attrs_cache = {} # type: Dict[Tuple[Any, ...], str]
+_ATTRS_CACHE_SIZE = 1024
+
 def dict_to_attrs(dct):
     # type: (Dict[str, Any]) -> str
-    return ' '.join(
-        (key if value is ATTR_NO_VALUE
-        else '%s="%s"' % (key, attr_escape(value)))
-        for key,value in dct.items()
-    )
+    key = tuple(dct.items())
+    try:
+        return _attrs_cache[key]
+    except KeyError:
+        cacheable = True
+    except TypeError: # unhashable value, serialization will raise the appropriate error
+        cacheable = False
+    parts = []
+    for name, value in key:
+        if value is ATTR_NO_VALUE:
+            parts.append(name)
+        else:
+            if value.__class__ is not str:
+                cacheable = False
+            parts.append('%s="%s"' % (name, attr_escape(value)))
+    result = ' '.join(parts)
+    if cacheable:
+        if len(_attrs_cache) >= _ATTRS_CACHE_SIZE:
+            _attrs_cache.clear()
+        _attrs_cache[key] = result
+    return result
 
 def _attributes(args, kwargs):
     # type: (Any, Any) -> Dict[str, Any]
+    if not args and 'klass' not in kwargs:
+        return kwargs # already a new dict for every call
     lst = [] # type: List[Any]
     for arg in args:
         if isinstance(arg, tuple):
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def fresh_aws_clients():
+    # handlers keep boto3 handles for the life of the container, every test patches boto3 anew
+    import aws_clients
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
+
+
+@pytest.fixture
+def emitted_metrics(mocker):
+    # collects the embedded metric format records instead of printing them
+    import metrics
+    emitter = metrics.LocalEmitter()
+    mocker.patch.object(metrics, 'emitter', emitter)
+    return emitter
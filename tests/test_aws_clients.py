@@ -0,0 +1,44 @@
+import json
+import threading
+
+import aws_clients
+import log
+
+
+def test_handles_are_built_once_with_the_shared_config(mocker):
+    client = mocker.patch('boto3.client')
+    resource = mocker.patch('boto3.resource')
+
+    assert aws_clients.client('sqs') is aws_clients.client('sqs')
+    assert aws_clients.table('subscribers') is aws_clients.table('subscribers')
+    aws_clients.table('routing')
+
+    client.assert_called_once_with('sqs', config=aws_clients.CONFIG)
+    resource.assert_called_once_with('dynamodb', config=aws_clients.CONFIG)
+    assert aws_clients.CONFIG.retries['mode'] == 'standard'
+
+
+def test_construction_time_is_reported_per_invocation(mocker, capsys):
+    mocker.patch('boto3.client')
+    mocker.patch.object(log, 'LEVEL', log.DEBUG)
+
+    @aws_clients.reports_construction_time
+    def lambda_handler(event, context):
+        aws_clients.client('ses')
+        return {'statusCode': 200}
+
+    assert lambda_handler({}, None) == {'statusCode': 200}
+    assert json.loads(capsys.readouterr().out)['built'] == 1
+    lambda_handler({}, None)
+    line = json.loads(capsys.readouterr().out)
+    assert (line['level'], line['built'], line['build_ms'], line['cached']) == ('DEBUG', 0, 0.0, 1)
+
+
+def test_table_on_a_cold_cache_does_not_deadlock(mocker):
+    mocker.patch('boto3.resource')
+    thread = threading.Thread(target=aws_clients.table, args=('subscribers',), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert 'subscribers' in aws_clients._tables
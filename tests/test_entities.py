@@ -0,0 +1,41 @@
+from entities import AhoCorasick, EntityExtractor, extract_entities, format_entities
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick()
+    for pattern in ('HE', 'SHE', 'HIS', 'HERS'):
+        automaton.add(pattern, pattern)
+    automaton.build()
+
+    matches = sorted(automaton.iter('USHERS'))
+
+    assert matches == [(1, 4, 'SHE'), (2, 4, 'HE'), (2, 6, 'HERS')]
+
+
+def test_extract_entities_is_typed_and_alphabetized():
+    body = ('<p>1. Marines in PMOS 0331/0311 and MOS: 0369 assigned to II MEF and 1st Marine<br />Division.</p>'
+            '<p>2. Units with MCC 1A1, 013 and UIC M12345 will report to MCCDC.</p>')
+
+    entities = extract_entities(body)
+
+    assert entities == {
+        'mcc': ['013', '1A1'],
+        'mos': ['0311', '0331', '0369'],
+        'uic': ['M12345'],
+        'units': ['1st Marine Division', 'II Marine Expeditionary Force',
+                  'Marine Corps Combat Development Command'],
+    }
+
+
+def test_extract_entities_requires_word_boundaries():
+    extractor = EntityExtractor({'units': {'II Marine Expeditionary Force': ['II MEF']}, 'mos': {'0311': 'Rifleman'}})
+
+    entities = extractor.extract('III MEF, MCCS programs and DTG 103110Z')
+
+    assert entities == {'mcc': [], 'mos': [], 'uic': [], 'units': []}
+
+
+def test_format_entities():
+    assert format_entities({'mcc': [], 'mos': [], 'uic': [], 'units': []}) == ''
+    assert format_entities({'mcc': ['013'], 'mos': ['0311'], 'uic': [], 'units': ['M&RA']}) == \
+        '<p>Units: M&amp;RA; MCC: 013; MOS: 0311</p>'
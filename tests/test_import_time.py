@@ -0,0 +1,24 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# imported only on the code paths that use them, never while a handler cold starts
+LAZY_MODULES = ['openai', 'selenium']
+
+
+def handler_modules():
+    with open(os.path.join(ROOT, 'template.yaml'), encoding='utf-8') as f:
+        return sorted(set(re.findall(r'^\s+Handler:\s*(\w+)\.lambda_handler\s*$', f.read(), re.MULTILINE)))
+
+
+@pytest.mark.parametrize('module', handler_modules())
+def test_handler_import_leaves_heavy_modules_unloaded(module):
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, 'maradmin'), AWS_DEFAULT_REGION='us-east-1')
+    script = f'import sys, {module}; print(" ".join(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ''
@@ -0,0 +1,71 @@
+import json
+import os
+from types import SimpleNamespace
+
+import log
+
+
+def lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_lines_below_the_level_are_dropped(mocker, capsys):
+    mocker.patch.object(log, 'LEVEL', log.WARNING)
+    log.debug('dropped')
+    log.info('dropped')
+    log.warning('HTTP error', status_code=403)
+    log.error('Failed', **log.exception_fields(KeyError('link')))
+
+    assert lines(capsys) == [
+        {'level': 'WARNING', 'message': 'HTTP error', 'status_code': 403},
+        {'level': 'ERROR', 'message': 'Failed', 'error_type': 'KeyError', 'error': "'link'"},
+    ]
+
+
+def test_sampled_lines_carry_their_rate(mocker, capsys):
+    mocker.patch.object(log, 'LEVEL', log.INFO)
+    mocker.patch.object(log, 'SAMPLE_RATE', 0.25)
+    mocker.patch('random.random', side_effect=[0.1, 0.3, 0.2, 0.9])
+    for n in range(4):
+        log.sampled('Queued recipient', n=n)
+
+    assert lines(capsys) == [
+        {'level': 'INFO', 'message': 'Queued recipient', 'n': 0, 'sample_rate': 0.25},
+        {'level': 'INFO', 'message': 'Queued recipient', 'n': 2, 'sample_rate': 0.25},
+    ]
+
+    # every sampled line is written when debugging
+    mocker.patch.object(log, 'LEVEL', log.DEBUG)
+    log.sampled('Queued recipient', n=4)
+    assert lines(capsys) == [{'level': 'DEBUG', 'message': 'Queued recipient', 'n': 4}]
+
+
+def test_correlation_id_follows_the_broadcast(mocker, capsys):
+    mocker.patch.object(log, 'LEVEL', log.INFO)
+
+    @log.correlated
+    def lambda_handler(event, context):
+        log.info('Handled')
+
+    context = SimpleNamespace(aws_request_id='request')
+    lambda_handler({'Records': [{'Sns': {'MessageId': 'broadcast'}}]}, context)
+    lambda_handler({'Records': [{'messageId': 'm1', 'messageAttributes': {
+        'correlation_id': {'stringValue': 'broadcast', 'dataType': 'String'}}}]}, context)
+    lambda_handler({}, context)
+
+    assert [line['correlation_id'] for line in lines(capsys)] == ['broadcast', 'broadcast', 'request']
+    assert log.correlation_id() is None
+
+
+def test_sns_to_sqs_tags_each_message_with_the_broadcast(mocker, monkeypatch):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'SQS_QUEUE': 'queue'})
+    monkeypatch.delenv('ROUTING_TABLE_NAME', raising=False)
+    client = mocker.patch('boto3.client').return_value
+    client.get_paginator.return_value.paginate.return_value = [{'Items': [{'email': {'S': 'a@usmc.mil'}}]}]
+    event = {'Records': [{'Sns': {'MessageId': 'broadcast', 'Subject': 'MARADMIN 1/25', 'Message': '<p>All</p>'}}]}
+
+    from sns_to_sqs import lambda_handler
+    lambda_handler(event, None)
+
+    attributes = client.send_message.call_args.kwargs['MessageAttributes']
+    assert attributes['correlation_id'] == {'DataType': 'String', 'StringValue': 'broadcast'}
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import metrics
+
+THROTTLED = ClientError({'Error': {'Code': 'Throttling', 'Message': 'Maximum sending rate exceeded.'}},
+                        'SendTemplatedEmail')
+
+
+def test_records_are_embedded_metric_format(emitted_metrics):
+    metrics.put('EnqueueRate', 42.0, metrics.COUNT_PER_SECOND)
+    with metrics.timer('PageFetch', Method='HTTP') as dimensions:
+        dimensions['Method'] = 'Selenium'
+
+    rate, fetch = emitted_metrics.records
+    assert rate['_aws']['CloudWatchMetrics'] == [{
+        'Namespace': 'MARADMIN', 'Dimensions': [[]], 'Metrics': [{'Name': 'EnqueueRate', 'Unit': 'Count/Second'}]
+    }]
+    assert rate['EnqueueRate'] == 42.0
+    assert fetch['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Method']]
+    assert fetch['Method'] == 'Selenium'
+    assert emitted_metrics.values('PageFetch', Method='HTTP') == []
+    assert len(emitted_metrics.values('PageFetch', Method='Selenium')) == 1
+
+
+def test_page_fetch_records_how_the_page_was_fetched(mocker, emitted_metrics):
+    import scraper
+    mocker.patch('requests.get', return_value=mocker.Mock(
+        status_code=200, text='<div class="body-text">MARADMIN</div>'))
+    assert scraper.fetch_maradmin_body('https://www.marines.mil/1/', rate_limit_delay=0) == 'MARADMIN'
+
+    mocker.patch('requests.get', return_value=mocker.Mock(status_code=403, text='Access Denied'))
+    mocker.patch.object(scraper, 'fetch_with_browser_worker', return_value='MARADMIN')
+    assert scraper.fetch_maradmin_body('https://www.marines.mil/2/', rate_limit_delay=0) == 'MARADMIN'
+
+    assert len(emitted_metrics.values('PageFetch', Method='HTTP')) == 1
+    assert len(emitted_metrics.values('PageFetch', Method='Selenium')) == 1
+
+
+def test_ses_throttles_are_counted(mocker, monkeypatch, emitted_metrics):
+    monkeypatch.setenv('TOKEN_KEYS', '{"current": "k1", "keys": {"k1": "secret"}}')
+    monkeypatch.delenv('AWS_EXECUTION_ENV', raising=False)
+    mocker.patch('maradmin_globals._token_keys', None)
+    ses = mocker.patch('boto3.client').return_value
+    ses.send_templated_email.side_effect = [{'MessageId': 'sent'}, THROTTLED]
+    event = {'Records': [{'body': '<p>MARADMIN</p>', 'messageAttributes': {
+        'email': {'stringValue': 'a@usmc.mil'}, 'subject': {'stringValue': 'MARADMIN 1/25'}}}]}
+
+    from sqs_to_ses import lambda_handler
+    lambda_handler(event, None)
+    with pytest.raises(ClientError):
+        lambda_handler(event, None)
+
+    # a throttled send is counted, not timed
+    assert len(emitted_metrics.values('SesSendLatency')) == 1
+    assert emitted_metrics.values('SesThrottles') == [1]
+
+
+def test_fan_out_records_the_enqueue_rate(mocker, monkeypatch, emitted_metrics):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'SQS_QUEUE': 'queue'})
+    monkeypatch.delenv('ROUTING_TABLE_NAME', raising=False)
+    client = mocker.patch('boto3.client').return_value
+    client.get_item.return_value = {'Item': {'shards': {'N': '8'}}}
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: [
+        {'Items': [{'email': {'S': f'{kwargs["ExpressionAttributeValues"][":value"]["S"]}@usmc.mil'}}]}
+    ]
+    event = {'Records': [{'Sns': {'MessageId': 'broadcast', 'Subject': 'MARADMIN 1/25', 'Message': '<p>All</p>'}}]}
+
+    from maradmin_globals import VERIFIED_SHARDS
+    from sns_to_sqs import lambda_handler
+    lambda_handler(event, None)
+
+    assert emitted_metrics.values('EnqueuedMessages') == [VERIFIED_SHARDS]
+    rate = emitted_metrics.records[-1]
+    assert rate['EnqueueRate'] > 0 and rate['correlation_id'] == 'broadcast'
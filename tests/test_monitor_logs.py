@@ -0,0 +1,142 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError
+
+CONDITIONAL_CHECK_FAILED = ClientError(
+    {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}, 'PutItem')
+NOW = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def checkpoint_table(logs, monkeypatch):
+    # the checkpoints go through the same (mocked) client as the logs and SES calls
+    monkeypatch.setenv('MONITOR_CHECKPOINT_TABLE', 'checkpoints')
+    client, _ = logs
+    client.get_item.return_value = {}
+    return client
+
+
+@pytest.fixture
+def logs(mocker):
+    mocker.patch('boto3.resource', side_effect=AssertionError('Table resources are not thread safe'))
+    client = mocker.patch('boto3.client').return_value
+    client.send_email.return_value = {'MessageId': '1'}
+    pages = {}
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: \
+        pages.get((kwargs['logGroupName'], kwargs['filterPattern']), [])
+    import monitor_logs
+    mocker.patch.object(monitor_logs, 'POLL_LOG_GROUP', '/aws/lambda/poll')
+    return client, pages
+
+
+def line(level, message, **fields):
+    return json.dumps({'level': level, 'message': message, 'correlation_id': 'abc', **fields})
+
+
+def test_monitor_filters_server_side_and_follows_every_page(checkpoint_table, logs):
+    client, pages = logs
+    import monitor_logs
+    pages['/aws/lambda/poll', monitor_logs.JSON_FILTER_PATTERN] = [
+        {'events': [{'timestamp': 2000, 'message': line('ERROR', 'second')}]},
+        {'events': [{'timestamp': 1000, 'message': line('WARNING', 'first')}]}
+    ]
+    pages['/aws/lambda/poll', monitor_logs.RUNTIME_FILTER_PATTERN] = [
+        {'events': [{'timestamp': 3000, 'message': "[ERROR] KeyError: 'link'\nTraceback (most recent call last):"},
+                    # matched by the text pattern but already counted as a JSON line
+                    {'timestamp': 2000, 'message': line('ERROR', 'second')}]}
+    ]
+
+    response = monitor_logs.lambda_handler({}, None)
+
+    assert response['body'] == 'Email sent with 3 events'
+    client.get_paginator.assert_called_with('filter_log_events')
+    assert {call.kwargs['filterPattern'] for call in client.get_paginator.return_value.paginate.call_args_list} == \
+        set(monitor_logs.FILTER_PATTERNS)
+    body = client.send_email.call_args.kwargs['Message']['Body']['Text']['Data']
+    assert body.index('"first"') < body.index('"second"') < body.index('KeyError')
+    client.describe_log_streams.assert_not_called()
+
+
+def test_repeated_messages_are_grouped_by_signature(checkpoint_table, logs):
+    client, pages = logs
+    import monitor_logs
+    pages['/aws/lambda/poll', monitor_logs.JSON_FILTER_PATTERN] = [{'events': [
+        {'timestamp': 1000, 'message': line('WARNING', 'HTTP error', url='https://www.marines.mil/Article/1/')},
+        {'timestamp': 3000, 'message': line('WARNING', 'HTTP error', url='https://www.marines.mil/Article/2/')},
+        {'timestamp': 2000, 'message': line('ERROR', 'Failed to publish to SNS')},
+    ]}]
+    pages['/aws/lambda/poll', monitor_logs.RUNTIME_FILTER_PATTERN] = [{'events': [
+        {'timestamp': 4000, 'message': '2025-01-01T00:00:04.000Z 6f1c2d3e-0000-4000-8000-000000000001 Task timed out '
+                                       'after 60.00 seconds'},
+        {'timestamp': 5000, 'message': '2025-01-01T00:00:05.000Z 6f1c2d3e-0000-4000-8000-000000000002 Task timed out '
+                                       'after 60.00 seconds'},
+    ]}]
+
+    monitor_logs.lambda_handler({}, None)
+
+    body = client.send_email.call_args.kwargs['Message']['Body']['Text']['Data']
+    assert 'Total Events: 5 in 3 distinct messages' in body
+    assert body.index('2x [PollFunction] first 1970-01-01 00:00:01, last 1970-01-01 00:00:03') < \
+        body.index('1x [PollFunction]')
+    assert '2x [PollFunction] first 1970-01-01 00:00:04, last 1970-01-01 00:00:05' in body
+    assert 'Article/2/' not in body
+
+
+def test_scan_starts_after_the_checkpoint_and_claims_the_window(checkpoint_table, logs, mocker):
+    client, pages = logs
+    checkpoint_table.get_item.return_value = {'Item': {'log_group': {'S': '/aws/lambda/poll'},
+                                                       'end_ms': {'N': '1000'}}}
+
+    import monitor_logs
+    scan = monitor_logs.scan_log_group('PollFunction', '/aws/lambda/poll', NOW)
+
+    end_ms = int((NOW - monitor_logs.INGESTION_LAG).timestamp() * 1000)
+    assert (scan['start_ms'], scan['end_ms']) == (1001, end_ms)
+    checkpoint_table.get_item.assert_called_once_with(TableName='checkpoints',
+                                                      Key={'log_group': {'S': '/aws/lambda/poll'}})
+    checkpoint_table.put_item.assert_called_once_with(
+        TableName='checkpoints',
+        Item={'log_group': {'S': '/aws/lambda/poll'}, 'end_ms': {'N': str(end_ms)}},
+        ConditionExpression='end_ms = :previous',
+        ExpressionAttributeValues={':previous': {'N': '1000'}}
+    )
+    assert [call.kwargs for call in client.get_paginator.return_value.paginate.call_args_list] == [
+        {'logGroupName': '/aws/lambda/poll', 'startTime': 1001, 'endTime': end_ms, 'filterPattern': filter_pattern}
+        for filter_pattern in monitor_logs.FILTER_PATTERNS
+    ]
+
+
+def test_window_claimed_by_another_run_is_skipped(checkpoint_table, logs):
+    client, pages = logs
+    checkpoint_table.put_item.side_effect = CONDITIONAL_CHECK_FAILED
+    import monitor_logs
+    pages['/aws/lambda/poll', monitor_logs.JSON_FILTER_PATTERN] = [
+        {'events': [{'timestamp': 1000, 'message': line('ERROR', 'reported elsewhere')}]}
+    ]
+
+    response = monitor_logs.lambda_handler({}, None)
+
+    assert response['body'] == 'No warnings or errors found in the logs'
+    client.get_paginator.return_value.paginate.assert_not_called()
+    client.send_email.assert_not_called()
+
+
+def test_window_is_released_when_the_email_fails(checkpoint_table, logs):
+    client, pages = logs
+    checkpoint_table.get_item.return_value = {'Item': {'log_group': {'S': '/aws/lambda/poll'},
+                                                       'end_ms': {'N': '1000'}}}
+    client.send_email.side_effect = RuntimeError('SES down')
+    import monitor_logs
+    pages['/aws/lambda/poll', monitor_logs.JSON_FILTER_PATTERN] = [
+        {'events': [{'timestamp': 2000, 'message': line('ERROR', 'lost')}]}
+    ]
+
+    with pytest.raises(RuntimeError):
+        monitor_logs.lambda_handler({}, None)
+
+    restored = [call.kwargs for call in checkpoint_table.put_item.call_args_list
+                if call.kwargs['Item']['log_group'] == {'S': '/aws/lambda/poll'}]
+    assert restored[-1]['Item']['end_ms'] == {'N': '1000'}
+    assert restored[-1]['ConditionExpression'] == 'end_ms = :claimed'
@@ -0,0 +1,48 @@
+import os
+from collections import Counter
+
+import pacing
+
+EMAILS = [f'{n:03d}@usmc.mil' for n in range(6)] + ['a@gmail.com', 'b@gmail.com', 'c@yahoo.com']
+
+
+def test_interleave_spreads_each_domain_and_keeps_its_order():
+    ordered = pacing.interleave(EMAILS)
+
+    assert ordered == ['000@usmc.mil', 'a@gmail.com', '001@usmc.mil', '002@usmc.mil', 'c@yahoo.com',
+                       '003@usmc.mil', 'b@gmail.com', '004@usmc.mil', '005@usmc.mil']
+
+
+def test_schedule_without_concurrency_does_not_delay():
+    assert {delay for _, delay in pacing.schedule(EMAILS)} == {0}
+
+
+def test_schedule_caps_each_domain_and_each_wave():
+    scheduled = pacing.schedule(EMAILS, concurrency=2, wave_seconds=3, send_rate=1)
+
+    waves = Counter(delay for _, delay in scheduled)
+    per_domain = Counter((email.split('@')[1], delay) for email, delay in scheduled)
+    assert max(waves.values()) <= 3
+    assert max(per_domain.values()) <= 2
+    assert [delay for email, delay in scheduled if email.endswith('usmc.mil')] == [0, 0, 3, 3, 6, 6]
+
+
+def test_domains_larger_than_the_delay_limit_get_larger_waves(mocker):
+    warning = mocker.patch('log.warning')
+    emails = [f'{n}@usmc.mil' for n in range(2000)]
+
+    scheduled = pacing.schedule(emails, concurrency=1, wave_seconds=1)
+
+    assert max(delay for _, delay in scheduled) <= pacing.MAX_DELAY_SECONDS
+    assert max(Counter(delay for _, delay in scheduled).values()) == 3
+    assert warning.call_args.kwargs['raised'] == {'usmc.mil': 3}
+
+
+def test_configured_schedule_paces_at_the_ses_send_rate(mocker):
+    mocker.patch.dict(os.environ, {'DOMAIN_CONCURRENCY': '1', 'DOMAIN_WAVE_SECONDS': '1'})
+    mocker.patch('boto3.client').return_value.get_send_quota.return_value = {'MaxSendRate': 2.0}
+
+    scheduled = pacing.configured_schedule(EMAILS)
+
+    assert max(Counter(delay for _, delay in scheduled).values()) == 2
+    assert max(delay for _, delay in scheduled) == 5
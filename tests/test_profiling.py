@@ -0,0 +1,50 @@
+import os
+import pstats
+from types import SimpleNamespace
+
+import pytest
+
+import profiling
+
+
+def handler(event, context):
+    return {'statusCode': 200, 'body': ''.join(str(n) for n in range(1000))}
+
+
+def test_handler_is_returned_unchanged_without_profile(monkeypatch):
+    monkeypatch.delenv('PROFILE', raising=False)
+    assert profiling.profiled(handler) is handler
+
+    monkeypatch.setenv('PROFILE', 'cpu,disk')
+    with pytest.raises(ValueError):
+        profiling.profiled(handler)
+
+
+def test_invocation_is_profiled_and_uploaded(mocker, monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILE', 'cpu, memory')
+    monkeypatch.setenv('PROFILE_TOP', '5')
+    monkeypatch.setenv('PROFILE_BUCKET', 'profiles-bucket')
+    mocker.patch.object(profiling, 'PROFILE_DIR', str(tmp_path))
+    s3 = mocker.patch('boto3.client').return_value
+
+    response = profiling.profiled(handler)({}, SimpleNamespace(aws_request_id='request'))
+
+    assert response['statusCode'] == 200
+    stats = pstats.Stats(str(tmp_path / 'test_profiling-request.pstats'))
+    assert any(function == 'handler' for _, _, function in stats.stats)
+    memory = (tmp_path / 'test_profiling-request.memory.txt').read_text().splitlines()
+    assert memory[0].startswith('peak traced memory') and len(memory) <= 6
+    assert sorted(call.args[2] for call in s3.upload_file.call_args_list) == [
+        'profiles/test_profiling/test_profiling-request.memory.txt',
+        'profiles/test_profiling/test_profiling-request.pstats',
+    ]
+
+
+def test_unsampled_invocations_are_not_profiled(mocker, monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILE', 'cpu')
+    monkeypatch.setenv('PROFILE_SAMPLE_RATE', '0')
+    monkeypatch.delenv('PROFILE_BUCKET', raising=False)
+    mocker.patch.object(profiling, 'PROFILE_DIR', str(tmp_path))
+
+    assert profiling.profiled(handler)({}, None)['statusCode'] == 200
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,135 @@
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import redrive
+
+JAN_1_MS = '1735732800000'  # 2025-01-01
+JAN_3_MS = '1735905600000'  # 2025-01-03
+
+
+def dead_letter(message_id, email, subject='MARADMIN 001/25', sent=JAN_3_MS):
+    attributes = {
+        'email': {'stringValue': email, 'dataType': 'String'},
+        'trace': {'stringValue': '{"maradmin_id": "001/25"}', 'dataType': 'String'},
+    }
+    if subject:
+        attributes['subject'] = {'stringValue': subject, 'dataType': 'String'}
+    return {
+        'messageId': message_id,
+        'body': '<p>MARADMIN</p>',
+        'attributes': {'SentTimestamp': sent, 'ApproximateReceiveCount': '1'},
+        'messageAttributes': attributes,
+    }
+
+
+ARCHIVE = {
+    'dlq/date=2025-01-01/subject=MARADMIN-001-25/000000-a.jsonl.gz':
+        [dead_letter('m1', 'a@usmc.mil', sent=JAN_1_MS)],
+    'dlq/date=2025-01-03/subject=MARADMIN-001-25/000000-b.jsonl.gz':
+        [dead_letter('m2', 'a@usmc.mil'), dead_letter('m3', 'b@usmc.mil'), dead_letter('m4', 'c@gmail.com')],
+    'dlq/date=2025-01-03/subject=MARADMIN-001-25/000000-b.manifest.json': None,
+    'dlq/date=2025-01-03/subject=MARADMIN-002-25/000000-c.jsonl.gz':
+        [dead_letter('m5', 'a@usmc.mil', subject='MARADMIN 002/25')],
+    'dlq/date=2025-01-03/subject=none/000000-d.jsonl.gz':
+        [dead_letter('m6', 'd@usmc.mil', subject=None)],
+}
+LEGACY = {'DLQ 1234.json': {'Records': [dead_letter('m7', 'e@usmc.mil')]}}
+
+
+@pytest.fixture
+def aws(mocker):
+    s3, sqs, ses = mocker.MagicMock(), mocker.MagicMock(), mocker.MagicMock()
+    mocker.patch('boto3.client', side_effect=lambda service, **kwargs: {'s3': s3, 'sqs': sqs, 'ses': ses}[service])
+    mocker.patch('time.sleep')
+
+    def paginate(Bucket, Prefix):
+        objects = ARCHIVE if Prefix == 'dlq/' else LEGACY
+        return [{'Contents': [{'Key': key} for key in objects]}]
+    s3.get_paginator.return_value.paginate.side_effect = paginate
+
+    def get_object(Bucket, Key):
+        if Key in LEGACY:
+            return {'Body': io.BytesIO(json.dumps(LEGACY[Key]).encode('utf-8'))}
+        lines = ''.join(json.dumps(record) + '\n' for record in ARCHIVE[Key])
+        return {'Body': io.BytesIO(gzip.compress(lines.encode('utf-8')))}
+    s3.get_object.side_effect = get_object
+
+    ses.get_send_quota.return_value = {'MaxSendRate': 14.0, 'Max24HourSend': 50000.0, 'SentLast24Hours': 0.0}
+    sqs.send_message_batch.return_value = {'Successful': [], 'Failed': []}
+    return s3, sqs, ses
+
+
+def queued(sqs):
+    return [entry for call in sqs.send_message_batch.call_args_list for entry in call.kwargs['Entries']]
+
+
+def test_each_recipient_is_queued_once_without_its_trace(aws):
+    s3, sqs, ses = aws
+
+    counts = redrive.redrive('dlq-bucket', 'queue-url')
+
+    assert counts == {'read': 7, 'matched': 7, 'duplicates': 1, 'skipped': 1, 'queued': 5, 'failed': 0,
+                      'over_quota': 0}
+    entries = queued(sqs)
+    assert [entry['MessageAttributes']['email']['StringValue'] for entry in entries] == [
+        'a@usmc.mil', 'b@usmc.mil', 'c@gmail.com', 'a@usmc.mil', 'e@usmc.mil']
+    assert entries[0]['MessageAttributes'] == {
+        'email': {'DataType': 'String', 'StringValue': 'a@usmc.mil'},
+        'subject': {'DataType': 'String', 'StringValue': 'MARADMIN 001/25'},
+    }
+
+
+def test_partitions_outside_the_filters_are_not_read(aws):
+    s3, sqs, ses = aws
+
+    counts = redrive.redrive('dlq-bucket', 'queue-url', since=datetime(2025, 1, 2, tzinfo=timezone.utc),
+                             subject='MARADMIN 001/25')
+
+    read = [call.kwargs['Key'] for call in s3.get_object.call_args_list]
+    assert read == ['dlq/date=2025-01-03/subject=MARADMIN-001-25/000000-b.jsonl.gz', 'DLQ 1234.json']
+    assert counts['queued'] == 4
+    assert counts['read'] == 4
+
+
+def test_dry_run_queues_nothing(aws):
+    s3, sqs, ses = aws
+
+    counts = redrive.redrive('dlq-bucket', 'queue-url', dry_run=True)
+
+    assert counts['queued'] == 5
+    sqs.send_message_batch.assert_not_called()
+
+
+def test_redrive_stops_at_the_remaining_ses_quota(aws):
+    s3, sqs, ses = aws
+    ses.get_send_quota.return_value = {'MaxSendRate': 14.0, 'Max24HourSend': 200.0, 'SentLast24Hours': 197.0}
+
+    counts = redrive.redrive('dlq-bucket', 'queue-url')
+
+    assert counts['queued'] == 3
+    assert counts['over_quota'] == 2
+    assert len(queued(sqs)) == 3
+
+
+def test_batches_are_bounded_and_paced(aws, mocker):
+    s3, sqs, ses = aws
+    records = [dead_letter(f'm{n}', f'{n}@usmc.mil') for n in range(25)]
+    mocker.patch.object(redrive, 'iter_archived', return_value=iter(records))
+    sqs.send_message_batch.side_effect = [{'Failed': []}, {'Failed': [{'Id': '3', 'Code': 'Throttled'}]},
+                                          {'Failed': []}]
+    sleep = mocker.patch('time.sleep')
+
+    counts = redrive.redrive('dlq-bucket', 'queue-url', rate=100)
+
+    sizes = [len(call.kwargs['Entries']) for call in sqs.send_message_batch.call_args_list]
+    assert sizes == [10, 10, 5]
+    assert [entry['Id'] for entry in sqs.send_message_batch.call_args_list[1].kwargs['Entries']] == \
+        [str(n) for n in range(10)]
+    assert counts['queued'] == 24
+    assert counts['failed'] == 1
+    # capped at half the SES send rate, the last batch waits until 25 / 7 seconds after the start
+    assert [call.args[0] for call in sleep.call_args_list] == pytest.approx([10 / 7, 20 / 7, 25 / 7], abs=0.1)
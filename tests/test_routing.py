@@ -0,0 +1,142 @@
+import json
+import os
+
+import pytest
+
+import routing
+
+
+def test_parse_filters():
+    assert routing.parse_filters('') == ['ALL']
+    assert routing.parse_filters('0311, pmos 0331,MCC 013, reserve ,  PME ') == \
+        ['KW#PME', 'KW#RESERVE', 'MCC#013', 'MOS#0311', 'MOS#0331']
+    assert routing.parse_filters('0311, all') == ['ALL']
+    assert routing.parse_filters('<script>, x') == ['ALL']
+
+
+def test_message_terms():
+    entities = {'mcc': ['013'], 'mos': ['0311'], 'uic': [], 'units': []}
+    text = '<p>Reserve Marines attending resident PME. Preserved.</p>'
+
+    terms = routing.message_terms(entities, text, ['RESERVE', 'PME', 'BONUS'])
+
+    assert terms == ['ALL', 'KW#PME', 'KW#RESERVE', 'MCC#013', 'MOS#0311']
+
+
+def paginate_terms(pages):
+    # paginator.paginate stand-in, pages maps a term to its list of pages
+    def paginate(**kwargs):
+        return pages.get(kwargs['ExpressionAttributeValues'][':term']['S'], [{'Items': []}])
+    return paginate
+
+
+def items(*emails):
+    return {'Items': [{'email': {'S': email}} for email in emails]}
+
+
+def test_resolve_recipients_queries_each_term(mocker):
+    client = mocker.patch('boto3.client').return_value
+    client.get_paginator.return_value.paginate.side_effect = paginate_terms({
+        'ALL#00': [items('a@usmc.mil'), items('b@gmail.com')],
+        'ALL#05': [items('d@usmc.mil')],
+        'MOS#0311': [items('c@usmc.mil', 'a@usmc.mil')],
+    })
+    table = mocker.MagicMock()
+
+    recipients = routing.resolve_recipients(table, ['ALL', 'MOS#0311'])
+
+    assert recipients == ['a@usmc.mil', 'b@gmail.com', 'c@usmc.mil', 'd@usmc.mil']
+    queried = sorted(call.kwargs['ExpressionAttributeValues'][':term']['S']
+                     for call in client.get_paginator.return_value.paginate.call_args_list)
+    assert queried == routing.all_shard_terms() + ['MOS#0311']
+
+
+def test_all_is_stored_in_the_subscriber_shard(mocker):
+    from maradmin_globals import verified_shard
+    table = mocker.MagicMock()
+    batch = table.batch_writer.return_value.__enter__.return_value
+
+    routing.index_subscriber(table, 'a@usmc.mil', ['ALL'])
+    routing.unindex_subscriber(table, 'a@usmc.mil', ['ALL'])
+
+    stored = f'ALL#{verified_shard("a@usmc.mil")}'
+    assert batch.put_item.call_args.kwargs['Item'] == {'term': stored, 'email': 'a@usmc.mil'}
+    assert batch.delete_item.call_args.kwargs['Key'] == {'term': stored, 'email': 'a@usmc.mil'}
+
+
+def sns_event():
+    return {'Records': [{'Sns': {
+        'Subject': 'MARADMIN 1/25',
+        'Message': '<p>PMOS 0311</p>',
+        'MessageAttributes': {'entities': {'Type': 'String', 'Value': json.dumps({'mos': ['0311']})}},
+    }}]}
+
+
+def test_sns_to_sqs_enqueues_only_matching_subscribers(mocker):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'ROUTING_TABLE_NAME': 'routing',
+                                   'SQS_QUEUE': 'queue'})
+    table = mocker.patch('boto3.resource').return_value.Table.return_value
+    table.name = 'routing'
+    table.get_item.return_value = {'Item': {'keywords': {'RESERVE'}, 'backfilled_layout': routing.LAYOUT}}
+    client = mocker.patch('boto3.client').return_value
+    client.get_paginator.return_value.paginate.side_effect = paginate_terms({
+        'ALL#03': [items('all@usmc.mil')],
+        'MOS#0311': [items('rifleman@usmc.mil')],
+    })
+
+    from sns_to_sqs import lambda_handler
+    assert lambda_handler(sns_event(), None) == {'statusCode': 200}
+
+    queried = sorted(call.kwargs['ExpressionAttributeValues'][':term']['S']
+                     for call in client.get_paginator.return_value.paginate.call_args_list)
+    assert queried == routing.all_shard_terms() + ['MOS#0311']
+    sent = sorted(call.kwargs['MessageAttributes']['email']['StringValue']
+                  for call in client.send_message.call_args_list)
+    assert sent == ['all@usmc.mil', 'rifleman@usmc.mil']
+
+
+def test_sns_to_sqs_sends_to_everyone_until_backfilled(mocker):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'ROUTING_TABLE_NAME': 'routing',
+                                   'SQS_QUEUE': 'queue'})
+    table = mocker.patch('boto3.resource').return_value.Table.return_value
+    # backfilled before ALL was sharded, its single ALL rows are no longer read
+    table.get_item.return_value = {'Item': {'keywords': set(), 'backfilled': True}}
+    client = mocker.patch('boto3.client').return_value
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: \
+        [items('verified@usmc.mil')] if kwargs.get('IndexName') == 'VerifiedShardIndex' else [{'Items': []}]
+
+    from sns_to_sqs import lambda_handler
+    assert lambda_handler(sns_event(), None) == {'statusCode': 200}
+
+    sent = set(call.kwargs['MessageAttributes']['email']['StringValue']
+               for call in client.send_message.call_args_list)
+    assert sent == {'verified@usmc.mil'}
+
+
+def backfill_tables(mocker, verified_count, indexed):
+    table = mocker.patch('boto3.resource').return_value.Table.return_value
+    table.get_item.side_effect = lambda Key: {'Item': {'email': Key['email']}}
+    client = mocker.patch('boto3.client').return_value
+    client.get_item.return_value = {'Item': {'shards': {'N': '8'}}}
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: \
+        [{'Count': verified_count}] if kwargs.get('Select') == 'COUNT' else \
+        [items(*indexed)] if kwargs['ExpressionAttributeValues'][':value']['S'] == '00' else [{'Items': []}]
+    return table
+
+
+def test_backfill_marks_the_current_layout(mocker):
+    table = backfill_tables(mocker, 2, ['a@usmc.mil', 'b@gmail.com'])
+
+    routing.backfill('subscribers', 'routing')
+
+    assert table.update_item.call_args.kwargs['ExpressionAttributeValues'] == {':layout': routing.LAYOUT}
+
+
+def test_backfill_refuses_an_incomplete_index(mocker):
+    # e.g. run before migrate_verified_shards.py, the sharded index misses older subscribers
+    table = backfill_tables(mocker, 3, ['a@usmc.mil'])
+
+    with pytest.raises(RuntimeError):
+        routing.backfill('subscribers', 'routing')
+
+    table.update_item.assert_not_called()
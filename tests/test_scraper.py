@@ -1,5 +1,7 @@
+import io
 import json
 import boto3
+import requests
 import pytest
 import os
 
@@ -15,9 +17,8 @@ def test_scraper_lambda_handler(mocker):
     table_mock.query.return_value = {'Count': 0}
     table_mock.put_item.return_value = {}
 
-    # Patch fetch_page_with_curl_headers to return dummy HTML with a body.
-    dummy_html = '<html><div class="body-text">Test Body</div></html>'
-    mocker.patch('scraper.fetch_page_with_curl_headers', return_value=dummy_html)
+    # Patch fetch_maradmin_body to return a dummy body.
+    mocker.patch('scraper.fetch_maradmin_body', return_value='Test Body')
 
     # Patch generate_bluf to return a dummy BLUF summary.
     mocker.patch('scraper.generate_bluf', return_value="Test BLUF")
@@ -37,4 +38,24 @@ def test_scraper_lambda_handler(mocker):
     assert response["statusCode"] == 200
     sns_instance.publish.assert_called_once()
     table_mock.query.assert_called_once()
-    table_mock.put_item.assert_called_once()
\ No newline at end of file
+    table_mock.put_item.assert_called_once()
+
+def test_blocked_fetch_invokes_the_browser_worker(mocker):
+    mocker.patch.dict(os.environ, {'AWS_EXECUTION_ENV': 'AWS_Lambda_python3.13', 'BROWSER_FETCH_FUNCTION': 'browser'})
+    mocker.patch('time.sleep')
+    mocker.patch('requests.get').return_value.configure_mock(status_code=403, text='Access Denied')
+    client = mocker.patch('boto3.client').return_value
+    client.invoke.return_value = {'Payload': io.BytesIO(json.dumps({'statusCode': 200, 'body': '<p>1/25</p>'}).encode())}
+
+    from scraper import fetch_maradmin_body
+    assert fetch_maradmin_body('https://www.marines.mil/1') == '<p>1/25</p>'
+    assert client.invoke.call_args.kwargs['InvocationType'] == 'RequestResponse'
+
+    client.invoke.return_value = {'Payload': io.BytesIO(json.dumps({'statusCode': 403}).encode())}
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch_maradmin_body('https://www.marines.mil/1')
+
+
+def test_extract_body():
+    from browser_fetch import extract_body
+    assert extract_body('<html><div class="body-text">A(slash)B</div></html>') == 'A/B'
@@ -0,0 +1,155 @@
+import json
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+import ses_feedback
+
+CONDITIONAL_CHECK_FAILED = ClientError(
+    {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}},
+    'UpdateItem'
+)
+
+
+def ses_record(message_id, event_type, *emails, bounce_type='Permanent', timestamp='2025-01-03T12:00:01.000Z'):
+    ses_event = {'eventType': event_type, 'mail': {'timestamp': '2025-01-03T12:00:00.000Z', 'destination': emails}}
+    if event_type == 'Bounce':
+        ses_event['bounce'] = {'bounceType': bounce_type, 'timestamp': timestamp,
+                               'bouncedRecipients': [{'emailAddress': email} for email in emails]}
+    elif event_type == 'Complaint':
+        ses_event['complaint'] = {'timestamp': timestamp,
+                                  'complainedRecipients': [{'emailAddress': email} for email in emails]}
+    else:
+        ses_event['delivery'] = {'timestamp': timestamp, 'recipients': list(emails)}
+    return {'messageId': message_id, 'body': json.dumps(ses_event)}
+
+
+@pytest.fixture
+def tables(mocker):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'ROUTING_TABLE_NAME': 'routing',
+                                   'DELIVERY_STATS_TABLE': 'stats'})
+    tables = {name: mocker.MagicMock() for name in ('subscribers', 'routing', 'stats')}
+    for name, table in tables.items():
+        table.name = name
+    resource = mocker.patch('boto3.resource').return_value
+    resource.Table.side_effect = tables.__getitem__
+    rows = {'a@usmc.mil': {'email': 'a@usmc.mil', 'verified': 'True', 'filters': ['MOS#0311'], 'soft_bounces': 4},
+            'b@gmail.com': {'email': 'b@gmail.com', 'verified': 'True'}}
+
+    def update_item(Key, UpdateExpression, ExpressionAttributeValues, ConditionExpression, ReturnValues=None):
+        row = rows.get(Key['email'])
+        if row is None or (ConditionExpression == 'verified = :true' and row['verified'] != 'True') or \
+                (ConditionExpression == 'soft_bounces = :seen' and
+                 row.get('soft_bounces') != ExpressionAttributeValues[':seen']):
+            raise CONDITIONAL_CHECK_FAILED
+        old = dict(row)
+        if UpdateExpression == 'REMOVE soft_bounces':
+            del row['soft_bounces']
+        elif 'soft_bounces = :soft_bounces' in UpdateExpression:
+            row['soft_bounces'] = ExpressionAttributeValues[':soft_bounces']
+        for outcome in ses_feedback.LIMITS:
+            if f'{outcome} :{outcome}' in UpdateExpression:
+                row[outcome] = row.get(outcome, 0) + ExpressionAttributeValues[f':{outcome}']
+        if ConditionExpression == 'verified = :true':
+            row['verified'] = 'False'
+        return {'Attributes': old if ReturnValues == 'ALL_OLD' else row}
+    tables['subscribers'].update_item.side_effect = update_item
+
+    def batch_get_item(RequestItems):
+        request = RequestItems['subscribers']
+        return {'Responses': {'subscribers': [
+            {name: rows[key['email']][name] for name in ('email', 'soft_bounces') if name in rows[key['email']]}
+            for key in request['Keys'] if key['email'] in rows]}}
+    resource.batch_get_item.side_effect = batch_get_item
+    tables['rows'] = rows
+    return tables
+
+
+def test_subscribers_over_a_limit_leave_the_fan_out(tables, emitted_metrics):
+    event = {'Records': [
+        ses_record('m1', 'Delivery', 'c@usmc.mil'),
+        ses_record('m2', 'Bounce', 'a@usmc.mil', bounce_type='Transient'),
+        ses_record('m3', 'Delivery', 'b@gmail.com'),
+        ses_record('m4', 'Bounce', 'gone@usmc.mil'),
+        ses_record('m5', 'Complaint', 'b@gmail.com'),
+    ]}
+
+    assert ses_feedback.lambda_handler(event, None) == {'batchItemFailures': []}
+
+    marks = [call.kwargs for call in tables['subscribers'].update_item.call_args_list
+             if call.kwargs['ConditionExpression'] == 'verified = :true']
+    assert [(mark['Key']['email'], mark['ExpressionAttributeValues'][':reason']) for mark in marks] == [
+        ('a@usmc.mil', 'soft_bounces'), ('b@gmail.com', 'complaints')]
+    assert 'REMOVE verified_shard' in marks[0]['UpdateExpression']
+    deleted = [call.kwargs['Key'] for call in
+               tables['routing'].batch_writer.return_value.__enter__.return_value.delete_item.call_args_list]
+    assert deleted == [{'term': 'MOS#0311', 'email': 'a@usmc.mil'},
+                       {'term': f'ALL#{ses_feedback.routing.verified_shard("b@gmail.com")}', 'email': 'b@gmail.com'}]
+
+    stats = {(call.kwargs['Key']['domain'], call.kwargs['Key']['date']): call.kwargs['ExpressionAttributeValues']
+             for call in tables['stats'].update_item.call_args_list}
+    assert sorted(stats) == [('gmail.com', '2025-01-03'), ('usmc.mil', '2025-01-03')]
+    assert {name: value for name, value in stats[('usmc.mil', '2025-01-03')].items() if name != ':expires_at'} == \
+        {':delivered': 1, ':soft_bounces': 1, ':hard_bounces': 1}
+    assert emitted_metrics.values('UndeliverableSubscribers') == [2]
+    assert emitted_metrics.values('SesFeedback', Outcome='delivered') == [2]
+
+
+def test_a_delivery_between_soft_bounces_prevents_pruning(tables):
+    event = {'Records': [
+        # queued out of order, counted in the order SES recorded them
+        ses_record('m3', 'Bounce', 'a@usmc.mil', bounce_type='Transient', timestamp='2025-01-03T12:00:03.000Z'),
+        ses_record('m1', 'Bounce', 'a@usmc.mil', bounce_type='Transient', timestamp='2025-01-03T12:00:01.000Z'),
+        ses_record('m2', 'Delivery', 'a@usmc.mil', timestamp='2025-01-03T12:00:02.000Z'),
+    ]}
+
+    assert ses_feedback.lambda_handler(event, None) == {'batchItemFailures': []}
+
+    assert tables['rows']['a@usmc.mil']['soft_bounces'] == 1
+    assert tables['rows']['a@usmc.mil']['verified'] == 'True'
+    tables['routing'].batch_writer.assert_not_called()
+
+
+def test_a_delivery_resets_soft_bounces_of_earlier_batches(tables):
+    delivery = {'Records': [ses_record('m1', 'Delivery', 'a@usmc.mil', 'b@gmail.com', 'c@usmc.mil')]}
+    bounce = {'Records': [ses_record('m2', 'Bounce', 'a@usmc.mil', bounce_type='Transient')]}
+
+    ses_feedback.lambda_handler(delivery, None)
+    ses_feedback.lambda_handler(bounce, None)
+
+    # only the subscriber with soft bounces is written to for the delivery
+    assert [call.kwargs['Key']['email'] for call in tables['subscribers'].update_item.call_args_list] == \
+        ['a@usmc.mil', 'a@usmc.mil']
+    assert tables['rows']['a@usmc.mil']['soft_bounces'] == 1
+    assert tables['rows']['a@usmc.mil']['verified'] == 'True'
+
+
+def test_subscribers_under_every_limit_stay(tables):
+    event = {'Records': [ses_record('m1', 'Bounce', 'b@gmail.com', bounce_type='Transient')]}
+
+    ses_feedback.lambda_handler(event, None)
+
+    assert tables['subscribers'].update_item.call_count == 1
+    tables['routing'].batch_writer.assert_not_called()
+
+
+def test_failed_subscriber_writes_are_redelivered(tables):
+    tables['subscribers'].update_item.side_effect = RuntimeError('DynamoDB down')
+    event = {'Records': [ses_record('m1', 'Bounce', 'a@usmc.mil'), ses_record('m2', 'Delivery', 'b@gmail.com')]}
+
+    response = ses_feedback.lambda_handler(event, None)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'm1'}]}
+    # counted when it is delivered again
+    assert [call.kwargs['Key']['domain'] for call in tables['stats'].update_item.call_args_list] == ['gmail.com']
+
+
+def test_sns_envelope_is_unwrapped():
+    record = ses_record('m1', 'Complaint', 'b@gmail.com')
+    record['body'] = json.dumps({'Type': 'Notification', 'Message': record['body']})
+
+    subscribers, message_ids, domains = ses_feedback.tally([record])
+
+    assert subscribers == {'b@gmail.com': {'complaints': 1}}
+    assert message_ids == {'b@gmail.com': ['m1']}
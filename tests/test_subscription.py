@@ -0,0 +1,248 @@
+import json
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+CONDITIONAL_CHECK_FAILED = ClientError(
+    {'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}},
+    'UpdateItem'
+)
+THROTTLED = ClientError({'Error': {'Code': 'Throttling', 'Message': 'Maximum sending rate exceeded.'}},
+                        'SendTemplatedEmail')
+
+
+@pytest.fixture()
+def subscriber_table(mocker, monkeypatch):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers'})
+    monkeypatch.delenv('ROUTING_TABLE_NAME', raising=False)
+    resource = mocker.patch('boto3.resource')
+    return resource.return_value.Table.return_value
+
+
+def event(**params):
+    return {'queryStringParameters': params}
+
+
+def test_verify_is_a_single_conditional_update(subscriber_table):
+    subscriber_table.update_item.return_value = {'Attributes': {'email': 'a@gmail.com', 'verified': 'False'}}
+
+    from verify import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com', email_token='abcdefghijklmnop'), None)
+
+    assert 'Email Verified' in response['body']
+    subscriber_table.query.assert_not_called()
+    assert subscriber_table.update_item.call_args.kwargs['ConditionExpression'] == \
+        'email_token = :email_token OR verified = :verified'
+
+
+def test_verify_conditional_failure_is_invalid(subscriber_table):
+    subscriber_table.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    from verify import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com', email_token='abcdefghijklmnop'), None)
+
+    assert 'Invalid' in response['body']
+
+
+def test_unsubscribe_conditional_failure_is_invalid(subscriber_table):
+    subscriber_table.delete_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    from unsubscribe import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com', email_token='abcdefghijklmnop'), None)
+
+    assert 'Invalid' in response['body']
+    subscriber_table.query.assert_not_called()
+
+
+def test_duplicate_registration_sends_no_email(subscriber_table, mocker):
+    subscriber_table.put_item.side_effect = CONDITIONAL_CHECK_FAILED
+    client = mocker.patch('boto3.client').return_value
+
+    from registered import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com'), None)
+
+    assert 'Verification Pending' in response['body']
+    subscriber_table.query.assert_not_called()
+    client.send_message.assert_not_called()
+    client.send_templated_email.assert_not_called()
+
+
+def test_registration_queues_the_verification_email(subscriber_table, token_keys, mocker):
+    mocker.patch.dict(os.environ, {'TRANSACTIONAL_EMAIL_QUEUE': 'https://sqs/transactional'})
+    client = mocker.patch('boto3.client').return_value
+    client.send_message.return_value = {'MessageId': '1'}
+
+    from registered import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com'), None)
+
+    assert 'Verification Pending' in response['body']
+    client.send_templated_email.assert_not_called()
+    message = json.loads(client.send_message.call_args.kwargs['MessageBody'])
+    assert client.send_message.call_args.kwargs['QueueUrl'] == 'https://sqs/transactional'
+    assert message['email'] == 'a@gmail.com' and 'verify' in message['html_msg']
+
+
+def test_transactional_email_reports_only_failed_messages(mocker):
+    ses = mocker.patch('boto3.client').return_value
+    ses.send_templated_email.side_effect = [{'MessageId': 'sent'}, THROTTLED]
+    records = [{'messageId': str(n), 'attributes': {'ApproximateReceiveCount': '1'},
+                'body': json.dumps({'email': f'{n}@gmail.com', 'title': 'Title', 'html_msg': '<p>Hi</p>',
+                                    'text_msg': 'Hi'})} for n in range(2)]
+
+    from transactional_email import lambda_handler
+    assert lambda_handler({'Records': records}, None) == {'batchItemFailures': [{'itemIdentifier': '1'}]}
+    assert ses.send_templated_email.call_args.kwargs['Template'] == 'NewSubscriberTemplate'
+
+
+@pytest.fixture()
+def token_keys(mocker, monkeypatch):
+    import maradmin_globals
+    mocker.patch.dict(os.environ, {'TOKEN_KEYS': '{"current": "k2", "keys": {"k1": "old secret", "k2": "new secret"}}'})
+    monkeypatch.delenv('AWS_EXECUTION_ENV', raising=False)
+    mocker.patch.object(maradmin_globals, '_token_keys', None)
+
+
+def test_signed_tokens(token_keys):
+    from maradmin_globals import sign_token, valid_signed_token, sanitized_token, VERIFY_PURPOSE, UNSUBSCRIBE_PURPOSE
+
+    token = sign_token('a@gmail.com', VERIFY_PURPOSE)
+    rotated = sign_token('a@gmail.com', VERIFY_PURPOSE, key_id='k1')
+
+    assert token.startswith('v1.k2.') and sanitized_token(token) == token
+    assert sanitized_token('abcdefghijklmnop') == 'abcdefghijklmnop'
+    assert valid_signed_token('a@gmail.com', VERIFY_PURPOSE, token)
+    assert valid_signed_token('a@gmail.com', VERIFY_PURPOSE, rotated)
+    assert not valid_signed_token('b@gmail.com', VERIFY_PURPOSE, token)
+    assert not valid_signed_token('a@gmail.com', UNSUBSCRIBE_PURPOSE, token)
+    assert not valid_signed_token('a@gmail.com', VERIFY_PURPOSE, token.replace('v1.k2.', 'v1.k3.'))
+
+
+@pytest.mark.parametrize('value', [
+    '{"current": "k-2", "keys": {"k1": "old secret", "k-2": "new secret"}}',
+    '{"current": "k2", "keys": {"k1": "old secret", "averyveryverylongkeyid": "new secret"}}',
+    '{"current": "k3", "keys": {"k1": "old secret", "k2": "new secret"}}',
+])
+def test_token_keys_sanitized_token_would_reject_are_refused(token_keys, mocker, value):
+    from maradmin_globals import get_token_keys
+    mocker.patch.dict(os.environ, {'TOKEN_KEYS': value})
+
+    with pytest.raises(ValueError):
+        get_token_keys()
+
+
+def test_verify_rejects_bad_signature_without_db(subscriber_table, token_keys):
+    from maradmin_globals import sign_token, UNSUBSCRIBE_PURPOSE
+    from verify import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com', email_token=sign_token('a@gmail.com', UNSUBSCRIBE_PURPOSE)),
+                              None)
+
+    assert 'Invalid' in response['body']
+    subscriber_table.update_item.assert_not_called()
+
+
+def test_unsubscribe_signed_token_deletes_unconditionally(subscriber_table, token_keys):
+    from maradmin_globals import sign_token, UNSUBSCRIBE_PURPOSE
+    subscriber_table.delete_item.return_value = {}
+
+    from unsubscribe import lambda_handler
+    response = lambda_handler(event(email='a@gmail.com', email_token=sign_token('a@gmail.com', UNSUBSCRIBE_PURPOSE)),
+                              None)
+
+    assert 'Invalid' not in response['body']
+    assert 'ConditionExpression' not in subscriber_table.delete_item.call_args.kwargs
+
+
+def test_verify_adds_subscriber_to_a_shard(subscriber_table):
+    from maradmin_globals import verified_shard, VERIFIED_SHARDS
+    subscriber_table.update_item.return_value = {'Attributes': {'email': 'a@gmail.com', 'verified': 'False'}}
+
+    from verify import lambda_handler
+    lambda_handler(event(email='a@gmail.com', email_token='abcdefghijklmnop'), None)
+
+    values = subscriber_table.update_item.call_args.kwargs['ExpressionAttributeValues']
+    assert values[':shard'] == verified_shard('a@gmail.com')
+    assert 0 <= int(values[':shard']) < VERIFIED_SHARDS
+
+
+def test_sns_to_sqs_reads_every_shard(mocker, monkeypatch):
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'SQS_QUEUE': 'queue'})
+    monkeypatch.delenv('ROUTING_TABLE_NAME', raising=False)
+    client = mocker.patch('boto3.client').return_value
+    client.get_item.return_value = {'Item': {'email': {'S': '#VERIFIED_SHARDS'}, 'shards': {'N': '8'}}}
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: [
+        {'Items': [{'email': {'S': f'{kwargs["ExpressionAttributeValues"][":value"]["S"]}@usmc.mil'}}]}
+    ]
+    event = {'Records': [{'Sns': {'Subject': 'MARADMIN 1/25', 'Message': '<p>All Marines</p>'}}]}
+
+    from maradmin_globals import VERIFIED_SHARDS
+    from sns_to_sqs import lambda_handler
+    assert lambda_handler(event, None) == {'statusCode': 200}
+
+    sent = [call.kwargs['MessageAttributes']['email']['StringValue'] for call in client.send_message.call_args_list]
+    assert sent == [f'{shard:02d}@usmc.mil' for shard in range(VERIFIED_SHARDS)]
+    assert {call.kwargs['IndexName'] for call in client.get_paginator.return_value.paginate.call_args_list} == \
+        {'VerifiedShardIndex'}
+
+
+def test_verified_index_is_read_until_the_shard_migration_completes(mocker):
+    client = mocker.patch('boto3.client').return_value
+    # a marker left by a migration to a different shard count does not count
+    client.get_item.return_value = {'Item': {'email': {'S': '#VERIFIED_SHARDS'}, 'shards': {'N': '4'}}}
+    client.get_paginator.return_value.paginate.side_effect = lambda **kwargs: [
+        {'Items': [{'email': {'S': 'new@usmc.mil'}}]} if kwargs['ExpressionAttributeValues'][':value']['S'] == '00'
+        else {'Items': [{'email': {'S': 'legacy@usmc.mil'}}, {'email': {'S': 'new@usmc.mil'}}]}
+        if kwargs['IndexName'] == 'VerifiedIndex' else {'Items': []}
+    ]
+
+    from maradmin_globals import query_verified_emails
+    assert query_verified_emails('subscribers') == ['new@usmc.mil', 'legacy@usmc.mil']
+
+
+def test_register_page_revalidates_with_etag():
+    from register import lambda_handler
+    response = lambda_handler({'headers': None}, None)
+    etag = response['headers']['ETag']
+
+    assert response['statusCode'] == '200'
+    assert response['headers']['Cache-Control'].startswith('public')
+    assert lambda_handler({'headers': {'if-none-match': f'W/{etag}'}}, None) == \
+        {'statusCode': '304', 'body': '', 'headers': response['headers']}
+    assert lambda_handler({'headers': {'If-None-Match': '"stale"'}}, None)['statusCode'] == '200'
+
+
+def test_verify_serves_the_prerendered_invalid_page(subscriber_table):
+    subscriber_table.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    from verify import lambda_handler
+    first = lambda_handler(event(email='a@gmail.com', email_token='abcdefghijklmnop'), None)
+    repeat = lambda_handler(dict(event(email='a@gmail.com', email_token='abcdefghijklmnop'),
+                                 headers={'If-None-Match': first['headers']['ETag']}), None)
+
+    assert first['headers']['Cache-Control'] == 'no-cache'
+    assert repeat['statusCode'] == '304'
+    assert subscriber_table.update_item.call_count == 2
+
+
+def test_router_dispatches_on_path(subscriber_table):
+    subscriber_table.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    from router import lambda_handler
+    register = lambda_handler({'resource': '/register', 'path': '/register/', 'headers': None}, None)
+    verify = lambda_handler(dict(event(email='a@gmail.com', email_token='abcdefghijklmnop'), path='/verify/'), None)
+
+    assert 'Topics (optional)' in register['body']
+    assert 'Invalid' in verify['body']
+    assert lambda_handler({'path': '/admin'}, None)['statusCode'] == '404'
+
+
+def test_web_handlers_share_one_table_handle(subscriber_table):
+    subscriber_table.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+    subscriber_table.delete_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+    from router import lambda_handler
+    for path in ('/verify', '/unsubscribe', '/verify'):
+        lambda_handler(dict(event(email='a@gmail.com', email_token='abcdefghijklmnop'), resource=path), None)
+
+    import boto3
+    assert boto3.resource.call_count == 1
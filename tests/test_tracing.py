@@ -0,0 +1,80 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import tracing
+
+PUBLISHED_MS = 1735732800000  # Wed, 01 Jan 2025 12:00:00 GMT
+
+
+def test_stage_latencies_split_the_time_to_inbox():
+    context = {'maradmin_id': 'MARADMIN 1/25', 'published_ms': PUBLISHED_MS, 'detected_ms': PUBLISHED_MS + 600000,
+               'broadcast_ms': PUBLISHED_MS + 660000, 'queued_ms': PUBLISHED_MS + 662000}
+
+    latencies = tracing.stage_latencies(context, PUBLISHED_MS + 700000)
+
+    assert latencies == {'Detection': 600000, 'Publish': 60000, 'FanOut': 2000, 'Delivery': 38000,
+                         'TimeToInbox': 700000}
+    assert tracing.slowest_stage(latencies) == 'Detection'
+    assert tracing.pub_date_ms('Wed, 01 Jan 2025 12:00:00 GMT') == PUBLISHED_MS
+    assert tracing.pub_date_ms('not a date') is None
+
+
+def test_trace_follows_the_broadcast_to_the_inbox(mocker, monkeypatch, emitted_metrics):
+    monkeypatch.setenv('SNS_TOPIC', 'topic')
+    sns = mocker.patch('boto3.client').return_value
+    sns.publish.return_value = {'MessageId': 'broadcast'}
+    # detected 10 minutes after publication, in the inbox 100 seconds after that
+    mocker.patch('tracing.now_ms', side_effect=[PUBLISHED_MS + 600000, PUBLISHED_MS + 700000])
+    import scraper
+    item = {'desc': 'MARADMIN 1/25', 'pub_date': 'Wed, 01 Jan 2025 12:00:00 GMT', 'link': 'https://x', 'title': 'T'}
+    scraper.publish_sns(item, '<p>BLUF</p>', '<p>body</p>', tracing.start(item['desc'], item['pub_date']))
+    published = sns.publish.call_args.kwargs['MessageAttributes']['trace']
+
+    # SNS delivers the attribute with Type/Value, sns_to_sqs adds the time SNS accepted the message
+    mocker.patch.dict(os.environ, {'SUBSCRIBER_TABLE_NAME': 'subscribers', 'SQS_QUEUE': 'queue'})
+    monkeypatch.delenv('ROUTING_TABLE_NAME', raising=False)
+    sns.get_paginator.return_value.paginate.return_value = [{'Items': [{'email': {'S': 'a@usmc.mil'}}]}]
+    from sns_to_sqs import lambda_handler as sns_to_sqs
+    sns_to_sqs({'Records': [{'Sns': {
+        'MessageId': 'broadcast', 'Subject': 'MARADMIN 1/25', 'Message': '<p>body</p>',
+        'Timestamp': '2025-01-01T12:11:00.000Z',
+        'MessageAttributes': {'trace': {'Type': 'String', 'Value': published['StringValue']}},
+    }}]}, None)
+    queued = sns.send_message.call_args.kwargs['MessageAttributes']
+    assert json.loads(queued['trace']['StringValue'])['broadcast_ms'] == PUBLISHED_MS + 660000
+
+    monkeypatch.setenv('TOKEN_KEYS', '{"current": "k1", "keys": {"k1": "secret"}}')
+    monkeypatch.delenv('AWS_EXECUTION_ENV', raising=False)
+    mocker.patch('maradmin_globals._token_keys', None)
+    sns.send_templated_email.return_value = {'MessageId': 'sent'}
+    from sqs_to_ses import lambda_handler as sqs_to_ses
+    sqs_to_ses({'Records': [{
+        'body': '<p>body</p>',
+        'attributes': {'SentTimestamp': str(PUBLISHED_MS + 662000)},
+        'messageAttributes': {name: {'stringValue': attribute['StringValue'], 'dataType': 'String'}
+                              for name, attribute in queued.items()},
+    }]}, None)
+
+    record = emitted_metrics.records[-1]
+    assert record['maradmin_id'] == 'MARADMIN 1/25' and record['correlation_id'] == 'broadcast'
+    assert [record[stage] for stage in tracing.STAGES] == [600000, 60000, 2000, 38000]
+    assert record['TimeToInbox'] == 700000
+    assert {metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']} == \
+        {'SesSendLatency', 'TimeToInbox', *tracing.STAGES}
+
+
+def test_report_reads_each_broadcast(mocker):
+    logs = mocker.Mock()
+    logs.start_query.return_value = {'queryId': 'q'}
+    row = {'maradmin_id': 'MARADMIN 1/25', 'subject': 'S', 'recipients': '3', 'p50': '60000', 'p95': '70000',
+           'p99': '71000', 'Detection': '600000', 'Publish': '', 'FanOut': '2000', 'Delivery': '40000'}
+    logs.get_query_results.return_value = {'status': 'Complete', 'results': [
+        [{'field': field, 'value': value} for field, value in row.items()]
+    ]}
+
+    from latency_report import broadcast_latencies
+    end = datetime(2025, 1, 8, tzinfo=timezone.utc)
+    broadcast, = broadcast_latencies(logs, '/aws/lambda/ses', datetime(2025, 1, 1, tzinfo=timezone.utc), end)
+
+    assert (broadcast['p99'], broadcast['Publish'], broadcast['FanOut']) == (71000.0, None, 2000.0)
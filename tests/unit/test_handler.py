@@ -1,73 +1,66 @@
+import gzip
 import json
 
 import pytest
 
 from maradmin import dlq_to_s3
 
+SENT_MS = '1735732800000'  # 2025-01-01
 
-@pytest.fixture()
-def apigw_event():
-    """ Generates API GW Event"""
 
+def dead_letter(message_id, email, subject='MARADMIN 001/25 UPDATE'):
+    attributes = {'email': {'stringValue': email, 'dataType': 'String'}}
+    if subject:
+        attributes['subject'] = {'stringValue': subject, 'dataType': 'String'}
     return {
-        "body": '{ "test": "body"}',
-        "resource": "/{proxy+}",
-        "requestContext": {
-            "resourceId": "123456",
-            "apiId": "1234567890",
-            "resourcePath": "/{proxy+}",
-            "httpMethod": "POST",
-            "requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef",
-            "accountId": "123456789012",
-            "identity": {
-                "apiKey": "",
-                "userArn": "",
-                "cognitoAuthenticationType": "",
-                "caller": "",
-                "userAgent": "Custom User Agent String",
-                "user": "",
-                "cognitoIdentityPoolId": "",
-                "cognitoIdentityId": "",
-                "cognitoAuthenticationProvider": "",
-                "sourceIp": "127.0.0.1",
-                "accountId": "",
-            },
-            "stage": "prod",
-        },
-        "queryStringParameters": {"foo": "bar"},
-        "headers": {
-            "Via": "1.1 08f323deadbeefa7af34d5feb414ce27.cloudfront.net (CloudFront)",
-            "Accept-Language": "en-US,en;q=0.8",
-            "CloudFront-Is-Desktop-Viewer": "true",
-            "CloudFront-Is-SmartTV-Viewer": "false",
-            "CloudFront-Is-Mobile-Viewer": "false",
-            "X-Forwarded-For": "127.0.0.1, 127.0.0.2",
-            "CloudFront-Viewer-Country": "US",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Upgrade-Insecure-Requests": "1",
-            "X-Forwarded-Port": "443",
-            "Host": "1234567890.execute-api.us-east-1.amazonaws.com",
-            "X-Forwarded-Proto": "https",
-            "X-Amz-Cf-Id": "aaaaaaaaaae3VYQb9jd-nvCd-de396Uhbp027Y2JvkCPNLmGJHqlaA==",
-            "CloudFront-Is-Tablet-Viewer": "false",
-            "Cache-Control": "max-age=0",
-            "User-Agent": "Custom User Agent String",
-            "CloudFront-Forwarded-Proto": "https",
-            "Accept-Encoding": "gzip, deflate, sdch",
-        },
-        "pathParameters": {"proxy": "/examplepath"},
-        "httpMethod": "POST",
-        "stageVariables": {"baz": "qux"},
-        "path": "/examplepath",
+        'messageId': message_id,
+        'body': '<p>MARADMIN</p>',
+        'attributes': {'SentTimestamp': SENT_MS, 'ApproximateReceiveCount': '1'},
+        'messageAttributes': attributes,
     }
 
 
-def test_lambda_handler(apigw_event, mocker):
+@pytest.fixture()
+def sqs_event():
+    """ Generates a dead letter queue batch"""
+
+    return {'Records': [
+        dead_letter('m1', 'a@usmc.mil'),
+        dead_letter('m2', 'b@usmc.mil'),
+        dead_letter('m3', 'c@gmail.com', subject=None),
+    ]}
+
+
+def test_lambda_handler(sqs_event, mocker):
+    mocker.patch.dict('os.environ', {'DlqBucket': 'dlq-bucket'})
+    s3 = mocker.patch('boto3.client').return_value
+
+    ret = dlq_to_s3.lambda_handler(sqs_event, None)
+
+    assert ret == {'batchItemFailures': []}
+    puts = {call.kwargs['Key']: call.kwargs for call in s3.put_object.call_args_list}
+    assert len(puts) == 4
+    objects = sorted(key for key in puts if key.endswith('.jsonl.gz'))
+    assert [key.rsplit('/', 1)[0] for key in objects] == [
+        'dlq/date=2025-01-01/subject=MARADMIN-001-25-UPDATE',
+        'dlq/date=2025-01-01/subject=none',
+    ]
+    lines = gzip.decompress(puts[objects[0]]['Body']).decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == sqs_event['Records'][:2]
+    manifest = json.loads(puts[objects[0].replace('.jsonl.gz', '.manifest.json')]['Body'])
+    assert manifest == {'object': objects[0], 'date': '2025-01-01', 'subject': 'MARADMIN 001/25 UPDATE',
+                        'count': 2, 'message_ids': ['m1', 'm2']}
+
+
+def test_failed_partition_is_redelivered(sqs_event, mocker):
+    mocker.patch.dict('os.environ', {'DlqBucket': 'dlq-bucket'})
+    s3 = mocker.patch('boto3.client').return_value
+
+    def put_object(**kwargs):
+        if 'subject=none' in kwargs['Key']:
+            raise RuntimeError('S3 down')
+    s3.put_object.side_effect = put_object
 
-    ret = dlq_to_s3.lambda_handler(apigw_event, "")
-    data = json.loads(ret["body"])
+    ret = dlq_to_s3.lambda_handler(sqs_event, None)
 
-    assert ret["statusCode"] == 200
-    assert "message" in ret["body"]
-    assert data["message"] == "hello world"
-    # assert "location" in data.dict_keys()
+    assert ret == {'batchItemFailures': [{'itemIdentifier': 'm3'}]}